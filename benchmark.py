@@ -0,0 +1,351 @@
+"""
+benchmark.py
+    Description:
+        Benchmarks the training, loading, scoring and decoding hot paths of bigram.py, tagging.py
+        and viterbi.py on synthetic corpora and reports the results as JSON, so that regressions
+        can be caught and backends compared.
+
+        The synthetic corpora are word_TAG sentences: the tags of each sentence follow a random
+        Markov chain over the tagset (with Dirichlet distributed rows, so each tag has a few
+        likely successors) and each tag draws its words from a Zipfian distribution over its own
+        window of the vocabulary. Neighbouring tags' windows overlap, so words are ambiguous.
+        Sentence lengths are Poisson distributed around the given mean. The tag chain is drawn once
+        from the seed, and the training and test corpora are sampled from that same chain with
+        their own sampling seeds, so the test corpus only differs by its unknown words in the long
+        tail (and the rare transitions the training corpus missed).
+
+        Each benchmark runs in a fresh process (so that the peak RSS it reports is its own): its
+        preparation (e.g. counting the corpus before timing the smoothing) is done once, then the
+        timed part is run --repeat times and the fastest run gives the throughput.
+
+    Instructions:
+        Run all the benchmarks with:
+            python benchmark.py [--output <results.json>]
+
+        To list the benchmarks, or only run those matching some patterns (e.g. "bigram-*"), run:
+            python benchmark.py --list
+            python benchmark.py --cases <pattern> [<pattern> ...]
+
+        The synthetic corpora are set with (defaults in brackets):
+            --sentences <number-of-training-sentences>  [20000]
+            --test-sentences <number-of-test-sentences> [2000]
+            --vocab <vocabulary-size>                   [20000]
+            --tags <tagset-size>                        [45]
+            --length <mean-sentence-length>             [20]
+            --exponent <zipf-exponent>                  [1.1]
+            --seed <random-seed>                        [0]
+
+        The corpora and saved models are written to a temporary directory, or kept in the
+        directory given with:
+            --workdir <dir>
+
+        The JSON output holds the configuration, the environment, the size of the corpora and one
+        result per benchmark:
+            name, unit, amount      - what was timed and how much of it (e.g. 40000 tokens)
+            seconds, median_seconds - fastest and median time of the timed part
+            throughput              - amount per second of the fastest run
+            peak_rss_kb             - peak resident set size of the benchmark's process
+
+    Imports:
+        sys             - Used for writing progress messages
+        os              - Used for the paths of the corpora and models and for reading the peak RSS
+        json            - Used for the results
+        time            - Used for timing the benchmarks
+        fnmatch         - Used for selecting benchmarks by pattern
+        argparse        - Used to get the arguments from command line
+        platform        - Used for describing the environment
+        tempfile        - Used for the default working directory
+        multiprocessing - Used for running each benchmark in a fresh process
+        concurrent      - Used for collecting the result of each benchmark process
+        resource        - (optional, Unix only) Used for the peak RSS of each benchmark
+        numpy           - Used for generating the synthetic corpora
+        bigram          - Used for the bigram, n-gram and sketched models
+        counts          - Used for counting the corpora
+        sketch          - Used for counting the corpora approximately
+        corpus          - Used for reading the corpora
+        tagging         - Used for building the tagging HMMs
+        hmm             - Used for loading and decoding HMM model bundles
+"""
+import sys
+import os
+import json
+import time
+import fnmatch
+import argparse
+import platform
+import tempfile
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+# The peak RSS is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bigram import BigramModel, NgramModel, SketchModel, load_model
+from counts import count_corpus
+from sketch import count_sketch
+from corpus import read_sentences, words_of
+from tagging import count_tags, build_hmm, build_trigram_hmm
+from hmm import HMM
+
+# Concentration of the Dirichlet distributions of the tag transitions (smaller = fewer likely successors)
+TRANSITION_CONCENTRATION = 0.1
+
+# Beam width of the beam search benchmark
+BEAM = 5
+
+# Memory budget of the sketched counts in bytes
+SKETCH_MEMORY = 16 << 20
+
+
+def zipf_corpus(path, sentences, vocab=20000, tags=45, length=20, exponent=1.1, seed=0, sample=0):
+    """Write sentences synthetic word_TAG sentences to path and return their number of tokens.
+
+    Tags follow a random Markov chain and each tag draws words from a Zipfian distribution over
+    its window of the vocabulary (2 * vocab / tags words, overlapping the next tag's window). The
+    chain is drawn from seed and the sentences from (seed, sample), so corpora with the same seed
+    and different samples come from the same model.
+    """
+
+    # Draw the initial and transition distributions of the tag chain
+    model = np.random.default_rng(seed)
+    initial = np.cumsum(model.dirichlet(np.full(tags, TRANSITION_CONCENTRATION)))
+    cumulative = np.cumsum(model.dirichlet(np.full(tags, TRANSITION_CONCENTRATION), size=tags), axis=1)
+    cumulative[:, -1] = 1.0
+
+    rng = np.random.default_rng([seed, sample])
+    lengths = rng.poisson(max(length - 1, 0), sentences) + 1
+    maxLength = int(lengths.max())
+
+    # Sample the tags of all sentences one position at a time: the rows of the cumulative
+    # transition probabilities are laid out as [i, i + 1) so one search samples every successor
+    rows = (cumulative + np.arange(tags)[:, None]).ravel()
+    tagIds = np.empty((sentences, maxLength), dtype=np.int64)
+    tagIds[:, 0] = np.minimum(np.searchsorted(initial, rng.random(sentences), side="right"), tags - 1)
+    for t in range(1, maxLength):
+        prev = tagIds[:, t - 1]
+        tagIds[:, t] = np.minimum(np.searchsorted(rows, prev + rng.random(sentences), side="right") - prev * tags, tags - 1)
+
+    # Sample the rank of each word in its tag's window from a Zipfian distribution
+    stride = max(vocab // tags, 1)
+    window = min(vocab, 2 * stride)
+    ranks = np.cumsum(1.0 / np.arange(1, window + 1) ** exponent)
+    ranks /= ranks[-1]
+    wordIds = (tagIds * stride + np.minimum(np.searchsorted(ranks, rng.random(tagIds.shape), side="right"), window - 1)) % vocab
+
+    # Write the sentences
+    wordNames = ["w" + np.base_repr(i, 36).lower() for i in range(vocab)]
+    tagNames = ["T" + str(i) for i in range(tags)]
+    with open(path, "w") as f:
+        for n, words, tagRow in zip(lengths.tolist(), wordIds.tolist(), tagIds.tolist()):
+            f.write(" ".join(wordNames[w] + "_" + tagNames[t] for w, t in zip(words[:n], tagRow[:n])) + "\n")
+    return int(lengths.sum())
+
+
+def test_words(data, lower=False):
+    """Return the word portions of the sentences of the test corpus."""
+    return [words_of(tokens) for tokens in read_sentences(data["test"], lower)]
+
+
+def tagging_hmm(data, trigram=False):
+    """Build the tagging HMM (or the second-order HMM) of the training corpus."""
+    unigramTagCount, bigramCount, trigramCount = count_tags(data["train"], trigram)
+    if trigram:
+        return build_trigram_hmm(unigramTagCount, bigramCount, trigramCount)
+    return build_hmm(unigramTagCount, bigramCount)
+
+
+###############################################################################
+# Benchmarks: each prepares its inputs and returns (timed function, amount of work, unit)
+
+def bench_bigram_count(data):
+    return lambda: count_corpus(data["train"]), data["train_tokens"], "tokens"
+
+
+def bench_sketch_count(data):
+    return lambda: count_sketch(data["train"], SKETCH_MEMORY), data["train_tokens"], "tokens"
+
+
+def bench_bigram_smoothing(smoothing_type):
+    def bench(data):
+        counts = count_corpus(data["train"])
+        return lambda: BigramModel(counts, smoothing_type, k=0.5), len(counts.counts), "bigrams"
+    return bench
+
+
+def bench_ngram_train(data):
+    return lambda: NgramModel.train("kneser-ney", data["train"], order=3), data["train_tokens"], "tokens"
+
+
+def bench_load(name):
+    def bench(data):
+        return lambda: load_model(data[name]), 1, "loads"
+    return bench
+
+
+def bench_score(name):
+    def bench(data):
+        model = load_model(data[name])
+        sentences = test_words(data, lower=True)
+        return lambda: list(model.score_many(sentences)), len(sentences), "sentences"
+    return bench
+
+
+def bench_tagging_build(data):
+    return lambda: tagging_hmm(data), data["train_tokens"], "tokens"
+
+
+def bench_tagging_decode(decoder):
+    def bench(data):
+        hmm = tagging_hmm(data, trigram=decoder == "trigram")
+        hmm.sparse = {"dense": False, "sparse": True}.get(decoder)
+        hmm.use_tag_dictionary = decoder == "dictionary"
+        if decoder == "beam":
+            hmm.beam = BEAM
+        sentences = test_words(data)
+        return lambda: list(hmm.decode_many(hmm.encode(words) for words in sentences)), data["test_tokens"], "tokens"
+    return bench
+
+
+def bench_viterbi_load(data):
+    return lambda: HMM.load(data["hmm"]), 1, "loads"
+
+
+def bench_viterbi_decode(data):
+    hmm = HMM.load(data["hmm"])
+    sentences = test_words(data)
+    return lambda: list(hmm.decode_many(hmm.encode(words) for words in sentences)), data["test_tokens"], "tokens"
+
+
+BENCHMARKS = {
+    "bigram-count": bench_bigram_count,
+    "sketch-count": bench_sketch_count,
+    "bigram-train-none": bench_bigram_smoothing("none"),
+    "bigram-train-add-one": bench_bigram_smoothing("add-one"),
+    "bigram-train-add-k": bench_bigram_smoothing("add-k"),
+    "bigram-train-good-turing": bench_bigram_smoothing("good-turing"),
+    "bigram-train-simple-good-turing": bench_bigram_smoothing("simple-good-turing"),
+    "ngram-train-kneser-ney": bench_ngram_train,
+    "bigram-load": bench_load("bigram"),
+    "ngram-load": bench_load("ngram"),
+    "bigram-score": bench_score("bigram"),
+    "ngram-score": bench_score("ngram"),
+    "sketch-score": bench_score("sketch"),
+    "tagging-build": bench_tagging_build,
+    "tagging-decode-dense": bench_tagging_decode("dense"),
+    "tagging-decode-sparse": bench_tagging_decode("sparse"),
+    "tagging-decode-dictionary": bench_tagging_decode("dictionary"),
+    "tagging-decode-beam": bench_tagging_decode("beam"),
+    "tagging-decode-trigram": bench_tagging_decode("trigram"),
+    "viterbi-load": bench_viterbi_load,
+    "viterbi-decode": bench_viterbi_decode,
+}
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of this process in KiB (None if it is not available)."""
+
+    # On Linux use the high water mark of the process's memory, which (unlike ru_maxrss) starts
+    # afresh when the benchmark process is executed instead of including its parent's
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_benchmark(name, data, repeat=3):
+    """Prepare and time the benchmark name and return its result as a dict."""
+    run, amount, unit = BENCHMARKS[name](data)
+    times = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"name": name, "unit": unit, "amount": amount, "seconds": best, "median_seconds": float(np.median(times)),
+            "throughput": amount / best if best > 0 else None, "peak_rss_kb": peak_rss_kb()}
+
+
+def prepare(workdir, args):
+    """Write the synthetic corpora and the saved models to workdir and return their paths and sizes."""
+    data = {"train": os.path.join(workdir, "TrainingSet.txt"), "test": os.path.join(workdir, "test.txt"),
+            "bigram": os.path.join(workdir, "bigram"), "ngram": os.path.join(workdir, "ngram"),
+            "sketch": os.path.join(workdir, "sketch"), "hmm": os.path.join(workdir, "hmm")}
+    data["train_tokens"] = zipf_corpus(data["train"], args.sentences, args.vocab, args.tags, args.length, args.exponent, args.seed, sample=0)
+    data["test_tokens"] = zipf_corpus(data["test"], args.test_sentences, args.vocab, args.tags, args.length, args.exponent, args.seed, sample=1)
+    BigramModel.train("add-one", data["train"]).save(data["bigram"])
+    NgramModel.train("kneser-ney", data["train"], order=3).save(data["ngram"])
+    SketchModel.train("add-one", data["train"], memory=SKETCH_MEMORY).save(data["sketch"])
+    tagging_hmm(data).save(data["hmm"])
+    return data
+
+
+if __name__ == "__main__":
+
+    # Get arguments:
+    #   output = location of the JSON results (optional, stdout by default)
+    #   cases = patterns of the benchmarks to run (optional, all by default)
+    #   list = list the benchmarks instead of running them (optional)
+    #   repeat = number of timed runs of each benchmark (optional)
+    #   sentences, test_sentences, vocab, tags, length, exponent, seed = synthetic corpus settings (optional)
+    #   workdir = directory for the corpora and saved models (optional, temporary by default)
+    parser = argparse.ArgumentParser(description="Benchmarks training, loading, scoring and decoding on synthetic corpora.")
+    parser.add_argument("--output", metavar="<results.json>", help="write the JSON results to a file instead of stdout")
+    parser.add_argument("--cases", metavar="<pattern>", nargs="+", default=["*"], help="only run the benchmarks matching these patterns")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--sentences", type=int, default=20000, help="number of training sentences")
+    parser.add_argument("--test-sentences", type=int, default=2000, help="number of test sentences")
+    parser.add_argument("--vocab", type=int, default=20000, help="vocabulary size")
+    parser.add_argument("--tags", type=int, default=45, help="tagset size")
+    parser.add_argument("--length", type=float, default=20, help="mean sentence length")
+    parser.add_argument("--exponent", type=float, default=1.1, help="exponent of the Zipfian word distributions")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the corpora")
+    parser.add_argument("--workdir", metavar="<dir>", help="directory for the corpora and saved models")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, pattern) for pattern in args.cases)]
+    if args.list:
+        print("\n".join(names))
+        sys.exit()
+    if not names:
+        sys.exit("ERROR: No benchmark matches " + " ".join(args.cases) + "\n\n\tList the benchmarks with: \n\tpython benchmark.py --list")
+
+    ###########################################################################
+    # Generate the corpora and save the models, then run each benchmark in a fresh process
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = args.workdir or tempdir
+        os.makedirs(workdir, exist_ok=True)
+        print("Generating corpora in " + workdir, file=sys.stderr, flush=True)
+        data = prepare(workdir, args)
+
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for name in names:
+            print("Running " + name, file=sys.stderr, flush=True)
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                results.append(pool.submit(run_benchmark, name, data, args.repeat).result())
+
+    ###########################################################################
+    # Output results
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "cases", "list", "workdir")},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "platform": platform.platform(), "cpus": os.cpu_count()},
+        "corpus": {"train_tokens": data["train_tokens"], "test_tokens": data["test_tokens"]},
+        "results": results,
+    }
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -12,230 +12,834 @@ bigram.py
         
         For computing the bigram based probability of a test sentence, run:
             python bigram.py <smoothing-type> <input-test-file>
+        
+        For scoring every line of a test file (or stdin if <input-test-file> is -), run:
+            python bigram.py <smoothing-type> <input-test-file> --batch
+        
+        For training a model once and saving it to a model directory, run:
+            python bigram.py train <smoothing-type> <model-dir>
+        
+        For scoring with a saved model (its arrays are memory-mapped, so it loads without
+        retraining), run:
+            python bigram.py score <model-dir> <input-test-file> [--batch]
+        
+        For serving a saved model over HTTP (it stays loaded, and concurrent requests are scored
+        together in micro-batches), run:
+            python bigram.py serve <model-dir> [--port <port> | --socket <path>]
+        and POST sentences (one per line, or {"sentences": [...]} as JSON) to /score. The results
+        are the log probability, cross-entropy and perplexity of each sentence, and GET /stats
+        returns the request counters and p50/p99 latencies.
+        
+        For folding new sentences into a saved model without recounting the training corpus, run:
+            python bigram.py update <model-dir> <new-sentences-file> [--output <model-dir>]
+        Merging the new counts copies the count tables (O(seen n-grams), a few array passes). A
+        bigram model then only recomputes the per-history arrays the new sentences touch (all V of
+        them if they add a word), while an n-gram model is rebuilt from the merged counts like a
+        freshly trained one, since its discounts depend on the whole trie.
+        The updated model replaces the saved one unless --output is given. The model directory is
+        replaced as a whole, so a server that loaded the model keeps serving the old one (its
+        mapped files are left untouched) until it is restarted.
+        
+        For corpora whose exact bigram counts do not fit in memory, the add-one and add-k models
+        can count the bigrams approximately in a Count-Min Sketch of a fixed size (e.g. 64M):
+            python bigram.py train <smoothing-type> <model-dir> --sketch <memory> [--depth <rows>]
+        Each bigram count is then overestimated by at most e / width * N (for N bigrams in the
+        corpus) with probability 1 - e^-depth. To report these error bounds, the observed errors
+        and the perplexity of the sketched model next to the exact one on a test file, run:
+            python bigram.py compare-sketch <input-test-file> --memory <memory> [--depth <rows>]
+        Overestimated counts also overestimate probabilities (they are not renormalized), so a
+        sketch that is too small can show a lower perplexity than the exact model.
+        
+        For writing a smaller copy of a saved kneser-ney or jelinek-mercer model, without the
+        n-grams below a count cutoff of their order and/or the n-grams whose removal increases the
+        perplexity by a relative amount below a threshold (Stolcke's relative entropy pruning), run:
+            python bigram.py prune <model-dir> <output-dir> [--cutoffs <min-count> ...] [--threshold <t>]
+        The cutoffs are the smallest kept counts of the bigrams, trigrams, ... (the last one also
+        applies to the higher orders); unigrams are never pruned, nor n-grams that a kept longer
+        n-gram depends on. The kept n-grams keep their probabilities and the backoff weights are
+        recomputed so that every history's distribution sums to 1. A pruned model can be scored
+        and served but not updated (its counts are incomplete). To report the size, load time
+        and perplexity of the model pruned with each of several thresholds, run:
+            python bigram.py compare-prune <model-dir> <input-test-file> [--cutoffs <min-count> ...] [--thresholds <t> ...]
+        
+        For an n-gram model of a higher order (stored as a sorted-array trie of n-gram counts, so
+        lookups are binary searches over contiguous arrays), add to any of the above:
+            --order <n>
+        Orders above 2 support the none, add-one, add-one-fast and add-k smoothing types, which
+        then condition each token on the previous n - 1 words, and the kneser-ney and
+        jelinek-mercer smoothing types (which always use the n-gram model, order 2 by default).
+        
+        The model can also be used from Python:
+            model = BigramModel.train("add-one")
+            for logProb, n in model.score_many(sentences): ...
+        
+        To count the training corpus with several processes, add:
+            --jobs <number-of-processes>
             
         <smoothing-type> must be one of the following values:
             (1) none
             (2) add-one
             (3) good-turing
             (4) add-one-fast
+            (5) add-k
+            (6) simple-good-turing
+            (7) kneser-ney
+            (8) jelinek-mercer
             
-            Note:   add-one-fast performs add-one smoothing without computing ALL possible bigrams at
-                    once. Instead, the bigram probability is calculated dynamically while testing.
-                    (I recommend using this as add-one runs too slowly otherwise)
+            Note:   add-one and add-k never compute ALL possible bigrams at once. Only the observed
+                    bigrams are stored and the probability of an unseen bigram is calculated
+                    dynamically. When displaying the model, add-one and add-k stream the full table of
+                    all possible bigrams while add-one-fast only displays the observed bigrams.
+            
+                    simple-good-turing smooths the frequencies of frequencies N_c with a log-linear
+                    fit so that bigrams whose count c has no N_c+1 do not get a probability of 0.
+            
+                    kneser-ney is interpolated modified Kneser-Ney (three discounts per order) and
+                    jelinek-mercer interpolates every order with the next lower one using a fixed
+                    weight. Both precompute the probability of every seen n-gram and the backoff
+                    weight of every history, so a token is scored with O(order) array lookups.
+        
+        For add-k smoothing, k is given with (default 1):
+            --k <k>
+        
+        For jelinek-mercer smoothing, the weight of the higher order is given with (default 0.7):
+            --lambda <weight>
+        
+        <input-test-file> must be a file containing the test input sentence as a single line (or
+        one sentence per line with --batch).
         
-        <input-test-file> must be a file containing the test input sentence as a single line.
+        The training corpus is read from TrainingSet.txt, or from TrainingSet.txt.gz, .bz2 or .xz
+        if only a compressed copy exists.
         
     Imports:
-        sys - Used to get the arguments from command line
+        os          - Used for the directories of the pruned models being compared
+        sys         - Used to exit with an error message
+        math        - Used for converting the log probability of a test sentence
+        time        - Used for timing model loads
+        argparse    - Used to get the arguments from command line
+        tempfile    - Used for saving the pruned models being compared
+        numpy       - Used for the count and probability arrays
+        vocabulary  - Used for interning words as integer IDs
+        counts      - Used for the array-backed unigram/bigram and n-gram count tables
+        smoothing   - Used for the smoothing models
+        scoring     - Used for scoring test sentences in log space
+        corpus      - Used for finding the training file and streaming the test file
+        model_file  - Used for saving and loading trained models (and measuring their size)
+        sketch      - Used for the approximate (Count-Min Sketch) bigram counts
+        server      - Used for serving a saved model over HTTP
 """
+import os
 import sys
+import math
+import time
+import argparse
+import tempfile
+import numpy as np
 
-if __name__ == "__main__":
+from vocabulary import Vocabulary, START_OF_SENTENCE, END_OF_SENTENCE
+from counts import BigramCounts, BigramCounter, NgramCounts, NgramCounter, count_corpus
+from smoothing import Unsmoothed, AddK, GoodTuring, NgramAddK, NgramBackoff, KneserNey, JelinekMercer, SketchAddK
+from scoring import log, report, cross_entropy, perplexity
+from corpus import TRAINING_SET, find_corpus, read_sentences, words_of
+from model_file import save_bundle, load_bundle, bundle_kind, bundle_nbytes
+from server import add_server_arguments, serve
+from sketch import CountMinSketch, SketchCounts, SketchCounter, DEFAULT_DEPTH, DEFAULT_MEMORY, count_sketch, parse_size
+
+# Smoothing types of bigram models and the model used for each
+SMOOTHING_CLASSES = {
+    "none": Unsmoothed,
+    "add-one": AddK,
+    "good-turing": GoodTuring,
+    "add-one-fast": AddK,
+    "add-k": AddK,
+    "simple-good-turing": GoodTuring,
+}
+
+# Smoothing types supported by models of order above 2 and the model used for each
+NGRAM_SMOOTHING_CLASSES = {
+    "none": NgramAddK,
+    "add-one": NgramAddK,
+    "add-one-fast": NgramAddK,
+    "add-k": NgramAddK,
+    "kneser-ney": KneserNey,
+    "jelinek-mercer": JelinekMercer,
+}
+# Smoothing types supported with approximate (sketched) counts, which can only be queried pair by pair
+SKETCH_SMOOTHING_TYPES = ["add-one", "add-k"]
+# Smoothing types whose models back off to shorter histories, and so can be pruned
+PRUNABLE_SMOOTHING_TYPES = ["kneser-ney", "jelinek-mercer"]
+# Default relative entropy thresholds compared by compare-prune
+PRUNE_THRESHOLDS = [1e-8, 1e-7, 1e-6, 1e-5]
+SMOOTHING_TYPES = list(SMOOTHING_CLASSES) + [name for name in NGRAM_SMOOTHING_CLASSES if name not in SMOOTHING_CLASSES]
+
+
+class BigramModel:
+    """Word-based bigram model that can score many sentences after being trained once."""
+
+    def __init__(self, counts, smoothing_type="none", k=1.0, smoothing=None):
+        self.counts = counts
+        self.vocab = counts.vocab
+        self.smoothing_type = smoothing_type
+
+        # Use an already built smoothing model (e.g. one loaded from a model file)
+        if smoothing is not None:
+            self.smoothing = smoothing
+
+        # No smoothing
+        elif smoothing_type == "none":
+            self.smoothing = Unsmoothed(counts)
+
+        # Add-one and add-k smoothing (probabilities of unseen bigrams are computed on demand)
+        elif smoothing_type == "add-one" or smoothing_type == "add-one-fast" or smoothing_type == "add-k":
+            self.smoothing = AddK(counts, k=k if smoothing_type == "add-k" else 1)
+
+        # Good-turing discounting based smoothing (N_c is built in a single pass over the bigram counts)
+        else:
+            self.smoothing = GoodTuring(counts, simple=smoothing_type == "simple-good-turing")
+
+    @classmethod
+    def train(cls, smoothing_type="none", path=TRAINING_SET, jobs=1, k=1.0):
+        """Count the word portion of each word_pos pattern of the training corpus and build the model.
+
+        The corpus is split into shards counted by separate processes if jobs > 1.
+        """
+        return cls(count_corpus(find_corpus(path), jobs=jobs), smoothing_type, k)
+
+    def save(self, path):
+        """Write the vocabulary, count tables and smoothing parameters to the model directory path."""
+        counts = self.counts
+        arrays = {"unigram": counts.unigram, "indptr": counts.indptr, "indices": counts.indices,
+                  "counts": counts.counts}
+        meta = {"smoothing_type": self.smoothing_type, "smoothing": dict()}
+
+        # Smoothing arrays are saved as segments and smoothing numbers in the header
+        for name, value in self.smoothing.state().items():
+            if isinstance(value, np.ndarray):
+                arrays["smoothing." + name] = value
+            else:
+                meta["smoothing"][name] = value.item() if isinstance(value, np.generic) else value
+        save_bundle(path, "bigram", meta, arrays, {"vocab": self.vocab.words})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved with save(), memory-mapping its arrays instead of reading them."""
+        meta, arrays, strings = load_bundle(path, "bigram", mmap)
+        vocab = Vocabulary.from_words(strings["vocab"])
+        # The lookup keys are rebuilt from the CSR table when first needed (models saved before
+        # they were left out still have them)
+        counts = BigramCounts(vocab, arrays["unigram"], arrays["indptr"], arrays["indices"],
+                              arrays["counts"], keys=arrays.get("keys"))
+
+        # Restore the smoothing model from its saved parameters without recomputing it
+        state = dict(meta["smoothing"])
+        for name, array in arrays.items():
+            if name.startswith("smoothing."):
+                state[name[len("smoothing."):]] = array
+        smoothing_type = meta["smoothing_type"]
+        if SMOOTHING_CLASSES[smoothing_type] is GoodTuring:
+            state.setdefault("simple", smoothing_type == "simple-good-turing")
+        smoothing = SMOOTHING_CLASSES[smoothing_type].restore(counts, state)
+        return cls(counts, smoothing_type, smoothing=smoothing)
+
+    def count_delta(self, sentences, order=None):
+        """Count sentences (lists of word_pos tokens) over this model's word IDs (new words get new IDs)."""
+        vocab = Vocabulary.from_words(self.vocab.words)
+        counter = BigramCounter(vocab) if order is None else NgramCounter(order, vocab)
+        for tokens in sentences:
+            counter.add_sentence(words_of(tokens))
+        return counter.counts()
+
+    def update(self, sentences):
+        """Fold new sentences (lists of word_pos tokens) into the model without recounting the corpus.
+
+        The counts of the new sentences are merged into the count tables, which copies them
+        (O(seen bigrams)), and the smoothing model only recomputes the per-history arrays they
+        change (O(new bigrams + V), see BigramSmoothing.update).
+        """
+        delta = self.count_delta(sentences)
+        counts = self.counts.merge(delta)
+        self.smoothing.update(counts, delta)
+        self.counts = counts
+        self.vocab = counts.vocab
+
+    def score(self, tokens):
+        """Return (log probability, number of predicted tokens) of a sentence (list of word_pos tokens)."""
+        return next(self.score_many([tokens]))
+
+    def score_many(self, sentences, batch_size=1024):
+        """Yield (log probability, number of predicted tokens) for each sentence (list of tokens).
+
+        Sentences are consumed lazily and scored batch_size at a time; the number of predicted
+        tokens includes </s>.
+        """
+        batch = []
+        for tokens in sentences:
+            batch.append(tokens)
+            if len(batch) == batch_size:
+                yield from self._score_batch(batch)
+                batch = []
+        if batch:
+            yield from self._score_batch(batch)
+
+    def _score_batch(self, batch):
+
+        # Concatenate the IDs of all sentences (with <s> and </s>, and ID -1 for unseen words)
+        get = self.vocab.ids.get
+        ids = []
+        lengths = []
+        for tokens in batch:
+            ids.append(START_OF_SENTENCE)
+            ids.extend([get(w, -1) for w in words_of(tokens)])
+            ids.append(END_OF_SENTENCE)
+            lengths.append(len(tokens) + 2)
+        ids = np.array(ids)
+        prevIds, tokenIds = ids[:-1], ids[1:]
+
+        # Look up the log probabilities of every token|prevToken pair in the batch at once
+        logProbs = log(self.smoothing.probs(tokenIds, prevIds))
+
+        # Drop the </s> -> <s> pairs between sentences and add the log probabilities of each sentence
+        logProbs[tokenIds == START_OF_SENTENCE] = 0
+        starts = np.cumsum(lengths) - lengths
+        for logProb, length in zip(np.add.reduceat(logProbs, starts), lengths):
+            yield float(logProb), length - 1
+
+
+class NgramModel(BigramModel):
+    """Word-based n-gram model of any order, backed by the sorted-array trie of NgramCounts."""
+
+    def __init__(self, counts, smoothing_type="none", k=1.0, smoothing=None, weight=0.7, pruned=None):
+        self.counts = counts
+        self.vocab = counts.vocab
+        self.order = counts.order
+        self.smoothing_type = smoothing_type
+
+        # Settings the model was pruned with (None if it holds every n-gram of its corpus)
+        self.pruned = pruned
+
+        # Use an already built smoothing model (e.g. one loaded from a model file)
+        if smoothing is not None:
+            self.smoothing = smoothing
+
+        # Interpolated modified Kneser-Ney smoothing
+        elif smoothing_type == "kneser-ney":
+            self.smoothing = KneserNey(counts)
+
+        # Jelinek-Mercer interpolation of each order with the next lower one
+        elif smoothing_type == "jelinek-mercer":
+            self.smoothing = JelinekMercer(counts, weight)
+
+        # No smoothing (add-0), add-one and add-k smoothing of the highest order
+        else:
+            self.smoothing = NgramAddK(counts, k={"none": 0, "add-k": k}.get(smoothing_type, 1))
+
+    @classmethod
+    def train(cls, smoothing_type="none", path=TRAINING_SET, jobs=1, k=1.0, order=3, weight=0.7):
+        """Count every n-gram up to order of the training corpus and build the model."""
+        return cls(count_corpus(find_corpus(path), jobs=jobs, order=order), smoothing_type, k, weight=weight)
+
+    def update(self, sentences):
+        """Fold new sentences (lists of word_pos tokens) into the model without recounting the corpus.
+
+        The counts of the new sentences are merged into the trie level by level. The smoothing
+        model is then rebuilt from the merged counts, since the discounts and continuation counts
+        of Kneser-Ney (and the vocabulary size of add-k) depend on the whole table, so an update
+        costs about as much as training on the counts (O(n-grams)) without recounting the corpus.
+        """
+        if self.pruned is not None:
+            raise ValueError("A pruned model cannot be updated, since it does not keep the counts of the pruned n-grams")
+        counts = self.counts.merge(self.count_delta(sentences, self.order))
+        smoothing = self.smoothing
+        self.__init__(counts, self.smoothing_type, getattr(smoothing, "k", 1.0), weight=getattr(smoothing, "weight", 0.7))
+
+    def prune(self, cutoffs=(), threshold=0.0):
+        """Return a smaller copy of a backoff model with count cutoffs and entropy pruning (see NgramBackoff.prune)."""
+        if not isinstance(self.smoothing, NgramBackoff):
+            raise ValueError("Only models with the smoothing types " + ", ".join(PRUNABLE_SMOOTHING_TYPES) + " can be pruned")
+        smoothing = self.smoothing.prune(cutoffs, threshold)
+        return NgramModel(smoothing.counts, self.smoothing_type, smoothing=smoothing,
+                          pruned={"cutoffs": list(cutoffs), "threshold": threshold})
+
+    def save(self, path):
+        """Write the vocabulary, n-gram trie and smoothing parameters to the model directory path."""
+        counts = self.counts
+        arrays = {"counts." + str(j): c for j, c in enumerate(counts.counts)}
+        arrays.update({"words." + str(j): w for j, w in enumerate(counts.words) if w is not None})
+        arrays.update({"offsets." + str(j): o for j, o in enumerate(counts.offsets)})
+        meta = {"order": self.order, "smoothing_type": self.smoothing_type, "smoothing": dict()}
+        if self.pruned is not None:
+            meta["pruned"] = self.pruned
+
+        # Smoothing arrays are saved as segments and smoothing numbers in the header
+        for name, value in self.smoothing.state().items():
+            if isinstance(value, np.ndarray):
+                arrays["smoothing." + name] = value
+            else:
+                meta["smoothing"][name] = value.item() if isinstance(value, np.generic) else value
+        save_bundle(path, "ngram", meta, arrays, {"vocab": self.vocab.words})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved with save(), memory-mapping its arrays instead of reading them."""
+        meta, arrays, strings = load_bundle(path, "ngram", mmap)
+        order = meta["order"]
+        counts = NgramCounts(Vocabulary.from_words(strings["vocab"]), order,
+                             [arrays["counts." + str(j)] for j in range(order)],
+                             [None] + [arrays["words." + str(j)] for j in range(1, order)],
+                             [arrays["offsets." + str(j)] for j in range(order - 1)])
+
+        # Restore the smoothing model from its saved parameters without recomputing it
+        state = dict(meta["smoothing"])
+        for name, array in arrays.items():
+            if name.startswith("smoothing."):
+                state[name[len("smoothing."):]] = array
+        smoothing_type = meta["smoothing_type"]
+        smoothing = NGRAM_SMOOTHING_CLASSES[smoothing_type].restore(counts, state)
+        return cls(counts, smoothing_type, smoothing=smoothing, pruned=meta.get("pruned"))
+
+    def _score_batch(self, batch):
+
+        # Concatenate the IDs of all sentences (with <s> and </s>, and ID -1 for unseen words)
+        get = self.vocab.ids.get
+        ids = []
+        lengths = []
+        for tokens in batch:
+            ids.append(START_OF_SENTENCE)
+            ids.extend([get(w, -1) for w in words_of(tokens)])
+            ids.append(END_OF_SENTENCE)
+            lengths.append(len(tokens) + 2)
+        ids = np.array(ids)
+
+        # Each token is predicted from the previous order - 1 words (fewer at the start of a
+        # sentence); <s> itself is not predicted
+        starts = np.cumsum(lengths) - lengths
+        position = np.arange(len(ids)) - np.repeat(starts, lengths)
+        ngramLengths = np.clip(position + 1, 2, self.order)
+
+        # Look up the log probabilities of every token in the batch at once
+        logProbs = log(self.smoothing.probs(ids, ngramLengths))
+        logProbs[position == 0] = 0
+        for logProb, length in zip(np.add.reduceat(logProbs, starts), lengths):
+            yield float(logProb), length - 1
+
+
+class SketchModel(BigramModel):
+    """Bigram model over approximate bigram counts held in a fixed-memory Count-Min Sketch (see sketch.py)."""
+
+    def __init__(self, counts, smoothing_type="add-one", k=1.0, smoothing=None):
+        self.counts = counts
+        self.vocab = counts.vocab
+        self.smoothing_type = smoothing_type
+
+        # Use an already built smoothing model (e.g. one loaded from a model file)
+        if smoothing is not None:
+            self.smoothing = smoothing
+
+        # Add-one and add-k smoothing (only need the count of each queried pair)
+        else:
+            self.smoothing = SketchAddK(counts, k=k if smoothing_type == "add-k" else 1)
+
+    @classmethod
+    def train(cls, smoothing_type="add-one", path=TRAINING_SET, memory=DEFAULT_MEMORY, depth=DEFAULT_DEPTH, k=1.0):
+        """Count the training corpus into a sketch of memory bytes (and depth rows) and build the model."""
+        return cls(count_sketch(find_corpus(path), memory, depth), smoothing_type, k)
+
+    def save(self, path):
+        """Write the vocabulary, unigram counts, sketch and smoothing parameters to the model directory path."""
+        counts = self.counts
+        arrays = {"unigram": counts.unigram, "sketch": counts.sketch.table, "seeds": counts.sketch.seeds}
+        meta = {"smoothing_type": self.smoothing_type, "total": counts.total, "smoothing": dict()}
+
+        # Smoothing arrays are saved as segments and smoothing numbers in the header
+        for name, value in self.smoothing.state().items():
+            if isinstance(value, np.ndarray):
+                arrays["smoothing." + name] = value
+            else:
+                meta["smoothing"][name] = value.item() if isinstance(value, np.generic) else value
+        save_bundle(path, "sketch", meta, arrays, {"vocab": self.vocab.words})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model saved with save(), memory-mapping its arrays instead of reading them."""
+        meta, arrays, strings = load_bundle(path, "sketch", mmap)
+        table = arrays["sketch"]
+        sketch = CountMinSketch(table.shape[1], table.shape[0], table=table, seeds=arrays["seeds"])
+        counts = SketchCounts(Vocabulary.from_words(strings["vocab"]), arrays["unigram"], sketch, meta["total"])
+
+        # Restore the smoothing model from its saved parameters without recomputing it
+        state = dict(meta["smoothing"])
+        for name, array in arrays.items():
+            if name.startswith("smoothing."):
+                state[name[len("smoothing."):]] = array
+        return cls(counts, meta["smoothing_type"], smoothing=SketchAddK.restore(counts, state))
+
+    def update(self, sentences):
+        """Fold new sentences (lists of word_pos tokens) into the sketch with conservative update."""
+        counts = self.counts
+        sketch = counts.sketch
+        sketch.table = np.array(sketch.table)
+        counter = SketchCounter(sketch, Vocabulary.from_words(self.vocab.words))
+        for tokens in sentences:
+            counter.add_sentence(words_of(tokens))
+        delta = counter.counts()
+        unigram = delta.unigram.copy()
+        unigram[:len(counts.unigram)] += counts.unigram
+        self.__init__(SketchCounts(delta.vocab, unigram, sketch, counts.total + delta.total), self.smoothing_type, self.smoothing.k)
+
+
+def load_model(path, mmap=True):
+    """Load a bigram, n-gram or sketched model saved to the model directory path."""
+    kind = bundle_kind(path)
+    if kind == "ngram":
+        return NgramModel.load(path, mmap)
+    if kind == "sketch":
+        return SketchModel.load(path, mmap)
+    return BigramModel.load(path, mmap)
+
+
+def print_scores(model, test_file, batch):
+    """Score the first line of test_file (or every line with batch) and print the results."""
     
-    # Print an error for the incorrect number of arguments
-    if len(sys.argv) < 2 or len(sys.argv) > 3:
-        sys.exit("ERROR: Incorrect number of arguments.\n\n\tPlease execute with either: \n\t(1) python bigram.py <smoothing-type>\n\t(2) python bigram.py <smoothing-type> <input-test-file>")
+    # Score every line of the test set file, writing one result per line:
+    #   <log probability>\t<cross-entropy>\t<perplexity>
+    if batch:
+        for logProb, n in model.score_many(read_sentences(test_file, lower=True)):
+            print(str(logProb) + "\t" + str(cross_entropy(logProb, n)) + "\t" + str(perplexity(logProb, n)))
+        return
     
-    # Get arguments:
-    #   smoothing_type = {'none', 'add-one', 'good-turing', 'add-one-fast'}
-    #   test_file = location of input test file (optional)
-    smoothing_type = sys.argv[1]
-    test_file = None
-    if len(sys.argv) == 3:
-        test_file = sys.argv[2]
+    # Get sentence from test set file (split by whitespace) -> should only be one line
+    tokens = next(read_sentences(test_file, lower=True), [])
     
-    # Verify smoothing type is valid
-    if smoothing_type != "none" and smoothing_type != "add-one" and smoothing_type != "good-turing" and smoothing_type != "add-one-fast":
+    # Add the log probabilities of all token|prevToken pairs (multiplying the probabilities
+    # underflows on long sentences)
+    logProb, n = model.score(tokens)
+    
+    # Output results
+    print("Probability of test sentence = " + str(math.exp(logProb)))
+    print(report(logProb, n))
+
+
+def score_results(model, sentences):
+    """Return the log probability, cross-entropy and perplexity of each sentence (a string) as dicts."""
+    return [{"log_prob": logProb, "cross_entropy": cross_entropy(logProb, n), "perplexity": perplexity(logProb, n)}
+            for logProb, n in model.score_many(sentence.lower().split() for sentence in sentences)]
+
+
+def check_smoothing_type(smoothing_type, order=2):
+    """Exit with an error message if smoothing_type is not valid (for a model of the given order)."""
+    if smoothing_type not in SMOOTHING_TYPES:
         sys.exit("ERROR: Incorrect smoothing type: " + smoothing_type +
-                 "\n\n\tSmoothing type must be either:\n\t(1) none\n\t(2) add-one\n\t(3) good-turing\n\t(4) add-one-fast")
+                 "\n\n\tSmoothing type must be either:\n\t(1) none\n\t(2) add-one\n\t(3) good-turing\n\t(4) add-one-fast\n\t(5) add-k\n\t(6) simple-good-turing"
+                 "\n\t(7) kneser-ney\n\t(8) jelinek-mercer")
+    if order < 2:
+        sys.exit("ERROR: Incorrect order: " + str(order) + "\n\n\tOrder must be at least 2")
+    if order > 2 and smoothing_type not in NGRAM_SMOOTHING_CLASSES:
+        sys.exit("ERROR: Smoothing type " + smoothing_type + " is only supported for bigrams" +
+                 "\n\n\tSmoothing type of orders above 2 must be either:\n\t" + "\n\t".join(NGRAM_SMOOTHING_CLASSES))
+
+
+def train_model(smoothing_type, jobs=1, k=1.0, order=2, weight=0.7):
+    """Train a bigram model, or an n-gram model if order > 2 or the smoothing type needs one."""
+    if order > 2 or smoothing_type not in SMOOTHING_CLASSES:
+        return NgramModel.train(smoothing_type, jobs=jobs, k=k, order=order, weight=weight)
+    return BigramModel.train(smoothing_type, jobs=jobs, k=k)
+
+
+def main_train(argv):
+    """python bigram.py train <smoothing-type> <model-dir>: train a model and save it to <model-dir>."""
+    parser = argparse.ArgumentParser(prog="bigram.py train", description="Trains a bigram model and saves it to a model directory.")
+    parser.add_argument("smoothing_type", metavar="<smoothing-type>")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes used for counting the training set")
+    parser.add_argument("--k", type=float, default=1.0, help="value added to each count for add-k smoothing")
+    parser.add_argument("--order", type=int, default=2, help="order of the n-gram model")
+    parser.add_argument("--lambda", dest="weight", type=float, default=0.7, help="weight of the higher order for jelinek-mercer smoothing")
+    parser.add_argument("--sketch", metavar="<memory>", type=parse_size, help="count the bigrams approximately in a Count-Min Sketch of this size (e.g. 64M)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="number of rows (hash functions) of the sketch")
+    args = parser.parse_intermixed_args(argv)
+    check_smoothing_type(args.smoothing_type, args.order)
     
-    # Get training set file lines
-    trainingSet = open("TrainingSet.txt")
-    lines = trainingSet.readlines()
-    trainingSet.close()
+    # Approximate counts (the corpus is counted serially into a single sketch)
+    if args.sketch is not None:
+        check_sketch(args.smoothing_type, args.order)
+        try:
+            model = SketchModel.train(args.smoothing_type, memory=args.sketch, depth=args.depth, k=args.k)
+        except ValueError as e:
+            sys.exit("ERROR: " + str(e))
+        model.save(args.model)
+        return
+    train_model(args.smoothing_type, jobs=args.jobs, k=args.k, order=args.order, weight=args.weight).save(args.model)
+
+
+def check_sketch(smoothing_type, order=2):
+    """Exit with an error message if smoothing_type (or order) cannot be used with sketched counts."""
+    if smoothing_type not in SKETCH_SMOOTHING_TYPES or order != 2:
+        sys.exit("ERROR: Sketched counts only support bigram models with the smoothing types:\n\t" + "\n\t".join(SKETCH_SMOOTHING_TYPES))
+
+
+def main_compare_sketch(argv):
+    """python bigram.py compare-sketch <input-test-file>: compare a sketched model with the exact model."""
+    parser = argparse.ArgumentParser(prog="bigram.py compare-sketch", description="Compares the counts and perplexity of a bigram model trained with a Count-Min Sketch to the exact model.")
+    parser.add_argument("test_file", metavar="<input-test-file>")
+    parser.add_argument("--memory", metavar="<memory>", type=parse_size, default=DEFAULT_MEMORY, help="size of the sketch (e.g. 64M)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="number of rows (hash functions) of the sketch")
+    parser.add_argument("--smoothing", dest="smoothing_type", metavar="<smoothing-type>", default="add-one", help="smoothing type of both models")
+    parser.add_argument("--k", type=float, default=1.0, help="value added to each count for add-k smoothing")
+    args = parser.parse_intermixed_args(argv)
+    check_sketch(args.smoothing_type)
+    exact = BigramModel.train(args.smoothing_type, k=args.k)
+    try:
+        approximate = SketchModel.train(args.smoothing_type, memory=args.memory, depth=args.depth, k=args.k)
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
+    counts, sketch = exact.counts, approximate.counts.sketch
     
-    # Initialize dicts for unigram and bigrams
-    unigramCount = dict()
-    bigramCount = dict()
-    unigramProb = dict()
-    bigramProb = dict()
+    # Overestimate of every bigram of the training set (both models give words the same IDs)
+    error = approximate.counts.count(counts.indices, counts.prev_ids()) - counts.counts
     
-    # Initialize keys for start of sentence and end of sentence
-    START_OF_SENTENCE = 0
-    END_OF_SENTENCE = 1
+    # Perplexity of both models over every line of the test file
+    results = []
+    for model in (exact, approximate):
+        scores = list(model.score_many(read_sentences(args.test_file, lower=True)))
+        results.append((sum(logProb for logProb, _ in scores), sum(n for _, n in scores)))
     
-    # Loop through lines in training set file
-    for sentence in lines:
-        
-        # Start each sentence
-        prevToken = None
-        
-        # Split each line by whitespace
-        tokens = sentence.lower().split()
-        
-        # Loop through word_pos patterns (with start and end of sentence added)
-        for t in [START_OF_SENTENCE] + tokens + [END_OF_SENTENCE]:
-            
-            # Get the word portion from the word_pos pattern
-            token = t
-            if token != START_OF_SENTENCE and token != END_OF_SENTENCE:
-                token = t.split("_")[0]
-            
-            # Increment unigram counts by 1 for each token
-            if token in unigramCount: unigramCount[token] += 1
-            else: unigramCount.update({token: 1})
-            
-            # Increment bigram counts by 1 for each token|previous token
-            if prevToken != None:
-                if (token, prevToken) in bigramCount: bigramCount[(token, prevToken)] += 1
-                else: bigramCount.update({(token, prevToken): 1})
-            
-            # Set previous token
-            prevToken = token
-            
-    # Calculate unigram probabilities
-    totalWordCount = sum(unigramCount.values())
-    for token in unigramCount:
-        unigramProb.update({token: unigramCount[token] / totalWordCount})
+    # Output results
+    print("Exact counts: " + str(len(counts)) + " bigrams in " + str(counts.nbytes()) + " bytes")
+    print("Sketched counts: " + str(sketch.depth) + " x " + str(sketch.width) + " counters in " + str(sketch.nbytes()) + " bytes")
+    print("Error bound: each count is overestimated by at most e / width * N = " + str(sketch.epsilon) + " * " +
+          str(approximate.counts.total) + " = " + str(approximate.counts.error_bound()) + " with probability 1 - e^-depth = " + str(1 - sketch.delta))
+    print("Observed overestimates: mean = " + str(float(error.mean()) if len(error) else 0.0) + ", max = " + str(int(error.max(initial=0))) +
+          ", within the bound for " + str(float(np.mean(error <= approximate.counts.error_bound())) if len(error) else 1.0) +
+          " of the bigrams, exact for " + str(float(np.mean(error == 0)) if len(error) else 1.0))
+    print("\nExact model:\n" + report(*results[0]))
+    print("\nSketched model:\n" + report(*results[1]))
+
+
+def main_score(argv):
+    """python bigram.py score <model-dir> <input-test-file>: score test sentences with a saved model."""
+    parser = argparse.ArgumentParser(prog="bigram.py score", description="Scores test sentences with a saved bigram model.")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("test_file", metavar="<input-test-file>")
+    parser.add_argument("--batch", action="store_true", help="score every line of the test file (- for stdin)")
+    args = parser.parse_intermixed_args(argv)
+    print_scores(load_model(args.model), args.test_file, args.batch)
+
+
+def main_update(argv):
+    """python bigram.py update <model-dir> <new-sentences-file>: fold new sentences into a saved model."""
+    parser = argparse.ArgumentParser(prog="bigram.py update", description="Folds new sentences into a saved bigram model.")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("sentences", metavar="<new-sentences-file>")
+    parser.add_argument("--output", metavar="<model-dir>", help="save the updated model here instead of replacing the saved one")
+    args = parser.parse_intermixed_args(argv)
     
-    # No smoothing
-    if smoothing_type == "none":
-        
-        # Determine bigram probabilities
-        for (token, prevToken) in bigramCount:
-            bCount = bigramCount[(token, prevToken)]
-            uCount = unigramCount[prevToken]
-            bigramProb.update({(token, prevToken): bCount/uCount})
+    # Read the arrays instead of mapping them, since the update modifies them (saving replaces
+    # the whole model directory, so processes that mapped the old model keep their files)
+    model = load_model(args.model, mmap=False)
+    try:
+        model.update(read_sentences(args.sentences, lower=True))
+        model.save(args.output or args.model)
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
+
+
+def load_prunable(path, mmap=True):
+    """Load the saved model at path, or exit with an error message if it cannot be pruned."""
+    model = load_model(path, mmap)
+    if not isinstance(model, NgramModel) or model.smoothing_type not in PRUNABLE_SMOOTHING_TYPES:
+        sys.exit("ERROR: Only models with the smoothing types:\n\t" + "\n\t".join(PRUNABLE_SMOOTHING_TYPES) + "\ncan be pruned")
+    if model.pruned is not None:
+        sys.exit("ERROR: " + path + " is already pruned; prune the full model instead")
+    return model
+
+
+def ngram_sizes(model):
+    """Return the number of n-grams of each order of an n-gram model as a string (e.g. 417/7710/40477)."""
+    return "/".join(str(len(c)) for c in model.counts.counts)
+
+
+def main_prune(argv):
+    """python bigram.py prune <model-dir> <output-dir>: save a pruned copy of a saved model."""
+    parser = argparse.ArgumentParser(prog="bigram.py prune", description="Saves a copy of a saved kneser-ney or jelinek-mercer model without its rare or least useful n-grams.")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("output", metavar="<output-dir>")
+    parser.add_argument("--cutoffs", metavar="<min-count>", type=int, nargs="+", default=[], help="smallest count of a kept bigram, trigram, ... (the last one applies to the higher orders)")
+    parser.add_argument("--threshold", type=float, default=0.0, help="remove the n-grams whose removal increases the perplexity by a relative amount below this")
+    args = parser.parse_intermixed_args(argv)
     
-        # Add blank entry with probability 0 for unknown/unseen instances
-        bigramProb.update({(None, None): 0})
+    # Saving replaces the whole output directory, so it may be the model directory itself (and
+    # processes that mapped the full model keep their files)
+    model = load_prunable(args.model, mmap=False)
+    pruned = model.prune(args.cutoffs, args.threshold)
+    try:
+        pruned.save(args.output)
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
+    print("N-grams: " + ngram_sizes(model) + " -> " + ngram_sizes(pruned))
+    print("Trie and probabilities: " + str(model.counts.nbytes() + model.smoothing.seen.nbytes + model.smoothing.backoff.nbytes) + " -> " +
+          str(pruned.counts.nbytes() + pruned.smoothing.seen.nbytes + pruned.smoothing.backoff.nbytes) + " bytes")
 
 
-    # Add-one smoothing
-    elif smoothing_type == "add-one" or smoothing_type == "add-one-fast":
-        
-        # Get the size of vocabulary
-        V = len(unigramCount.keys())
+def main_compare_prune(argv):
+    """python bigram.py compare-prune <model-dir> <input-test-file>: compare the size, load time and perplexity of pruned models."""
+    parser = argparse.ArgumentParser(prog="bigram.py compare-prune", description="Compares the size, load time and perplexity of a saved model pruned with several thresholds.")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("test_file", metavar="<input-test-file>")
+    parser.add_argument("--cutoffs", metavar="<min-count>", type=int, nargs="+", default=[], help="smallest count of a kept bigram, trigram, ... (the last one applies to the higher orders)")
+    parser.add_argument("--thresholds", metavar="<t>", type=float, nargs="+", default=PRUNE_THRESHOLDS, help="relative entropy thresholds to compare")
+    parser.add_argument("--repeat", type=int, default=3, help="number of loads timed per model (the fastest is reported)")
+    args = parser.parse_intermixed_args(argv)
+    model = load_prunable(args.model, mmap=False)
     
-        # Determine bigram probabilities
-        for (token, prevToken) in bigramCount:
-            bCount = bigramCount[(token, prevToken)]
-            uCount = unigramCount[prevToken]
-            
-            bigramProb.update({(token, prevToken): (bCount + 1)/(uCount + V)})
-            
-        # Add probabilities for all unseen bigrams
-        if smoothing_type == "add-one":
-            for prevToken in unigramCount:
-                if prevToken != END_OF_SENTENCE:
-                    for token in unigramCount:
-                        if (token, prevToken) not in bigramProb and token != START_OF_SENTENCE:
-                            bigramProb.update({(token, prevToken): 1/(unigramCount[prevToken] + V)})
-        
-        
-    # Good-turing discounting based smoothing
-    else:
-        
-        # Get total number of bigram occurrences 
-        N = sum(bigramCount.values())
-        
-        # Create a dict for N_c values
-        Nc = dict()
-        
-        # Calculate N_1
-        n_i = sum(c == 1 for c in bigramCount.values())
-        Nc.update({1: n_i})
-        
-        # Determine bigram probabilities
-        for (token, prevToken) in bigramCount:
-            bCount = bigramCount[(token, prevToken)]
-            
-            # If we have yet to calculate N_bCount, calculate it
-            if bCount not in Nc.keys():
-                n_i = sum(c == bCount for c in bigramCount.values())
-                Nc.update({bCount: n_i})
-            
-            # If we have yet to calculate N_bCount+1, calculate it
-            if bCount+1 not in Nc.keys():
-                n_i = sum(c == bCount+1 for c in bigramCount.values())
-                Nc.update({bCount+1: n_i})
-            
-            # Calculate c*
-            newCount = 0
-            if Nc[bCount] != 0: newCount = (bCount+1)*Nc[bCount+1] / Nc[bCount]
+    # Settings to compare: the full model, the cutoffs alone and the cutoffs with each threshold
+    settings = [("full", None)]
+    if args.cutoffs:
+        settings.append(("cutoffs " + " ".join(map(str, args.cutoffs)), 0.0))
+    settings += [(("cutoffs " + " ".join(map(str, args.cutoffs)) + ", " if args.cutoffs else "") + "threshold " + str(t), t)
+                 for t in sorted(args.thresholds)]
+    
+    # Output one line per setting:
+    #   <setting>\t<n-grams of each order>\t<bytes on disk>\t<load time in ms>\t<perplexity>
+    print("Model\tN-grams\tBytes\tLoad (ms)\tPerplexity")
+    with tempfile.TemporaryDirectory() as workdir:
+        for i, (name, threshold) in enumerate(settings):
+            path = args.model
+            if threshold is not None:
+                path = os.path.join(workdir, str(i))
+                model.prune(args.cutoffs, threshold).save(path)
             
-            # Add the probability
-            bigramProb.update({(token, prevToken): newCount/N})
-        
-        # Add blank entry with probability N_1/N for unknown/unseen instances       
-        bigramProb.update({(None, None): Nc[1]/N})
-        
-        
+            # Time reading the whole model (loading with memory-mapping only maps the files)
+            loadTime = math.inf
+            for _ in range(max(args.repeat, 1)):
+                start = time.perf_counter()
+                loaded = load_model(path, mmap=False)
+                loadTime = min(loadTime, time.perf_counter() - start)
+            scores = list(loaded.score_many(read_sentences(args.test_file, lower=True)))
+            logProb, n = sum(logProb for logProb, _ in scores), sum(n for _, n in scores)
+            print(name + "\t" + ngram_sizes(loaded) + "\t" + str(bundle_nbytes(path)) + "\t" +
+                  str(round(loadTime * 1000, 3)) + "\t" + str(perplexity(logProb, n)))
+
+
+def main_serve(argv):
+    """python bigram.py serve <model-dir>: serve a saved model over HTTP."""
+    parser = argparse.ArgumentParser(prog="bigram.py serve", description="Serves a saved bigram model over HTTP (POST /score).")
+    parser.add_argument("model", metavar="<model-dir>")
+    add_server_arguments(parser)
+    args = parser.parse_intermixed_args(argv)
+    model = load_model(args.model)
+    serve({"score": lambda sentences: score_results(model, sentences)}, args)
+
+
+if __name__ == "__main__":
+    
+    # Train and save a model, score with, update, prune or serve a saved model, or compare sketched
+    # counts or pruned models
+    if sys.argv[1:2] == ["train"]:
+        sys.exit(main_train(sys.argv[2:]))
+    if sys.argv[1:2] == ["score"]:
+        sys.exit(main_score(sys.argv[2:]))
+    if sys.argv[1:2] == ["update"]:
+        sys.exit(main_update(sys.argv[2:]))
+    if sys.argv[1:2] == ["compare-sketch"]:
+        sys.exit(main_compare_sketch(sys.argv[2:]))
+    if sys.argv[1:2] == ["prune"]:
+        sys.exit(main_prune(sys.argv[2:]))
+    if sys.argv[1:2] == ["compare-prune"]:
+        sys.exit(main_compare_prune(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(main_serve(sys.argv[2:]))
+    
+    
+    # Get arguments:
+    #   smoothing_type = {'none', 'add-one', 'good-turing', 'add-one-fast', 'add-k', 'simple-good-turing',
+    #                     'kneser-ney', 'jelinek-mercer'}
+    #   test_file = location of input test file (optional)
+    #   jobs = number of processes used for counting the training set (optional)
+    #   k = value added to each count for add-k smoothing (optional)
+    #   batch = score every line of the test file instead of only the first (optional)
+    #   order = order of the n-gram model (optional)
+    #   weight = weight of the higher order for jelinek-mercer smoothing (optional)
+    parser = argparse.ArgumentParser(description="Builds a word-based bigram model and computes the probability of a test sentence.")
+    parser.add_argument("smoothing_type", metavar="<smoothing-type>")
+    parser.add_argument("test_file", metavar="<input-test-file>", nargs="?")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes used for counting the training set")
+    parser.add_argument("--k", type=float, default=1.0, help="value added to each count for add-k smoothing")
+    parser.add_argument("--batch", action="store_true", help="score every line of the test file (- for stdin)")
+    parser.add_argument("--order", type=int, default=2, help="order of the n-gram model")
+    parser.add_argument("--lambda", dest="weight", type=float, default=0.7, help="weight of the higher order for jelinek-mercer smoothing")
+    args = parser.parse_intermixed_args()
+    smoothing_type = args.smoothing_type
+    test_file = args.test_file
+    
+    # Verify smoothing type is valid
+    check_smoothing_type(smoothing_type, args.order)
+    
+    # Train the model on the training set file (split into shards counted by separate processes if
+    # jobs > 1)
+    model = train_model(smoothing_type, jobs=args.jobs, k=args.k, order=args.order, weight=args.weight)
+    counts = model.counts
+    vocab = model.vocab
+    smoothing = model.smoothing
+    
     # If a test file is provided, perform testing
     if test_file != None:
         
-        # Get test set file lines
-        testSet = open(test_file)
-        lines = testSet.readlines()
-        testSet.close()
-        
-        # Get sentence from test set file -> should only be one line
-        sentence = lines[0]
-        
-        # Split line by whitespace
-        tokens = sentence.lower().split()
+        print_scores(model, test_file, args.batch)
+    
+    # If no test file is provided for an n-gram model, display the n-gram counts and probabilities
+    # of each order
+    elif isinstance(model, NgramModel):
+        words = vocab.words
+        for j in range(1, model.order):
+            ngrams = counts.ngrams(j)
+            seen = smoothing.level(j)
+            history = [" ".join(words[w] for w in ngram[:-1]) for ngram in ngrams]
+            print(("\n\n" if j > 1 else "") + str(j + 1) + "-GRAM COUNTS//////////////////////////////////////////////////")
+            for ngram, h, count in zip(ngrams, history, counts.counts[j]):
+                print("C(" + words[ngram[-1]] + " | " + h + ") = " + str(count))
+            print("\n\n" + str(j + 1) + "-GRAM PROBABILITIES///////////////////////////////////////////")
+            for ngram, h, p in zip(ngrams, history, seen):
+                print("P(" + words[ngram[-1]] + " | " + h + ") = " + str(p))
+        if smoothing_type == "none": print("For all unseen n-grams: Probability = 0")
+        elif isinstance(smoothing, NgramAddK): print("For all unseen n-grams: Probability = k / (C(history) + k*V) with k = " + str(smoothing.k))
+        else: print("For all unseen n-grams: Probability = backoff weight of the history * probability given the shorter history")
         
-        # Initialize values
-        prevToken = None
-        prob = 1
+    # If no test file is provided, display unigram/bigram counts and probabilities
+    else:
+        words = vocab.words
         
-        # Loop through word_pos patterns (with start and end of sentence added)
-        for t in [START_OF_SENTENCE] + tokens + [END_OF_SENTENCE]:
-            
-            # Get the word portion from the word_pos pattern
-            token = t
-            if token != START_OF_SENTENCE and token != END_OF_SENTENCE:
-                token = t.split("_")[0]
-            
-            # Calculate and multiply P(token|prevToken)
-            if prevToken != None:
-                
-                # token|prevToken exists in the bigram
-                if (token, prevToken) in bigramProb: prob *= bigramProb[(token, prevToken)]
-                
-                # token|prevToken does not exist in the bigram
-                elif smoothing_type == "add-one-fast": prob *= 1/(unigramCount[prevToken] + V)
-                else: prob *= bigramProb[(None, None)]
-            
-            # Set previous token
-            prevToken = token
+        # Get the unigram array, the CSR bigram table and the bigram probabilities
+        unigramCount = counts.unigram
+        bigramCount = counts.counts
+        prevTokens = counts.prev_ids()
+        bigramProb = smoothing.seen
         
-        # Output results
-        print("Probability of test sentence = " + str(prob))
+        # Calculate unigram probabilities
+        unigramProb = unigramCount / unigramCount.sum()
         
-    # If no test file is provided, display unigram/bigram counts and probabilities
-    else:
         print("UNIGRAM COUNTS//////////////////////////////////////////////////")
-        for token in unigramCount:
-            if token == START_OF_SENTENCE: print("C(<s>) = " + str(unigramCount[token]))
-            elif token == END_OF_SENTENCE: print("C(</s>) = " + str(unigramCount[token]))
-            else: print("C(" + str(token) + ") = " + str(unigramCount[token]))
+        for token in range(len(vocab)):
+            print("C(" + words[token] + ") = " + str(unigramCount[token]))
             
         print("\n\nBIGRAM COUNTS//////////////////////////////////////////////////")
-        for (token, prevToken) in bigramCount:
-            if prevToken == START_OF_SENTENCE: print("C(" + str(token) + " | <s>) = " + str(bigramCount[(token, prevToken)]))
-            elif token == END_OF_SENTENCE: print("C(</s> | " + str(prevToken) + ") = " + str(bigramCount[(token, prevToken)]))
-            else: print("C(" + str(token) + " | " + str(prevToken) + ") = " + str(bigramCount[(token, prevToken)]))
+        for token, prevToken, count in zip(counts.indices, prevTokens, bigramCount):
+            print("C(" + words[token] + " | " + words[prevToken] + ") = " + str(count))
             
         print("\n\nUNIGRAM PROBABILITIES//////////////////////////////////////////")
-        for token in unigramProb:
-            if token == START_OF_SENTENCE: print("P(<s>) = " + str(unigramProb[token]))
-            elif token == END_OF_SENTENCE: print("P(</s>) = " + str(unigramProb[token]))
-            else: print("P(" + str(token) + ") = " + str(unigramProb[token]))
+        for token in range(len(vocab)):
+            print("P(" + words[token] + ") = " + str(unigramProb[token]))
             
         print("\n\nBIGRAM PROBABILITIES///////////////////////////////////////////")
-        for (token, prevToken) in bigramProb:
-            if prevToken == START_OF_SENTENCE: print("P(" + str(token) + " | <s>) = " + str(bigramProb[(token, prevToken)]))
-            elif token == END_OF_SENTENCE: print("P(</s> | " + str(prevToken) + ") = " + str(bigramProb[(token, prevToken)]))
-            elif token == None: print("For all unseen bigrams: Probability = " + str(bigramProb[(token, prevToken)]))
-            else: print("P(" + str(token) + " | " + str(prevToken) + ") = " + str(bigramProb[(token, prevToken)]))
\ No newline at end of file
+        
+        # Stream the full table of all possible bigrams one previous token at a time
+        if smoothing_type == "add-one" or smoothing_type == "add-k":
+            for prevToken, row in smoothing.rows():
+                for token in range(1, len(vocab)):
+                    print("P(" + words[token] + " | " + words[prevToken] + ") = " + str(row[token]))
+        
+        # Display only the observed bigrams
+        else:
+            for token, prevToken, p in zip(counts.indices, prevTokens, bigramProb):
+                print("P(" + words[token] + " | " + words[prevToken] + ") = " + str(p))
+            if smoothing_type != "add-one-fast":
+                print("For all unseen bigrams: Probability = " + str(smoothing.unseen_prob))
@@ -0,0 +1,114 @@
+"""
+corpus.py
+    Description:
+        Streaming reader for the training and test corpora shared by bigram.py and tagging.py.
+
+        Sentences are yielded one line at a time so that memory use does not depend on the size
+        of the corpus. Corpora compressed with gzip, bzip2 or xz are detected from their magic
+        bytes and decompressed on the fly.
+
+        Uncompressed corpora can also be split into byte-range shards that are read
+        independently (e.g. by separate processes). A line belongs to the shard that contains
+        its first byte, so every line is read by exactly one shard.
+
+    Imports:
+        sys     - Used for reading sentences from stdin
+        os      - Used for checking which corpus files exist and their sizes
+        locale  - Used for decoding the lines of byte-range shards like text mode would
+        gzip    - Used for reading gzip compressed corpora
+        bz2     - Used for reading bzip2 compressed corpora
+        lzma    - Used for reading xz compressed corpora
+"""
+import sys
+import os
+import locale
+import gzip
+import bz2
+import lzma
+
+# Default location of the training corpus
+TRAINING_SET = "TrainingSet.txt"
+
+# Magic bytes at the start of each supported compressed format
+COMPRESSED_FORMATS = [
+    (b"\x1f\x8b", gzip.open, ".gz"),
+    (b"BZh", bz2.open, ".bz2"),
+    (b"\xfd7zXZ\x00", lzma.open, ".xz"),
+]
+
+
+def find_corpus(path):
+    """Return path, or its compressed variant (path.gz, path.bz2 or path.xz) if only that exists."""
+    if os.path.exists(path):
+        return path
+    for _, _, extension in COMPRESSED_FORMATS:
+        if os.path.exists(path + extension):
+            return path + extension
+    return path
+
+
+def is_compressed(path):
+    """Return True if the corpus at path is gzip, bzip2 or xz compressed."""
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    return any(magic.startswith(prefix) for prefix, _, _ in COMPRESSED_FORMATS)
+
+
+def open_corpus(path):
+    """Open the (possibly compressed) corpus at path for reading as text."""
+
+    # Check the magic bytes to see if the file is compressed
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    for prefix, opener, _ in COMPRESSED_FORMATS:
+        if magic.startswith(prefix):
+            return opener(path, "rt")
+    return open(path)
+
+
+def read_sentences(path, lower=False):
+    """Yield each line of the corpus at path (or stdin if path is "-") as a list of tokens."""
+    if path == "-":
+        for line in sys.stdin:
+            yield (line.lower() if lower else line).split()
+        return
+    with open_corpus(path) as f:
+        for line in f:
+            if lower:
+                line = line.lower()
+            yield line.split()
+
+
+def words_of(tokens):
+    """Return the word portion of each word_pos pattern in tokens."""
+    return [t.split("_")[0] for t in tokens]
+
+
+def shard_ranges(path, n):
+    """Split the (uncompressed) corpus at path into n byte ranges of roughly equal size."""
+    size = os.path.getsize(path)
+    bounds = [size * i // n for i in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_shard(path, start, end, lower=False):
+    """Yield the tokens of each line of the corpus at path that starts within [start, end)."""
+    encoding = locale.getpreferredencoding(False)
+    with open(path, "rb") as f:
+
+        # Skip the line that started before this shard (it belongs to the previous shard)
+        pos = start
+        if start > 0:
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+
+        # Read lines until the next one starts in the following shard
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            line = line.decode(encoding)
+            if lower:
+                line = line.lower()
+            yield line.split()
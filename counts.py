@@ -0,0 +1,497 @@
+"""
+counts.py
+    Description:
+        Array-backed unigram and bigram count tables keyed by integer word IDs.
+
+        Unigram counts are stored in a NumPy array indexed by word ID. Bigram counts are stored
+        in compressed sparse row (CSR) form: the row is the previous word ID, indptr[prev] to
+        indptr[prev + 1] is the slice of that row, indices holds the (sorted) word IDs of the
+        row and counts holds the matching bigram counts.
+
+        BigramCounter accumulates counts for a stream of sentences in fixed size chunks so
+        that counting is done with vectorized NumPy operations instead of per-token dict
+        updates.
+
+        Count tables can be merged (the merge is associative, and merging tables in corpus order
+        gives the same word IDs as counting the whole corpus at once), which is used to count
+        byte-range shards of the corpus in a pool of processes.
+
+        NgramCounts stores the counts of every n-gram up to a given order as a sorted-array trie
+        of reversed n-grams (as in the ARPA/KenLM trie layouts). Level 0 is the unigram array
+        indexed by word ID, and entry i of level j (the (j + 1)-grams) is the word words[j][i]
+        followed by the n-gram of its parent entry in level j - 1, i.e. each level extends the
+        n-grams of the level below by one word to the left. The entries of a level are sorted by
+        (parent, word), so offsets[j - 1][p] to offsets[j - 1][p + 1] is the slice of the
+        children of entry p and finding a child is a binary search over a contiguous slice.
+        Walking from a word to the left through its history visits every n-gram ending at that
+        word, so all the n-grams needed to score a token are found with order - 1 binary searches.
+        Words, counts and offsets are stored in the narrowest unsigned type their values fit in
+        (uint8, uint16 or uint32). The trie alone of a 5-gram model of a 30k-sentence corpus takes
+        about 6.2 bytes per n-gram (2 for the word, 1 or 2 for the count and 4 for the offsets of
+        the entries below the highest order), assuming fewer than 65536 words so that word IDs fit
+        in uint16; larger vocabularies need uint32 word IDs (2 more bytes per n-gram). A smoothed
+        model also stores a float32 probability per n-gram and a float32 backoff weight per
+        history, for about 13.2 bytes per n-gram in total.
+
+    Imports:
+        multiprocessing - Used for counting shards of the corpus in parallel
+        numpy           - Used for the count arrays and the vectorized counting
+        vocabulary      - Used for interning words as integer IDs
+        corpus          - Used for reading the corpus (or shards of it)
+"""
+import multiprocessing
+
+import numpy as np
+
+from vocabulary import Vocabulary, START_OF_SENTENCE, END_OF_SENTENCE
+from corpus import is_compressed, read_sentences, read_shard, shard_ranges, words_of
+
+# Bigram keys pack (prevToken, token) into a single integer as (prevToken << KEY_SHIFT) | token
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+
+
+def merge_keys(keys_a, counts_a, keys_b, counts_b):
+    """Merge two sorted (key, count) tables, adding the counts of keys present in both."""
+
+    # Sort the concatenated tables (stable so equal keys stay adjacent)
+    keys = np.concatenate((keys_a, keys_b))
+    counts = np.concatenate((counts_a, counts_b))
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    counts = counts[order]
+
+    # Sum the counts of each run of equal keys
+    if len(keys) == 0:
+        return keys, counts
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return keys[starts], np.add.reduceat(counts, starts)
+
+
+class BigramCounts:
+    """Unigram counts as an array and bigram counts as a CSR table over word IDs."""
+
+    def __init__(self, vocab, unigram, indptr, indices, counts, keys=None):
+        self.vocab = vocab
+        self.unigram = unigram
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self._keys = keys
+
+    @classmethod
+    def from_keys(cls, vocab, unigram, keys, counts):
+        """Build the CSR table from sorted packed bigram keys and their counts."""
+        V = len(vocab)
+        prev = keys >> KEY_SHIFT
+        indptr = np.zeros(V + 1, dtype=np.int64)
+        np.cumsum(np.bincount(prev, minlength=V), out=indptr[1:])
+        indices = (keys & KEY_MASK).astype(np.int32)
+        return cls(vocab, unigram, indptr, indices, counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def keys(self):
+        """Sorted packed (prevToken << KEY_SHIFT) | token keys of every stored bigram.
+
+        They are not saved with a model but rebuilt from the CSR table on first use.
+        """
+        if self._keys is None:
+            self._keys = (self.prev_ids().astype(np.int64) << KEY_SHIFT) | self.indices
+        return self._keys
+
+    def prev_ids(self):
+        """Return the previous word ID of every stored bigram (the expanded CSR rows)."""
+        return np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+
+    def nbytes(self):
+        """Return the number of bytes of the count arrays (including the lookup keys, built if needed)."""
+        return sum(a.nbytes for a in (self.unigram, self.indptr, self.indices, self.counts, self.keys))
+
+    def row_entries(self, rows):
+        """Return (positions, previous word IDs) of the stored bigrams of the given previous word IDs."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        prev = np.repeat(rows, lengths)
+        return np.arange(len(prev)) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths), prev
+
+    def find(self, token_ids, prev_ids):
+        """Return the position of each (token, prevToken) pair in the table, or -1 if unseen.
+
+        Unknown words can be passed as ID -1 (pairs containing them are always unseen).
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        prev_ids = np.asarray(prev_ids, dtype=np.int64)
+
+        # Binary search the packed keys for every queried pair
+        keys = self.keys
+        if len(keys) == 0:
+            return np.full(len(token_ids), -1, dtype=np.int64)
+        query = (prev_ids << KEY_SHIFT) | token_ids
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = (keys[pos] == query) & (token_ids >= 0) & (prev_ids >= 0)
+        return np.where(found, pos, -1)
+
+    def merge(self, other):
+        """Return the counts of this table plus other (other's words are added after this table's)."""
+
+        # Extend the vocabulary with other's words and map other's IDs onto it
+        vocab = Vocabulary.from_words(self.vocab.words)
+        remap = np.array([START_OF_SENTENCE, END_OF_SENTENCE] + vocab.encode(other.vocab.words[2:]), dtype=np.int64)
+        V = len(vocab)
+
+        # Add the unigram counts
+        unigram = np.zeros(V, dtype=np.int64)
+        unigram[:len(self.unigram)] += self.unigram
+        unigram[remap] += other.unigram
+
+        # Re-key other's bigrams with the merged IDs and add the bigram counts
+        keys = (remap[other.prev_ids()] << KEY_SHIFT) | remap[other.indices]
+        order = np.argsort(keys, kind="stable")
+        keys, counts = merge_keys(self.keys, self.counts, keys[order], other.counts[order])
+        return BigramCounts.from_keys(vocab, unigram, keys, counts)
+
+
+class BigramCounter:
+    """Accumulates unigram and bigram counts of tokenized sentences into a BigramCounts."""
+
+    def __init__(self, vocab=None, chunk_size=1 << 20):
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self.chunk_size = chunk_size
+
+        # Buffer of word IDs (with <s> and </s> around each sentence) waiting to be counted
+        self._buffer = []
+
+        # Running unigram counts, and the bigram tables of the counted chunks as (number of chunks,
+        # keys, counts), merged like a binary counter (see _flush)
+        self._unigram = np.zeros(len(self.vocab), dtype=np.int64)
+        self._tables = []
+
+    def add_sentence(self, tokens):
+        """Add the sentence (list of words) to the counts."""
+        self._buffer.append(START_OF_SENTENCE)
+        self._buffer.extend(self.vocab.encode(tokens))
+        self._buffer.append(END_OF_SENTENCE)
+
+        # Count the buffered IDs once the chunk is full
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        ids = np.array(self._buffer, dtype=np.int64)
+        self._buffer = []
+
+        # Unigram counts (the array grows as new words are interned)
+        V = len(self.vocab)
+        if len(self._unigram) < V:
+            self._unigram = np.concatenate((self._unigram, np.zeros(V - len(self._unigram), dtype=np.int64)))
+        self._unigram += np.bincount(ids, minlength=V)
+
+        # Bigram counts for every adjacent pair that does not cross a sentence boundary
+        prev, token = ids[:-1], ids[1:]
+        within = token != START_OF_SENTENCE
+        keys, counts = np.unique((prev[within] << KEY_SHIFT) | token[within], return_counts=True)
+
+        # Merge the last two tables while the last one covers at least as many chunks, so each
+        # bigram is merged O(log chunks) times instead of the whole table once per chunk
+        self._tables.append((1, keys, counts.astype(np.int64)))
+        while len(self._tables) > 1 and self._tables[-2][0] <= self._tables[-1][0]:
+            (n, keys_b, counts_b), (m, keys_a, counts_a) = self._tables.pop(), self._tables.pop()
+            self._tables.append((m + n,) + merge_keys(keys_a, counts_a, keys_b, counts_b))
+
+    def counts(self):
+        """Count any buffered sentences and return the resulting BigramCounts."""
+        self._flush()
+
+        # Merge the remaining tables, smallest first
+        chunks, keys, counts = 0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        for n, keys_a, counts_a in reversed(self._tables):
+            chunks, (keys, counts) = chunks + n, merge_keys(keys_a, counts_a, keys, counts)
+        self._tables = [(chunks, keys, counts)]
+        V = len(self.vocab)
+        unigram = np.concatenate((self._unigram, np.zeros(V - len(self._unigram), dtype=np.int64)))
+        return BigramCounts.from_keys(self.vocab, unigram, keys, counts)
+
+
+def compact(array):
+    """Return a non-negative integer array as the narrowest of uint8, uint16 and uint32 its values fit in.
+
+    Arrays of integers of at most 4 bytes (e.g. memory-mapped from a saved model) are returned as
+    they are, and so are arrays whose values do not fit in uint32.
+    """
+    if array.dtype.kind in "ui" and array.dtype.itemsize <= 4:
+        return array
+    top = int(array.max()) if len(array) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return array.astype(dtype)
+    return array
+
+
+def search(keys, lo, hi, targets):
+    """Return the position of each target in the sorted slice keys[lo:hi] (per target), or -1.
+
+    All the binary searches run at once, one vectorized halving step at a time.
+    """
+    lo = np.array(lo, dtype=np.int64)
+    hi = np.array(hi, dtype=np.int64)
+    end = hi.copy()
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        less = keys[np.where(active, mid, 0)] < targets
+        lo = np.where(active & less, mid + 1, lo)
+        hi = np.where(active & ~less, mid, hi)
+        active = lo < hi
+    found = lo < end
+    found[found] = keys[lo[found]] == targets[found]
+    return np.where(found, lo, -1)
+
+
+class NgramCounts:
+    """Counts of every n-gram up to order as a sorted-array trie of reversed n-grams.
+
+    counts[0] is the unigram array and words[0] is None (entry i of level 0 is word ID i). For
+    j > 0, words[j] and counts[j] are the first words and counts of the (j + 1)-grams, and
+    offsets[j - 1] is the indptr of the children of each entry of level j - 1.
+
+    The trie takes about 6.2 bytes per n-gram on a 30k-sentence corpus only while word IDs fit in
+    uint16 (fewer than 65536 words); the probabilities and backoff weights of a smoothed model
+    bring that to about 13.2 bytes per n-gram.
+    """
+
+    def __init__(self, vocab, order, counts, words, offsets):
+        self.vocab = vocab
+        self.order = order
+        self.counts = [counts[0]] + [compact(c) for c in counts[1:]]
+        self.words = [None] + [compact(w) for w in words[1:]]
+        self.offsets = [compact(o) for o in offsets]
+
+    @classmethod
+    def from_ids(cls, vocab, ids, order):
+        """Count the n-grams of a stream of word IDs (sentences with <s> and </s> around them)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        V = len(vocab)
+        positions = np.arange(len(ids))
+        sentenceStart = np.maximum.accumulate(np.where(ids == START_OF_SENTENCE, positions, 0)) if len(ids) else positions
+
+        # Unigram counts, and the level 0 entry (the word) of the unigram ending at each position
+        counts = [np.bincount(ids, minlength=V)]
+        words = [None]
+        offsets = []
+        node = ids
+        for j in range(1, order):
+
+            # (j + 1)-grams ending at each position that do not cross the start of the sentence,
+            # keyed by (entry of the j-gram ending at the same position, word j positions back)
+            ends = np.flatnonzero(positions - j >= sentenceStart)
+            keys = (node[ends] << KEY_SHIFT) | ids[ends - j]
+            keys, inverse, count = np.unique(keys, return_inverse=True, return_counts=True)
+
+            # Sorted keys give the trie level directly
+            parent = keys >> KEY_SHIFT
+            indptr = np.zeros(len(counts[j - 1]) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(parent, minlength=len(counts[j - 1])), out=indptr[1:])
+            counts.append(count.astype(np.int64))
+            words.append(keys & KEY_MASK)
+            offsets.append(indptr)
+            node = np.full(len(ids), -1, dtype=np.int64)
+            node[ends] = inverse.reshape(-1)
+        return cls(vocab, order, counts, words, offsets)
+
+    def __len__(self):
+        return sum(len(c) for c in self.counts)
+
+    @property
+    def unigram(self):
+        """Unigram counts indexed by word ID."""
+        return self.counts[0]
+
+    def nbytes(self):
+        """Return the number of bytes of the trie arrays."""
+        return sum(a.nbytes for a in self.counts + self.words[1:] + self.offsets)
+
+    def parents(self, j):
+        """Return the parent entry (in level j - 1) of every entry of level j."""
+        return np.repeat(np.arange(len(self.counts[j - 1]), dtype=np.int64), np.diff(self.offsets[j - 1].astype(np.int64)))
+
+    def ngrams(self, j):
+        """Return the (len(level j), j + 1) array of the word IDs of every (j + 1)-gram, in order."""
+        result = np.zeros((len(self.counts[j]), j + 1), dtype=np.int64)
+        entry = np.arange(len(self.counts[j]))
+        for i in range(j, 0, -1):
+            result[:, j - i] = self.words[i][entry]
+            entry = self.parents(i)[entry]
+        result[:, j] = entry
+        return result
+
+    def child(self, j, parent, word):
+        """Return the entry of level j extending each parent entry of level j - 1 with word, or -1."""
+        parent = np.asarray(parent, dtype=np.int64)
+        word = np.asarray(word, dtype=np.int64)
+        valid = (parent >= 0) & (word >= 0)
+        safe = np.where(valid, parent, 0)
+        offsets = self.offsets[j - 1]
+        lo = np.where(valid, offsets[safe], 0)
+        hi = np.where(valid, offsets[safe + 1], 0)
+        return search(self.words[j], lo, hi, word)
+
+    def find(self, ngrams):
+        """Return the entry of each n-gram (rows of an (M, j + 1) array of word IDs) in level j, or -1."""
+        ngrams = np.asarray(ngrams, dtype=np.int64)
+        entry = ngrams[:, -1]
+        for j in range(1, ngrams.shape[1]):
+            entry = self.child(j, entry, ngrams[:, -1 - j])
+        return entry
+
+    def walk(self, ids, lengths):
+        """Return the (len(ids), order) array of the entries of the n-grams ending at each position.
+
+        ids is a stream of word IDs (-1 for unknown words) and lengths[i] the number of words of
+        history available at position i (counting the word itself). Column j holds the entry in
+        level j of the (j + 1)-gram ending at position i, or -1 if it was never seen or is longer
+        than lengths[i].
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.arange(len(ids))
+        entries = np.full((len(ids), self.order), -1, dtype=np.int64)
+        entries[:, 0] = ids
+        for j in range(1, self.order):
+            available = j < lengths
+            entries[:, j] = self.child(j, np.where(available, entries[:, j - 1], -1),
+                                       np.where(available, ids[np.maximum(positions - j, 0)], -1))
+        return entries
+
+    def select(self, keep):
+        """Return the trie of the entries of each level j where keep[j] is set (with every unigram).
+
+        The parent of every kept entry must be kept as well.
+        """
+        counts, words, offsets = [self.counts[0]], [None], []
+        for j in range(1, self.order):
+
+            # Renumber the kept parents and rebuild the indptr of their kept children
+            index = np.cumsum(keep[j - 1]) - 1
+            parent = index[self.parents(j)[keep[j]]]
+            indptr = np.zeros(int(np.count_nonzero(keep[j - 1])) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(parent, minlength=len(indptr) - 1), out=indptr[1:])
+            counts.append(self.counts[j][keep[j]])
+            words.append(self.words[j][keep[j]])
+            offsets.append(indptr)
+        return NgramCounts(self.vocab, self.order, counts, words, offsets)
+
+    def merge(self, other):
+        """Return the counts of this table plus other (other's words are added after this table's)."""
+
+        # Extend the vocabulary with other's words and map other's IDs onto it
+        vocab = Vocabulary.from_words(self.vocab.words)
+        remap = np.array([START_OF_SENTENCE, END_OF_SENTENCE] + vocab.encode(other.vocab.words[2:]), dtype=np.int64)
+        V = len(vocab)
+
+        # Add the unigram counts
+        unigram = np.zeros(V, dtype=np.int64)
+        unigram[:len(self.unigram)] += self.unigram
+        unigram[remap] += other.unigram
+
+        # Merge each level, re-keying both tables' entries by their merged parents and words
+        counts, words, offsets = [unigram], [None], []
+        selfMap, otherMap = np.arange(len(self.unigram)), remap
+        for j in range(1, self.order):
+            selfKeys = (selfMap[self.parents(j)] << KEY_SHIFT) | self.words[j]
+            otherKeys = (otherMap[other.parents(j)] << KEY_SHIFT) | remap[other.words[j]]
+            order = np.argsort(otherKeys, kind="stable")
+            keys, count = merge_keys(selfKeys, self.counts[j].astype(np.int64),
+                                     otherKeys[order], other.counts[j][order].astype(np.int64))
+            indptr = np.zeros(len(counts[j - 1]) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys >> KEY_SHIFT, minlength=len(counts[j - 1])), out=indptr[1:])
+            counts.append(count)
+            words.append(keys & KEY_MASK)
+            offsets.append(indptr)
+            selfMap, otherMap = np.searchsorted(keys, selfKeys), np.searchsorted(keys, otherKeys)
+        return NgramCounts(vocab, self.order, counts, words, offsets)
+
+
+class NgramCounter:
+    """Accumulates the counts of every n-gram up to order of tokenized sentences into an NgramCounts."""
+
+    def __init__(self, order, vocab=None, chunk_size=1 << 20):
+        self.order = order
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self.chunk_size = chunk_size
+
+        # Buffer of word IDs (with <s> and </s> around each sentence) waiting to be counted, and
+        # the tries of the counted chunks as (number of chunks, trie), merged like a binary
+        # counter (see BigramCounter._flush)
+        self._buffer = []
+        self._tables = []
+
+    def add_sentence(self, tokens):
+        """Add the sentence (list of words) to the counts."""
+        self._buffer.append(START_OF_SENTENCE)
+        self._buffer.extend(self.vocab.encode(tokens))
+        self._buffer.append(END_OF_SENTENCE)
+
+        # Count the buffered IDs once the chunk is full
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer and self._tables:
+            return
+        self._tables.append((1, NgramCounts.from_ids(self.vocab, self._buffer, self.order)))
+        self._buffer = []
+        while len(self._tables) > 1 and self._tables[-2][0] <= self._tables[-1][0]:
+            (n, b), (m, a) = self._tables.pop(), self._tables.pop()
+            self._tables.append((m + n, a.merge(b)))
+
+    def counts(self):
+        """Count any buffered sentences and return the resulting NgramCounts."""
+        self._flush()
+        counts = merge_all([table for _, table in self._tables])
+        self._tables = [(sum(n for n, _ in self._tables), counts)]
+        counts.vocab = self.vocab
+        return counts
+
+
+def count_shard(path, start, end, lower, order=None):
+    """Count the sentences of the corpus at path that start within the byte range [start, end)."""
+    counter = BigramCounter() if order is None else NgramCounter(order)
+    for tokens in read_shard(path, start, end, lower):
+        counter.add_sentence(words_of(tokens))
+    return counter.counts()
+
+
+def merge_all(tables):
+    """Merge a list of count tables (in order) with a pairwise tree reduction."""
+    while len(tables) > 1:
+        merged = [a.merge(b) for a, b in zip(tables[0::2], tables[1::2])]
+        if len(tables) % 2 == 1:
+            merged.append(tables[-1])
+        tables = merged
+    return tables[0]
+
+
+def count_corpus(path, jobs=1, lower=True, order=None):
+    """Count the word portions of the word_pos patterns of the corpus at path.
+
+    Bigrams are counted into a BigramCounts, or every n-gram up to order into an NgramCounts. With
+    jobs > 1 the corpus is split into one byte-range shard per process and the partial tables
+    are merged; the result is identical to counting serially. Compressed corpora cannot be split
+    by byte range, so they are always counted serially.
+    """
+    if jobs <= 1 or is_compressed(path):
+        counter = BigramCounter() if order is None else NgramCounter(order)
+        for tokens in read_sentences(path, lower):
+            counter.add_sentence(words_of(tokens))
+        return counter.counts()
+
+    # Count each shard in a separate process and merge the partial tables in corpus order
+    shards = [(path, start, end, lower, order) for start, end in shard_ranges(path, jobs)]
+    with multiprocessing.Pool(jobs) as pool:
+        tables = pool.starmap(count_shard, shards)
+    return merge_all(tables)
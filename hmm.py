@@ -0,0 +1,543 @@
+"""
+hmm.py
+    Description:
+        Hidden markov model (HMM) shared by the taggers, stored as a model bundle of raw NumPy
+        arrays plus string tables (see model_file.py).
+
+        The bundle holds log probabilities so that it can be memory-mapped and used as is:
+            log_transition  - (N + 1) x N array where row 0 is log P(tag | <s>) and row i + 1 is
+                              log P(tag | tags[i])
+            log_emission    - |observations| x N array of log P(observation | tag) (one contiguous
+                              row per observation)
+            log_final       - (optional) N array of log P(</s> | tag), added at the end of each
+                              sentence (tagging.py's models have it, converted pickles do not)
+            tag_indptr,     - tag dictionary: CSR table with one row per observation listing its
+            tag_indices,      candidate tags (the tags with a nonzero emission, in increasing
+            tag_logp          order) and their log emissions
+            unknown_*       - (optional) unknown-word model (suffix trie and shape classes, see
+                              unknown.py)
+            count_*         - (optional) the counts the probabilities were estimated from (see
+                              tagging.py), so that new sentences can be folded into the model
+            tags            - string table of the N tags
+            observations    - string table of the observations
+
+        Observations are looked up through a word -> index hash map built when the HMM is created,
+        and words that are not observations map to an unknown-word bucket: either an observation
+        chosen as the bucket (e.g. "<unk>"), the class of the word in the HMM's unknown-word model
+        (encoded as len(observations) + class) or, without either, an emission of log 1 for every
+        tag so that only the transitions decide the tag.
+
+        Many sentences can be decoded at once with HMM.decode_many(): sentences are bucketed by
+        length and each bucket runs the Viterbi recursion over a (batch, N, N) array per time step,
+        so there is no Python-level work per sentence inside the recursion.
+
+        When most transitions have probability 0 (e.g. fine-grained tagsets of several hundred tags),
+        the sparse decoder is used instead: the nonzero transitions are kept as a CSR table over
+        the destination tag and each time step only visits the nonzero transitions into tags that
+        can emit the current word. The decoder is selected from the density of the transitions.
+
+        With the tag dictionary decoder, each position only visits the candidate tags of its
+        observation, so the work per token is the product of the sizes of the ambiguity classes of
+        neighbouring words instead of N x N.
+
+        TrigramHMM is a second-order HMM: its transitions are a dense (N + 1) x (N + 1) x (N + 1)
+        array of log P(tag | previous previous tag, previous tag) (index N is <s> in the histories
+        and </s> as the next tag). It is decoded over states that are pairs of tags, restricted to
+        the candidate tags of each word, so time is the product of three neighbouring ambiguity
+        classes per word and memory stays O(T x N^2).
+
+        For bounded work per token, beam search can be used instead of exact search: only the best
+        beam states (and/or the states within threshold of the best log probability) of each
+        position are extended to the next one.
+
+        Loading a bundle never unpickles anything. HMM.from_pickles() converts the A.pkl, B.pkl,
+        tags.pkl and observations.pkl files used by earlier versions of viterbi.py (only convert
+        pickle files from a trusted source).
+
+    Imports:
+        os          - Used for building the paths of the pickle files
+        pickle      - Used for converting the old pickle files
+        numpy       - Used for the probability arrays
+        scoring     - Used for converting probabilities to log probabilities
+        model_file  - Used for saving and loading model bundles
+        unknown     - Used for the emissions of unknown words
+"""
+import os
+import pickle
+import numpy as np
+
+from scoring import log
+from model_file import save_bundle, load_bundle
+from unknown import UnknownWordModel
+
+# Default location of the HMM model bundle
+HMM_BUNDLE = "hmm"
+
+# The sparse decoder is used when at most this fraction of the transitions is nonzero
+SPARSE_DENSITY = 0.25
+
+
+def viterbi_batch(A, E, lengths, final=None):
+    """Run the Viterbi algorithm on a padded batch of sentences.
+
+    A is the (N + 1) x N log transition array, E the (batch, T, N) log emissions of the sentences
+    padded to the same length T, lengths the real length of each sentence (at least 1) and final
+    (if given) the log transitions to </s>. Returns the (batch, T) best tag paths (padding
+    positions are 0) and the best log probabilities.
+    """
+    batch, T, N = E.shape
+    rows = np.arange(batch)
+    transition = np.asarray(A[1:])
+
+    # Initialization step for viterbi and for back trace
+    v = A[0] + E[:, 0]
+    bt = np.zeros((batch, T, N), dtype=np.int32)
+
+    # Loop through time steps, computing v * A * B (as a sum of log probabilities) for the whole
+    # batch as a (batch, previous tag, tag) array
+    for t in range(1, T):
+        vAB = v[:, :, None] + transition
+        bt[:, t] = np.argmax(vAB, axis=1)
+        vNext = np.take_along_axis(vAB, bt[:, t, None, :], axis=1)[:, 0] + E[:, t]
+
+        # Sentences that have already ended keep their final values
+        v = np.where((t < lengths)[:, None], vNext, v)
+
+    # Add the transitions to </s>, then determine best score and last tag corresponding to it
+    if final is not None:
+        v = v + final
+    best_score = np.max(v, axis=1)
+    tag = np.argmax(v, axis=1)
+
+    # Follow the back trace of every sentence from its own last position
+    path = np.zeros((batch, T), dtype=np.int64)
+    path[rows, lengths - 1] = tag
+    for t in range(T - 1, 0, -1):
+        active = t < lengths
+        tag = np.where(active, bt[rows, t, tag], tag)
+        path[active, t - 1] = tag[active]
+    return path, best_score
+
+
+def viterbi_sparse(initial, transition, E, final=None):
+    """Run the Viterbi algorithm on one sentence using only the nonzero transitions.
+
+    initial is log P(tag | <s>), transition is the (indptr, indices, log probability) CSR table of
+    the nonzero transitions with one row per destination tag (listing its previous tags in
+    increasing order), E the T x N log emissions of the sentence (T at least 1) and final (if
+    given) the log transitions to </s>. Returns the best tag path and its log probability.
+    """
+    indptr, indices, logp = transition
+    T, N = E.shape
+
+    # Initialization step for viterbi and for back trace
+    v = initial + E[0]
+    bt = np.zeros((T, N), dtype=np.int32)
+
+    for t in range(1, T):
+
+        # Only visit tags that can emit the current word and have at least one nonzero transition
+        tags = np.flatnonzero(E[t] > -np.inf)
+        starts = indptr[tags]
+        nEdges = indptr[tags + 1] - starts
+        tags, starts, nEdges = tags[nEdges > 0], starts[nEdges > 0], nEdges[nEdges > 0]
+        vNext = np.full(N, -np.inf)
+        if len(tags) > 0:
+
+            # Calculate v * A for the nonzero transitions into each visited tag (one segment per tag)
+            offsets = np.cumsum(nEdges) - nEdges
+            edges = np.arange(nEdges.sum()) - np.repeat(offsets - starts, nEdges)
+            vA = v[indices[edges]] + logp[edges]
+
+            # Get the max of each segment and the first transition reaching it
+            best = np.maximum.reduceat(vA, offsets)
+            positions = np.where(vA == np.repeat(best, nEdges), np.arange(len(vA)), len(vA))
+            first = np.minimum.reduceat(positions, offsets)
+            vNext[tags] = best + E[t, tags]
+            bt[t, tags] = indices[edges[first]]
+        v = vNext
+
+    # Add the transitions to </s>, then determine best score and follow the back trace
+    if final is not None:
+        v = v + final
+    best_score = np.max(v)
+    path = np.zeros(T, dtype=np.int64)
+    path[T - 1] = np.argmax(v)
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = bt[t, path[t]]
+    return path, float(best_score)
+
+
+def viterbi_candidates(initial, A, candidates, final=None):
+    """Run the Viterbi algorithm on one sentence, visiting only the candidate tags of each position.
+
+    A is the (N + 1) x N log transition array and candidates a list (one per position, at least
+    one) of (tag IDs in increasing order, log emissions of those tags). final (if given) is the
+    log transitions to </s>. Returns the best tag path and its log probability.
+    """
+    transition = np.asarray(A[1:])
+
+    # Initialization step for viterbi and for back trace (indices into the previous candidates)
+    prevTags, logp = candidates[0]
+    v = initial[prevTags] + logp
+    bt = [None] * len(candidates)
+
+    # Loop through positions, computing v * A * B over (previous candidate, candidate) pairs only
+    for t in range(1, len(candidates)):
+        tags, logp = candidates[t]
+        vA = v[:, None] + transition[prevTags[:, None], tags]
+        bt[t] = np.argmax(vA, axis=0)
+        v = vA[bt[t], np.arange(len(tags))] + logp
+        prevTags = tags
+
+    # Add the transitions to </s>, then determine best score and follow the back trace
+    if final is not None:
+        v = v + final[prevTags]
+    best = int(np.argmax(v))
+    best_score = v[best]
+    path = np.zeros(len(candidates), dtype=np.int64)
+    for t in range(len(candidates) - 1, 0, -1):
+        path[t] = candidates[t][0][best]
+        best = bt[t][best]
+    path[0] = candidates[0][0][best]
+    return path, float(best_score)
+
+
+def viterbi_trigram(A, candidates):
+    """Run the second-order Viterbi algorithm on one sentence over pairs of candidate tags.
+
+    A is the (N + 1) x (N + 1) x (N + 1) log P(tag | previous previous tag, previous tag) array
+    (index N is <s> in the histories and </s> as the next tag) and candidates a list (one per
+    position, at least one) of (tag IDs, log emissions of those tags). Returns the best tag path
+    and its log probability.
+    """
+    N = A.shape[0] - 1
+    T = len(candidates)
+
+    # Initialization step for viterbi (states are (previous candidate, candidate) pairs, with <s>
+    # as the only previous tag of the first word) and for back trace
+    prevTags = np.array([N])
+    tags, logp = candidates[0]
+    v = (A[N, N, tags] + logp)[None, :]
+    bt = [None] * T
+
+    # Loop through positions, computing v * A * B over (previous candidate, candidate, next
+    # candidate) triples and keeping the best previous candidate of each (candidate, next) pair
+    for t in range(1, T):
+        nextTags, logp = candidates[t]
+        vA = v[:, :, None] + A[prevTags[:, None, None], tags[None, :, None], nextTags[None, None, :]]
+        bt[t] = np.argmax(vA, axis=0)
+        v = np.take_along_axis(vA, bt[t][None], axis=0)[0] + logp
+        prevTags, tags = tags, nextTags
+
+    # Add the transitions to </s>, then determine best score and the best final pair of tags
+    v = v + A[prevTags[:, None], tags[None, :], N]
+    i, j = np.unravel_index(np.argmax(v), v.shape)
+    best_score = v[i, j]
+
+    # Follow the back trace of (previous candidate, candidate) pairs
+    path = np.zeros(T, dtype=np.int64)
+    path[T - 1] = candidates[T - 1][0][j]
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = candidates[t - 1][0][i]
+        if t > 1:
+            i, j = bt[t][i, j], i
+    return path, float(best_score)
+
+
+def viterbi_beam(initial, A, E, beam=None, threshold=None, final=None):
+    """Run beam search on one sentence, extending only the best states of each position.
+
+    At most beam states (if beam is given) whose log probability is within threshold of the best
+    (if threshold is given) are kept at each position. A is the (N + 1) x N log transition
+    array, E the T x N log emissions of the sentence (T at least 1) and final (if given) the log
+    transitions to </s>. Returns the best tag path found and its log probability.
+    """
+    T, N = E.shape
+    transition = np.asarray(A[1:])
+
+    # Initialization step for viterbi and for back trace
+    v = initial + E[0]
+    bt = np.zeros((T, N), dtype=np.int32)
+
+    for t in range(1, T):
+
+        # Keep the states within threshold of the best, then the best beam of those (in tag order
+        # so ties are broken like exact viterbi)
+        keep = np.flatnonzero(v > -np.inf)
+        if threshold is not None:
+            keep = keep[v[keep] >= np.max(v) - threshold]
+        if beam is not None and len(keep) > beam:
+            keep = np.sort(keep[np.argsort(-v[keep], kind="stable")[:beam]])
+        if len(keep) == 0:
+            keep = np.array([0])
+
+        # Calculate v * A * B from the kept states only
+        vA = v[keep][:, None] + transition[keep]
+        best = np.argmax(vA, axis=0)
+        v = vA[best, np.arange(N)] + E[t]
+        bt[t] = keep[best]
+
+    # Add the transitions to </s>, then determine best score and follow the back trace
+    if final is not None:
+        v = v + final
+    best_score = np.max(v)
+    path = np.zeros(T, dtype=np.int64)
+    path[T - 1] = np.argmax(v)
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = bt[t, path[t]]
+    return path, float(best_score)
+
+
+class HMM:
+    """First-order HMM with log transition and emission arrays indexed by tag/observation ID."""
+
+    def __init__(self, tags, observations, log_transition, log_emission, unknown=None, sparse=None, log_final=None,
+                 tag_dictionary=None, unknown_model=None, counts=None):
+        self.tags = tags
+        self.observations = observations
+        self.log_transition = log_transition
+        self.log_emission = log_emission
+        self.log_final = log_final
+
+        # Count arrays the probabilities were estimated from (dict of name -> array, or None)
+        self.counts = counts
+
+        # Use the sparse decoder (None = decide from the density of the transitions)
+        self.sparse = sparse
+        self._sparse_transition = None
+
+        # Use the tag dictionary decoder (only visiting the candidate tags of each observation)
+        self.use_tag_dictionary = False
+        self._tag_dictionary = tag_dictionary
+
+        # Beam search settings (exact search if both are None)
+        self.beam = None
+        self.threshold = None
+
+        # Hash index of observation -> row of log_emission
+        self.observation_index = dict(zip(observations, range(len(observations))))
+
+        # Index of the unknown-word bucket (-1 = use the unknown-word model if there is one, or no
+        # emission evidence for unknown words)
+        self.unknown = -1
+        self.unknown_model = unknown_model
+        if unknown is not None:
+            self.set_unknown(unknown)
+
+    def set_unknown(self, observation):
+        """Use the observation as the bucket for unknown words (None for no emission evidence)."""
+        if observation is None:
+            self.unknown = -1
+        elif observation in self.observation_index:
+            self.unknown = self.observation_index[observation]
+        else:
+            raise ValueError("Unknown-word bucket " + observation + " is not an observation of the HMM")
+
+    def encode(self, words):
+        """Return the observation index of each word (unknown words map to the unknown-word bucket)."""
+        get = self.observation_index.get
+        unknown = self.unknown
+        if unknown < 0 and self.unknown_model is not None:
+            index = self.observation_index
+            V = len(self.observations)
+            class_of = self.unknown_model.class_of
+            return np.array([index[word] if word in index else V + class_of(word) for word in words], dtype=np.int64)
+        return np.array([get(word, unknown) for word in words], dtype=np.int64)
+
+    def emissions(self, o):
+        """Return the T x N array of log P(o[t] | tag), with rows of 0 for o[t] = -1."""
+        o = np.asarray(o)
+        V = len(self.observations)
+        E = np.zeros((len(o), len(self.tags)))
+        known = (o >= 0) & (o < V)
+        E[known] = np.asarray(self.log_emission)[o[known]]
+        unknown = o >= V
+        if unknown.any():
+            E[unknown] = self.unknown_model.log_emission(o[unknown] - V)
+        return E
+
+    def tag_dictionary(self):
+        """Return the (indptr, indices, log emission) CSR table of the candidate tags of each observation."""
+        if self._tag_dictionary is None:
+            logEmission = np.asarray(self.log_emission)
+            observation, tag = np.nonzero(logEmission > -np.inf)
+            indptr = np.zeros(len(self.observations) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(observation, minlength=len(self.observations)), out=indptr[1:])
+            self._tag_dictionary = (indptr, tag.astype(np.int32), logEmission[observation, tag])
+        return self._tag_dictionary
+
+    def candidates(self, o):
+        """Return (candidate tag IDs, log emissions) for each observation index of o.
+
+        Observation -1 (and any observation that no tag emits) has every tag as a candidate, and
+        unknown-word classes have the tags their emissions allow.
+        """
+        indptr, indices, logp = self.tag_dictionary()
+        V = len(self.observations)
+        N = len(self.tags)
+        allTags = np.arange(N)
+        result = []
+        for i in o:
+            if i < 0:
+                result.append((allTags, np.zeros(N)))
+            elif i >= V:
+                row = self.unknown_model.log_emission([i - V])[0]
+                tags = np.flatnonzero(row > -np.inf)
+                result.append((tags, row[tags]) if len(tags) > 0 else (allTags, row))
+            elif indptr[i] == indptr[i + 1]:
+                result.append((allTags, np.asarray(self.log_emission[i])))
+            else:
+                result.append((indices[indptr[i]:indptr[i + 1]], logp[indptr[i]:indptr[i + 1]]))
+        return result
+
+    @classmethod
+    def from_pickles(cls, directory="."):
+        """Convert A.pkl, B.pkl, tags.pkl and observations.pkl in directory to an HMM."""
+        def unpickle(name):
+            with open(os.path.join(directory, name), "rb") as f:
+                return pickle.load(f)
+
+        # B is stored as tags x observations, the bundle keeps it as observations x tags
+        A = np.asarray(unpickle("A.pkl"), dtype=np.float64)
+        B = np.asarray(unpickle("B.pkl"), dtype=np.float64)
+        return cls(list(unpickle("tags.pkl")), list(unpickle("observations.pkl")),
+                   log(A), np.ascontiguousarray(log(B).T))
+
+    def save(self, path):
+        """Write the HMM as a model bundle to the directory path."""
+        arrays = {"log_transition": self.log_transition, "log_emission": self.log_emission}
+        if self.log_final is not None:
+            arrays["log_final"] = self.log_final
+        arrays["tag_indptr"], arrays["tag_indices"], arrays["tag_logp"] = self.tag_dictionary()
+        if self.unknown_model is not None:
+            arrays.update(self.unknown_model.arrays())
+        if self.counts is not None:
+            arrays.update({"count_" + name: array for name, array in self.counts.items()})
+        save_bundle(path, "hmm", dict(), arrays, {"tags": self.tags, "observations": self.observations})
+
+    def density(self):
+        """Return the fraction of transitions between tags that are nonzero."""
+        return np.count_nonzero(np.asarray(self.log_transition[1:]) > -np.inf) / len(self.tags) ** 2
+
+    def use_sparse(self):
+        """Return True if sentences are decoded with the sparse decoder."""
+        if self.sparse is None:
+            self.sparse = self.density() <= SPARSE_DENSITY
+        return self.sparse
+
+    def sparse_transition(self):
+        """Return the CSR table of the nonzero transitions with one row per destination tag."""
+        if self._sparse_transition is None:
+            toTag, fromTag = np.nonzero(np.asarray(self.log_transition[1:]).T > -np.inf)
+            indptr = np.zeros(len(self.tags) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(toTag, minlength=len(self.tags)), out=indptr[1:])
+            self._sparse_transition = (indptr, fromTag, np.asarray(self.log_transition)[fromTag + 1, toTag])
+        return self._sparse_transition
+
+    def decode(self, o):
+        """Return (tag index path, log probability) of one sentence (array of observation indices)."""
+        return next(self.decode_many([o]))
+
+    def decode_many(self, sentences, batch_size=256, window=16):
+        """Yield (tag index path, log probability) for each sentence (array of observation indices).
+
+        Up to batch_size * window sentences are read at a time, sorted by length and decoded
+        batch_size at a time, so padding is small; results are yielded in the original order.
+        With sparse transitions or the tag dictionary decoder each sentence is decoded by that
+        decoder instead, and with beam search settings each sentence is decoded by beam search.
+        """
+        if self.beam is not None or self.threshold is not None:
+            for o in sentences:
+                if len(o) == 0:
+                    yield np.zeros(0, dtype=np.int64), 0.0
+                else:
+                    yield viterbi_beam(np.asarray(self.log_transition[0]), self.log_transition,
+                                       self.emissions(o), self.beam, self.threshold, self.log_final)
+            return
+
+        if self.use_tag_dictionary:
+            initial = np.asarray(self.log_transition[0])
+            for o in sentences:
+                if len(o) == 0:
+                    yield np.zeros(0, dtype=np.int64), 0.0
+                else:
+                    yield viterbi_candidates(initial, self.log_transition, self.candidates(o), self.log_final)
+            return
+
+        if self.use_sparse():
+            initial = np.asarray(self.log_transition[0])
+            for o in sentences:
+                if len(o) == 0:
+                    yield np.zeros(0, dtype=np.int64), 0.0
+                else:
+                    yield viterbi_sparse(initial, self.sparse_transition(), self.emissions(o), self.log_final)
+            return
+
+        sentences = iter(sentences)
+        while True:
+            chunk = [np.asarray(o) for _, o in zip(range(batch_size * window), sentences)]
+            if not chunk:
+                return
+            results = [None] * len(chunk)
+
+            # Bucket the sentences by length (empty sentences have an empty path)
+            order = sorted((i for i in range(len(chunk)) if len(chunk[i]) > 0), key=lambda i: len(chunk[i]))
+            for i in range(len(chunk)):
+                if len(chunk[i]) == 0:
+                    results[i] = (np.zeros(0, dtype=np.int64), 0.0)
+
+            # Decode each bucket as one padded batch
+            for start in range(0, len(order), batch_size):
+                bucket = order[start:start + batch_size]
+                lengths = np.array([len(chunk[i]) for i in bucket])
+                E = np.zeros((len(bucket), lengths.max(), len(self.tags)))
+                for row, i in enumerate(bucket):
+                    E[row, :lengths[row]] = self.emissions(chunk[i])
+                path, score = viterbi_batch(self.log_transition, E, lengths, self.log_final)
+                for row, i in enumerate(bucket):
+                    results[i] = (path[row, :lengths[row]], float(score[row]))
+            yield from results
+
+    @classmethod
+    def load(cls, path=HMM_BUNDLE, mmap=True, unknown=None, sparse=None):
+        """Load an HMM model bundle, memory-mapping its arrays (zero-copy)."""
+        _, arrays, strings = load_bundle(path, "hmm", mmap)
+
+        # Bundles written before the tag dictionary was stored rebuild it when it is first used
+        tagDictionary = None
+        if "tag_indptr" in arrays:
+            tagDictionary = (arrays["tag_indptr"], arrays["tag_indices"], arrays["tag_logp"])
+        counts = {name[len("count_"):]: array for name, array in arrays.items() if name.startswith("count_")}
+        return cls(strings["tags"], strings["observations"], arrays["log_transition"], arrays["log_emission"],
+                   unknown, sparse, arrays.get("log_final"), tagDictionary, UnknownWordModel.from_arrays(arrays),
+                   counts or None)
+
+
+class TrigramHMM(HMM):
+    """Second-order HMM with a log trigram transition array (see viterbi_trigram).
+
+    The emissions, tag dictionary and unknown-word model are those of HMM. Sentences are always
+    decoded with the second-order tag dictionary decoder (beam search settings are ignored).
+    """
+
+    def __init__(self, tags, observations, log_trigram, log_emission, unknown=None, unknown_model=None):
+        super().__init__(tags, observations, None, log_emission, unknown, unknown_model=unknown_model)
+        self.log_trigram = log_trigram
+
+    def decode_many(self, sentences, batch_size=256, window=16):
+        """Yield (tag index path, log probability) for each sentence (array of observation indices)."""
+        for o in sentences:
+            if len(o) == 0:
+                yield np.zeros(0, dtype=np.int64), 0.0
+            else:
+                yield viterbi_trigram(self.log_trigram, self.candidates(o))
+
+
+def tag_results(hmm, sentences):
+    """Return the tags and log probability of the best path of each sentence (a string) as dicts."""
+    sentences = [sentence.split() for sentence in sentences]
+    tags = hmm.tags
+    return [{"tagged": " ".join(w + "_" + tags[t] for w, t in zip(words, path)), "tags": [tags[t] for t in path],
+             "log_prob": float(logProb)}
+            for words, (path, logProb) in zip(sentences, hmm.decode_many(hmm.encode(words) for words in sentences))]
@@ -0,0 +1,107 @@
+"""
+model_file.py
+    Description:
+        Reads and writes trained models as a directory of raw NumPy .npy segments so that a model
+        can be loaded without retraining.
+
+        A model directory holds:
+            model.json      - the kind of model, the format version, the names of the segments
+                              and any scalar parameters
+            <name>.npy      - one file per array (loaded with np.load(mmap_mode="r"), so loading
+                              only maps the files and their pages are shared between processes)
+            <name>.txt      - one file per string table (e.g. the vocabulary), one string per line
+
+        Arrays are always loaded with allow_pickle=False, so loading a model never executes code.
+
+        A bundle is written to a hidden sibling directory that then replaces the model directory
+        (renamed out of the way and deleted), so saving over a model that other processes have
+        memory-mapped (e.g. a running server) never changes the files they mapped: they keep the
+        old model, unlinked, until they load the new one.
+
+    Imports:
+        os      - Used for building the paths of the segments and replacing the model directory
+        json    - Used for the model.json header
+        shutil  - Used for deleting the replaced model directory
+        numpy   - Used for saving and memory-mapping the arrays
+"""
+import os
+import json
+import shutil
+import numpy as np
+
+# Version of the model directory format
+FORMAT_VERSION = 1
+
+
+def save_bundle(path, kind, meta, arrays, strings):
+    """Write the arrays (dict of name -> array), string tables and metadata to the directory path.
+
+    An existing model directory at path is replaced (see the module description); any other
+    non-empty directory raises a ValueError instead of being deleted.
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path) and os.listdir(path) and not os.path.exists(os.path.join(path, "model.json")):
+        raise ValueError(path + " is not a model directory (it has no model.json); save the model to a new directory")
+    parent, base = os.path.split(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, "." + base + ".saving-" + str(os.getpid()))
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.mkdir(staging)
+    try:
+
+        # Write one .npy segment per array and one text file per string table
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, name + ".npy"), np.asarray(array), allow_pickle=False)
+        for name, table in strings.items():
+            with open(os.path.join(staging, name + ".txt"), "w", encoding="utf-8", newline="\n") as f:
+                f.write("\n".join(table))
+        header = {"kind": kind, "version": FORMAT_VERSION, "meta": meta,
+                  "arrays": sorted(arrays), "strings": sorted(strings)}
+        with open(os.path.join(staging, "model.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=1)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Move the previous model out of the way and the complete new one into place (in between,
+    # path briefly does not exist, so a reader fails instead of seeing a partial model)
+    if not os.path.exists(path):
+        os.rename(staging, path)
+        return
+    previous = os.path.join(parent, "." + base + ".replaced-" + str(os.getpid()))
+    if os.path.exists(previous):
+        shutil.rmtree(previous)
+    os.rename(path, previous)
+    os.rename(staging, path)
+    shutil.rmtree(previous)
+
+
+def bundle_kind(path):
+    """Return the kind of model stored in the model directory path."""
+    with open(os.path.join(path, "model.json"), encoding="utf-8") as f:
+        return json.load(f).get("kind")
+
+
+def bundle_nbytes(path):
+    """Return the number of bytes of the files of the model directory path."""
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def load_bundle(path, kind, mmap=True):
+    """Return (meta, arrays, strings) of the model directory path, memory-mapping the arrays."""
+    with open(os.path.join(path, "model.json"), encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("kind") != kind or header.get("version") != FORMAT_VERSION:
+        raise ValueError(path + " is not a version " + str(FORMAT_VERSION) + " " + kind + " model")
+
+    # Map the arrays and read the string tables
+    arrays = dict()
+    for name in header["arrays"]:
+        arrays[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+    strings = dict()
+    for name in header["strings"]:
+        with open(os.path.join(path, name + ".txt"), encoding="utf-8", newline="\n") as f:
+            text = f.read()
+        strings[name] = text.split("\n") if text else []
+    return header["meta"], arrays, strings
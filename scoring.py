@@ -0,0 +1,42 @@
+"""
+scoring.py
+    Description:
+        Helpers shared by bigram.py, tagging.py and viterbi.py for scoring in log space.
+
+        Multiplying probabilities along a sentence underflows to 0.0 after a few dozen tokens, so
+        the scorers add natural log probabilities instead and report the log probability together
+        with the per-token cross-entropy (in bits) and perplexity.
+
+    Imports:
+        math    - Used for the log/exp conversions
+        numpy   - Used for taking the log of probability arrays
+"""
+import math
+import numpy as np
+
+
+def log(p):
+    """Return the natural log of p (an array or a number), with log(0) = -inf instead of an error."""
+    with np.errstate(divide="ignore"):
+        return np.log(p)
+
+
+def cross_entropy(logProb, n):
+    """Return the cross-entropy in bits per token of n tokens with a total natural log probability."""
+    if n == 0:
+        return 0.0
+    return -logProb / (n * math.log(2))
+
+
+def perplexity(logProb, n):
+    """Return the perplexity of n tokens with a total natural log probability."""
+    if n == 0:
+        return 1.0
+    return math.exp(-logProb / n) if logProb != -math.inf else math.inf
+
+
+def report(logProb, n):
+    """Return the lines reporting the log probability, cross-entropy and perplexity of n tokens."""
+    return ("Log probability = " + str(logProb) +
+            "\nCross-entropy = " + str(cross_entropy(logProb, n)) + " bits per token" +
+            "\nPerplexity = " + str(perplexity(logProb, n)))
@@ -0,0 +1,291 @@
+"""
+server.py
+    Description:
+        Serves a model that stays resident in memory over HTTP, so that requests do not pay for
+        rebuilding or reloading the model the way the one-shot command line programs do. It is
+        used by the serve commands of bigram.py, tagging.py and viterbi.py, which load their model
+        once and give the server a function processing a list of sentences.
+
+        The server is a small HTTP/1.1 implementation on asyncio (no outside services or packages)
+        listening on a TCP port or a Unix socket. Connections are kept alive and requests from all
+        connections are served concurrently. Requests are micro-batched: the sentences of the
+        requests waiting in the queue are collected for at most max_delay seconds (or until
+        max_batch sentences are waiting) and processed by the model in a single batch, off the
+        event loop.
+
+        Endpoints:
+            POST /<route>   - process the sentences of the body, given either as a JSON object
+                              {"sentences": [...]} (with Content-Type: application/json) or as
+                              plain text with one sentence per line; returns {"results": [...]}
+            GET /stats      - request, sentence and batch counters and the p50/p99 latencies (in
+                              milliseconds, over the last LATENCY_WINDOW requests) of each route
+            GET /health     - {"status": "ok"}
+
+    Imports:
+        os          - Used for removing a stale Unix socket
+        sys         - Used to exit with an error message
+        stat        - Used for checking that the path of a stale Unix socket is a socket
+        json        - Used for the request and response bodies
+        time        - Used for measuring request latencies
+        asyncio     - Used for the server, the connections and the micro-batching queue
+        collections - Used for keeping the latencies of the most recent requests
+        numpy       - Used for the latency percentiles
+"""
+import os
+import sys
+import stat
+import json
+import time
+import asyncio
+import collections
+import numpy as np
+
+# Default micro-batching settings (largest batch in sentences and longest wait in seconds)
+MAX_BATCH = 256
+MAX_DELAY = 0.002
+
+# Number of most recent requests the latency percentiles are computed over
+LATENCY_WINDOW = 10000
+
+# Largest accepted request body in bytes
+MAX_BODY = 64 * 1024 * 1024
+
+# Reason phrases of the status codes the server sends
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class LatencyCounter:
+    """Counts the requests and sentences of a route and keeps the latencies of the recent requests."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.requests = 0
+        self.sentences = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=window)
+
+    def record(self, seconds, sentences):
+        """Count a request of the given number of sentences that took seconds to serve."""
+        self.requests += 1
+        self.sentences += sentences
+        self.latencies.append(seconds)
+
+    def snapshot(self):
+        """Return the counters and the p50/p99 latencies in milliseconds as a dict."""
+        stats = {"requests": self.requests, "sentences": self.sentences, "errors": self.errors}
+        if self.latencies:
+            p50, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 99]) * 1000
+            stats.update({"p50_ms": float(p50), "p99_ms": float(p99)})
+        return stats
+
+
+class MicroBatcher:
+    """Queues the sentences of concurrent requests and processes them together in batches.
+
+    process is a function taking a list of sentences and returning the list of their results. It
+    is run in a worker thread, one batch at a time, so the model is never used concurrently.
+    """
+
+    def __init__(self, process, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.batched = 0
+
+    async def submit(self, sentences):
+        """Return the results of sentences once the batch they were queued in is processed."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentences, future))
+        return await future
+
+    async def run(self):
+        """Collect and process batches until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+
+            # Wait for a request, then collect the requests arriving within max_delay (up to
+            # max_batch sentences)
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_delay
+            while size < self.max_batch:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self.queue.get_nowait())
+                size += len(batch[-1][0])
+
+            # Process all the sentences at once and hand each request its slice of the results
+            sentences = [sentence for items, _ in batch for sentence in items]
+            try:
+                results = await loop.run_in_executor(None, self.process, sentences)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched += len(sentences)
+            start = 0
+            for items, future in batch:
+                if not future.done():
+                    future.set_result(results[start:start + len(items)])
+                start += len(items)
+
+
+class ModelServer:
+    """HTTP server answering POST /<route> requests with a micro-batched model function per route."""
+
+    def __init__(self, routes, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+
+        # Functions processing a list of sentences, by route name (the path without the slash)
+        self.routes = routes
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batchers = dict()
+        self.counters = {route: LatencyCounter() for route in routes}
+        self.started = time.time()
+
+    def stats(self):
+        """Return the counters of the server and of each route as a dict."""
+        batches = sum(b.batches for b in self.batchers.values())
+        batched = sum(b.batched for b in self.batchers.values())
+        return {"uptime_s": time.time() - self.started, "batches": batches,
+                "mean_batch_size": batched / batches if batches else 0.0,
+                "routes": {route: counter.snapshot() for route, counter in self.counters.items()}}
+
+    async def respond(self, method, path, headers, body):
+        """Return (status, response object) for a request."""
+        route = path.split("?", 1)[0].strip("/")
+        if route == "health":
+            return 200, {"status": "ok"}
+        if route == "stats":
+            return 200, self.stats()
+        if route not in self.routes:
+            return 404, {"error": "unknown path /" + route}
+        if method != "POST":
+            return 405, {"error": "/" + route + " only accepts POST"}
+
+        # Read the sentences (a JSON object or one sentence per line)
+        start = time.perf_counter()
+        try:
+            text = body.decode("utf-8")
+            if headers.get("content-type", "").startswith("application/json"):
+                sentences = json.loads(text)["sentences"]
+                if not isinstance(sentences, list) or not all(isinstance(s, str) for s in sentences):
+                    raise ValueError("sentences must be a list of strings")
+            else:
+                sentences = text.splitlines()
+        except (ValueError, KeyError, TypeError) as e:
+            self.counters[route].errors += 1
+            return 400, {"error": "bad request body: " + str(e)}
+
+        # Queue the sentences with the other requests of the route
+        try:
+            results = await self.batchers[route].submit(sentences)
+        except Exception as e:
+            self.counters[route].errors += 1
+            return 500, {"error": str(e)}
+        self.counters[route].record(time.perf_counter() - start, len(sentences))
+        return 200, {"results": results}
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection until it is closed."""
+        try:
+            while True:
+
+                # Read the request line and headers
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, path, version = parts
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Read the body and answer the request
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY:
+                    status, result = 413, {"error": "request body is larger than " + str(MAX_BODY) + " bytes"}
+                    keepAlive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, result = await self.respond(method, path, headers, body)
+                    connection = headers.get("connection", "").lower()
+                    keepAlive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+                # Write the response
+                payload = json.dumps(result).encode("utf-8")
+                writer.write(("HTTP/1.1 " + str(status) + " " + REASONS[status] + "\r\n"
+                              "Content-Type: application/json\r\n"
+                              "Content-Length: " + str(len(payload)) + "\r\n"
+                              "Connection: " + ("keep-alive" if keepAlive else "close") + "\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, socket=None, ready=None):
+        """Listen on the Unix socket path socket (or host:port) and serve until cancelled.
+
+        ready is called with the listening server once it accepts connections. A stale Unix socket
+        at socket is removed, but any other file there raises a ValueError.
+        """
+        if socket is not None and os.path.lexists(socket):
+            if not stat.S_ISSOCK(os.lstat(socket).st_mode):
+                raise ValueError(socket + " exists and is not a socket")
+            os.remove(socket)
+        self.batchers = {route: MicroBatcher(process, self.max_batch, self.max_delay) for route, process in self.routes.items()}
+        workers = [asyncio.create_task(batcher.run()) for batcher in self.batchers.values()]
+        if socket is not None:
+            server = await asyncio.start_unix_server(self.handle, path=socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                if ready is not None:
+                    ready(server)
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+def add_server_arguments(parser):
+    """Add the --host, --port, --socket, --max-batch and --max-delay options to parser."""
+    parser.add_argument("--host", default="127.0.0.1", help="address the server listens on")
+    parser.add_argument("--port", type=int, default=8000, help="port the server listens on")
+    parser.add_argument("--socket", metavar="<path>", help="listen on a Unix socket instead of a port")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="largest number of sentences processed in one batch")
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY * 1000, help="longest time in milliseconds a request waits for others to batch with")
+
+
+def serve(routes, args):
+    """Serve routes (dict of route name -> function of a list of sentences) with the parsed server options."""
+    server = ModelServer(routes, max_batch=args.max_batch, max_delay=args.max_delay / 1000)
+    where = args.socket if args.socket is not None else args.host + ":" + str(args.port)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket,
+                                 ready=lambda _: print("Serving /" + ", /".join(routes) + " on " + where, flush=True)))
+    except KeyboardInterrupt:
+        pass
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
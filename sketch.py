@@ -0,0 +1,215 @@
+"""
+sketch.py
+    Description:
+        Approximate bigram counts in a fixed amount of memory, for corpora whose exact bigram
+        tables do not fit in RAM.
+
+        The bigram counts are kept in a Count-Min Sketch: a depth x width table of counters where
+        row r counts every bigram in the column given by its own hash function h_r. The count of a
+        bigram is estimated as the minimum of its depth counters, which never underestimates it.
+        Counts are added with conservative update: a counter is only raised as far as needed for
+        the bigram's estimate to cover its new count, which keeps the estimates much closer to the
+        true counts than plain addition (with the same guarantees).
+
+        With width w and depth d, for a corpus of N bigrams, every estimate exceeds the true count
+        by at most epsilon * N with probability at least 1 - delta, where epsilon = e / w and
+        delta = e^-d. The memory of the table is fixed when the sketch is created (w is chosen
+        from a memory budget); only the vocabulary and the exact unigram counts grow with the
+        corpus.
+
+        Sentences are counted in chunks: the bigrams of a chunk are aggregated first and the
+        conservative update of the whole chunk is one vectorized max-update per row. When bigrams
+        of a chunk share a counter, the counter is raised to the largest of their targets, so the
+        estimates stay upper bounds within the same error bound.
+
+    Imports:
+        math        - Used for the error bounds
+        numpy       - Used for the counter table and the vectorized hashing
+        vocabulary  - Used for interning words as integer IDs
+        counts      - Used for packing bigrams into integer keys
+        corpus      - Used for reading the corpus
+"""
+import math
+import numpy as np
+
+from vocabulary import Vocabulary, START_OF_SENTENCE, END_OF_SENTENCE
+from counts import KEY_SHIFT
+from corpus import read_sentences, words_of
+
+# Default number of rows (hash functions) of the sketch, i.e. delta = e^-4 (about 0.018)
+DEFAULT_DEPTH = 4
+
+# Default memory budget of the counters in bytes
+DEFAULT_MEMORY = 64 << 20
+
+# Multipliers of the size suffixes accepted by parse_size
+SIZE_SUFFIXES = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    """Return the number of bytes of a size such as 4096, 64K, 16M or 2G."""
+    text = text.strip().upper().rstrip("B")
+    suffix = text[-1:] if text[-1:] in SIZE_SUFFIXES else ""
+    try:
+        size = float(text[:len(text) - len(suffix)]) * SIZE_SUFFIXES[suffix]
+    except ValueError:
+        raise ValueError("Incorrect size: " + text)
+    return int(size)
+
+
+def mix(keys, seed):
+    """Return a 64-bit hash of each key (the SplitMix64 finalizer of key ^ seed)."""
+    x = keys.astype(np.uint64) ^ np.uint64(seed)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class CountMinSketch:
+    """Count-Min Sketch with conservative update over non-negative integer keys."""
+
+    def __init__(self, width, depth=DEFAULT_DEPTH, seed=0, table=None, seeds=None):
+        if width < 1 or depth < 1:
+            raise ValueError("The width and depth of a sketch must be at least 1")
+        self.width = width
+        self.depth = depth
+
+        # Counters (one row per hash function) and the seed of each row's hash function
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.uint32)
+        if seeds is None:
+            seeds = np.random.default_rng(seed).integers(0, 1 << 63, size=depth, dtype=np.int64).astype(np.uint64)
+        self.seeds = seeds
+
+    @classmethod
+    def from_memory(cls, memory, depth=DEFAULT_DEPTH, seed=0):
+        """Create the widest sketch of the given depth whose counters fit in memory bytes."""
+        width = memory // (depth * np.dtype(np.uint32).itemsize)
+        if width < 1:
+            raise ValueError("A memory budget of " + str(memory) + " bytes is too small for a sketch of depth " + str(depth))
+        return cls(width, depth, seed)
+
+    @property
+    def epsilon(self):
+        """Relative error bound: estimates exceed the true count by at most epsilon * N."""
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        """Probability that an estimate exceeds the error bound."""
+        return math.exp(-self.depth)
+
+    def nbytes(self):
+        """Return the number of bytes of the counters."""
+        return self.table.nbytes
+
+    def columns(self, keys):
+        """Return the depth x len(keys) array of the column of each key in each row."""
+        keys = np.asarray(keys, dtype=np.int64)
+        return np.stack([(mix(keys, seed) % np.uint64(self.width)).astype(np.int64) for seed in self.seeds.tolist()])
+
+    def query(self, keys):
+        """Return the estimated count of each key (never less than its true count)."""
+        columns = self.columns(keys)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0).astype(np.int64)
+
+    def add(self, keys, counts):
+        """Add counts to distinct keys with conservative update."""
+        if len(keys) == 0:
+            return
+        columns = self.columns(keys)
+        rows = np.arange(self.depth)[:, None]
+        target = self.table[rows, columns].min(axis=0).astype(np.int64) + counts
+
+        # Raise each key's counters to its target (counters shared by keys get the largest target)
+        target = np.minimum(target, np.iinfo(np.uint32).max).astype(np.uint32)
+        for r in range(self.depth):
+            np.maximum.at(self.table[r], columns[r], target)
+
+
+class SketchCounts:
+    """Exact unigram counts and approximate bigram counts (in a CountMinSketch) over word IDs."""
+
+    def __init__(self, vocab, unigram, sketch, total):
+        self.vocab = vocab
+        self.unigram = unigram
+        self.sketch = sketch
+
+        # Number of bigrams counted (N of the error bound)
+        self.total = total
+
+    def count(self, token_ids, prev_ids):
+        """Return the estimated count of each (token, prevToken) pair (0 for unknown words, ID -1)."""
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        prev_ids = np.asarray(prev_ids, dtype=np.int64)
+        known = (token_ids >= 0) & (prev_ids >= 0)
+        estimate = self.sketch.query((prev_ids[known] << KEY_SHIFT) | token_ids[known])
+        count = np.zeros(len(token_ids), dtype=np.int64)
+        count[known] = estimate
+        return count
+
+    def error_bound(self):
+        """Return the largest overestimate of a count that holds with probability 1 - delta."""
+        return self.sketch.epsilon * self.total
+
+    def nbytes(self):
+        """Return the number of bytes of the counters and the unigram counts."""
+        return self.sketch.nbytes() + self.unigram.nbytes
+
+
+class SketchCounter:
+    """Accumulates unigram counts and sketched bigram counts of tokenized sentences into a SketchCounts."""
+
+    def __init__(self, sketch, vocab=None, chunk_size=1 << 20):
+        self.sketch = sketch
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self.chunk_size = chunk_size
+
+        # Buffer of word IDs (with <s> and </s> around each sentence) waiting to be counted, and
+        # the running unigram counts and number of bigrams
+        self._buffer = []
+        self._unigram = np.zeros(len(self.vocab), dtype=np.int64)
+        self._total = 0
+
+    def add_sentence(self, tokens):
+        """Add the sentence (list of words) to the counts."""
+        self._buffer.append(START_OF_SENTENCE)
+        self._buffer.extend(self.vocab.encode(tokens))
+        self._buffer.append(END_OF_SENTENCE)
+
+        # Count the buffered IDs once the chunk is full
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        ids = np.array(self._buffer, dtype=np.int64)
+        self._buffer = []
+
+        # Unigram counts (the array grows as new words are interned)
+        V = len(self.vocab)
+        if len(self._unigram) < V:
+            self._unigram = np.concatenate((self._unigram, np.zeros(V - len(self._unigram), dtype=np.int64)))
+        self._unigram += np.bincount(ids, minlength=V)
+
+        # Aggregate the bigrams that do not cross a sentence boundary and add them to the sketch
+        prev, token = ids[:-1], ids[1:]
+        within = token != START_OF_SENTENCE
+        keys, counts = np.unique((prev[within] << KEY_SHIFT) | token[within], return_counts=True)
+        self.sketch.add(keys, counts)
+        self._total += int(counts.sum())
+
+    def counts(self):
+        """Count any buffered sentences and return the resulting SketchCounts."""
+        self._flush()
+        V = len(self.vocab)
+        unigram = np.concatenate((self._unigram, np.zeros(V - len(self._unigram), dtype=np.int64)))
+        return SketchCounts(self.vocab, unigram, self.sketch, self._total)
+
+
+def count_sketch(path, memory, depth=DEFAULT_DEPTH, lower=True):
+    """Count the word portions of the word_pos patterns of the corpus at path into a sketch of memory bytes."""
+    counter = SketchCounter(CountMinSketch.from_memory(memory, depth))
+    for tokens in read_sentences(path, lower):
+        counter.add_sentence(words_of(tokens))
+    return counter.counts()
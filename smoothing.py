@@ -0,0 +1,576 @@
+"""
+smoothing.py
+    Description:
+        Smoothed bigram probability models built on top of the array-backed count tables.
+
+        The models never materialize the V x V table of every possible bigram. Every model has
+        the same query structure: the probability of an observed bigram is computed from its
+        count when it is queried (with a per-history denominator, or a per-count probability for
+        Good-Turing), and a per-history default array holds the probability of an unseen bigram
+        after each previous word (with one extra entry at the end for unknown previous words, so
+        ID -1 indexes it directly). Scoring a batch of pairs is then a few gathers and a select,
+        whatever the smoothing method.
+
+        New sentences can be folded into a bigram model with update(). Since no per-bigram
+        probabilities are stored, it only recomputes the per-history arrays of the histories the
+        new sentences touch (all V of them if they add a word, since V is in every add-k
+        denominator) and, for Good-Turing, the N_c buckets of the bigrams whose count changed and
+        the per-count probabilities. Its cost is O(new bigrams + V), not O(seen bigrams).
+
+        SketchAddK is add-k smoothing over the approximate counts of a Count-Min Sketch (see
+        sketch.py), which can only be queried pair by pair: seen bigrams cannot be listed, so it
+        has no seen array and queries the sketch for every pair instead.
+
+        The n-gram models (NgramSmoothing) do the same for every level of an NgramCounts trie,
+        storing their probabilities and backoff weights as float32 (4 bytes per n-gram each).
+        They have no update of their own: Kneser-Ney discounts and continuation counts, and the
+        add-k and Jelinek-Mercer probabilities of every level, depend on the whole trie, so they
+        are rebuilt from the merged counts (O(n-grams)).
+
+        The backoff n-gram models (kneser-ney and jelinek-mercer) can be pruned into a smaller
+        model with prune(): n-grams below a count cutoff of their order, or whose removal changes
+        the model the least (relative entropy pruning, Stolcke 1998), are dropped. The kept
+        n-grams keep their probabilities, and the backoff weight of every history is recomputed
+        so that its distribution still sums to 1.
+
+    Imports:
+        numpy       - Used for the probability arrays
+        vocabulary  - Used for the start and end of sentence IDs
+"""
+import numpy as np
+
+from vocabulary import START_OF_SENTENCE, END_OF_SENTENCE
+
+# Smallest probability mass left for backing off (guards the backoff weights against rounding)
+MIN_MASS = 1e-12
+
+
+class BigramSmoothing:
+    """Base class of the smoothing models.
+
+    Subclasses implement seen_probs(), which returns the probabilities of observed bigrams from
+    their positions in the CSR table, and defaults(), which returns the V + 1 per-history
+    probabilities of an unseen bigram (the last one for unknown previous words) stored as default.
+    """
+
+    def probs(self, token_ids, prev_ids):
+        """Return P(token | prevToken) for each pair of word IDs (-1 for unknown words)."""
+        prev_ids = np.asarray(prev_ids)
+        pos = self.counts.find(token_ids, prev_ids)
+        seen = pos >= 0
+        probs = self.default[prev_ids]
+        probs[seen] = self.seen_probs(pos[seen], prev_ids[seen])
+        return probs
+
+    @property
+    def seen(self):
+        """Probabilities of every observed bigram (aligned with the CSR entries), computed on demand."""
+        return self.seen_probs(np.arange(len(self.counts)), self.counts.prev_ids())
+
+    def state(self):
+        """Return the model's parameters (arrays and numbers) as a dict, for saving the model."""
+        return {name: value for name, value in vars(self).items() if name != "counts"}
+
+    @classmethod
+    def restore(cls, counts, state):
+        """Rebuild a model from the counts and the dict returned by state() without recomputing it."""
+        smoothing = cls.__new__(cls)
+        smoothing.counts = counts
+
+        # Models saved before the seen probabilities were computed on demand also stored them
+        vars(smoothing).update({name: value for name, value in state.items() if name != "seen"})
+
+        # Models saved before the default array was stored rebuild it from their parameters
+        if "default" not in state:
+            smoothing.default = smoothing.defaults()
+        return smoothing
+
+    def update(self, counts, delta):
+        """Switch the model to counts, which are its counts plus delta (the counts of new sentences,
+        over the same word IDs), recomputing only the per-history arrays that delta changes."""
+        raise NotImplementedError
+
+
+class Unsmoothed(BigramSmoothing):
+    """No smoothing: P(token | prevToken) = C(prevToken token) / C(prevToken), and 0 if unseen."""
+
+    def __init__(self, counts):
+        self.counts = counts
+
+        # Probability 0 for unknown/unseen instances
+        self.unseen_prob = 0
+        self.default = self.defaults()
+
+    def seen_probs(self, pos, prev_ids):
+        """Return C(prevToken token) / C(prevToken) of the observed bigrams at positions pos."""
+        return self.counts.counts[pos] / self.counts.unigram[prev_ids]
+
+    def defaults(self):
+        """Return the probability of an unseen bigram after each previous word (and unknown words)."""
+        return np.full(len(self.counts.vocab) + 1, float(self.unseen_prob))
+
+    def update(self, counts, delta):
+        """Switch the model to counts (its counts plus delta); only the default array grows with V."""
+        self.counts = counts
+        self.default = self.defaults()
+
+
+class AddK(BigramSmoothing):
+    """Add-k smoothing: P(token | prevToken) = (C(prevToken token) + k) / (C(prevToken) + k*V).
+
+    Unknown words (ID -1) are treated as words with a count of 0.
+    """
+
+    def __init__(self, counts, k=1.0):
+        self.counts = counts
+        self.k = k
+        self.V = len(counts.vocab)
+
+        # Per-history denominators C(prevToken) + k*V
+        self.denominator = counts.unigram + k * self.V
+
+        # k / (C(prevToken) + k*V) for each previous word, and k / (k*V) for unknown ones
+        self.default = self.defaults()
+
+    def seen_probs(self, pos, prev_ids):
+        """Return (C(prevToken token) + k) / (C(prevToken) + k*V) of the observed bigrams at positions pos."""
+        return (self.counts.counts[pos] + self.k) / self.denominator[prev_ids]
+
+    def defaults(self):
+        """Return the probability of an unseen bigram after each previous word (and unknown words)."""
+        return self.k / np.append(self.denominator, self.k * self.V)
+
+    def update(self, counts, delta):
+        """Switch the model to counts (its counts plus delta), recomputing the denominators of the histories in delta.
+
+        A new word changes V and so every denominator, which are then all recomputed (O(V); the
+        probabilities of the seen bigrams follow from the denominators).
+        """
+        if len(counts.vocab) != self.V:
+            self.V = len(counts.vocab)
+            self.denominator = counts.unigram + self.k * self.V
+            self.default = self.defaults()
+        else:
+            touched = np.flatnonzero(delta.unigram)
+            self.denominator = np.array(self.denominator)
+            self.denominator[touched] = counts.unigram[touched] + self.k * self.V
+            self.default = np.array(self.default)
+            self.default[touched] = self.k / self.denominator[touched]
+        self.counts = counts
+
+    def rows(self):
+        """Yield (prevToken, array of P(token | prevToken) over every token) one history at a time.
+
+        Only one row of the full table is held in memory at a time. The row for </s> is skipped
+        and P(<s> | prevToken) is left in the row (callers skip it) since neither can occur.
+        """
+        counts = self.counts
+        for prevToken in range(self.V):
+            if prevToken == END_OF_SENTENCE:
+                continue
+            start, end = counts.indptr[prevToken], counts.indptr[prevToken + 1]
+            row = np.full(self.V, self.default[prevToken])
+            row[counts.indices[start:end]] = (counts.counts[start:end] + self.k) / self.denominator[prevToken]
+            yield prevToken, row
+
+
+class GoodTuring(BigramSmoothing):
+    """Good-Turing discounting: P(token | prevToken) = c* / N for a bigram seen c times.
+
+    The adjusted counts c* = (c + 1) * N_(c+1) / N_c come from the frequency-of-frequencies
+    histogram N_c, which is built in a single pass over the bigram counts. Every unseen bigram is
+    given the probability N_1 / N.
+
+    With simple=True the Simple Good-Turing estimate (Gale and Sampson) is used instead: N_c is
+    smoothed with a log-linear fit so that large counts whose N_(c+1) is 0 do not get c* = 0, and
+    the probabilities of the seen bigrams are renormalized to leave N_1 / N for the unseen ones.
+    """
+
+    def __init__(self, counts, simple=False):
+        self.counts = counts
+        self.simple = simple
+
+        # Get total number of bigram occurrences and the N_c histogram (padded so N_(c+1) exists)
+        bigramCount = counts.counts
+        self.N = int(bigramCount.sum())
+        self.Nc = np.bincount(bigramCount, minlength=2)
+        self.Nc = np.concatenate((self.Nc, [0]))
+
+        self.estimate()
+
+    def estimate(self):
+        """Compute the probabilities of the seen and unseen bigrams from N and the N_c histogram."""
+
+        # Adjusted probability of a bigram seen c times (indexed by c)
+        if self.simple and np.count_nonzero(self.Nc[1:]) > 1:
+            self.prob_of_count = self.simple_good_turing()
+        else:
+            self.prob_of_count = self.good_turing()
+
+        # Probability N_1/N for unknown/unseen instances
+        self.unseen_prob = self.Nc[1] / self.N if self.N else 0.0
+        self.default = self.defaults()
+
+    def seen_probs(self, pos, prev_ids):
+        """Return c* / N of the observed bigrams at positions pos."""
+        return self.prob_of_count[self.counts.counts[pos]]
+
+    def update(self, counts, delta):
+        """Switch the model to counts (its counts plus delta), moving the bigrams of delta between N_c buckets.
+
+        Only the buckets of the bigrams in delta change, but N changes, so the probability of
+        every count c is recomputed from the histogram (O(largest count), not O(seen bigrams)).
+        """
+        newCount = counts.counts[np.searchsorted(counts.keys, delta.keys)]
+        oldCount = newCount - delta.counts
+        oldCount = oldCount[oldCount > 0]
+
+        # Move each bigram of delta from the bucket of its old count to the bucket of its new count
+        Nc = np.zeros(max(len(self.Nc), int(newCount.max(initial=0)) + 2), dtype=np.int64)
+        Nc[:len(self.Nc)] = self.Nc
+        Nc[:len(Nc) - 1] += np.bincount(newCount, minlength=len(Nc) - 1) - np.bincount(oldCount, minlength=len(Nc) - 1)
+        self.counts, self.Nc = counts, Nc
+        self.N += int(delta.counts.sum())
+        self.estimate()
+
+    def defaults(self):
+        """Return the probability of an unseen bigram after each previous word (and unknown words)."""
+        return np.full(len(self.counts.vocab) + 1, float(self.unseen_prob))
+
+    def good_turing(self):
+        """Return c*/N for every count c, with c* = (c + 1) * N_(c+1) / N_c (0 where N_c = 0)."""
+        Nc = self.Nc
+        c = np.arange(len(Nc) - 1)
+        newCount = np.zeros(len(c))
+        nonzero = Nc[:-1] != 0
+        newCount[nonzero] = (c[nonzero] + 1) * Nc[1:][nonzero] / Nc[:-1][nonzero]
+        return newCount / self.N if self.N else newCount
+
+    def simple_good_turing(self):
+        """Return the Simple Good-Turing probability of a single bigram seen c times, for every c."""
+        Nc = self.Nc
+
+        # Nonzero frequencies of frequencies N_r (with r > 0)
+        r = np.flatnonzero(Nc)
+        r = r[r > 0]
+        n = Nc[r].astype(float)
+
+        # Average N_r over the gap to its neighbouring nonzero frequencies: Z_r = N_r / (0.5 (t - q))
+        q = np.concatenate(([0], r[:-1]))
+        t = np.concatenate((r[1:], [2 * r[-1] - q[-1]]))
+        Z = n / (0.5 * (t - q))
+
+        # Fit the log-linear smoothing log(S(r)) = a + b log(r)
+        b, a = np.polyfit(np.log(r), np.log(Z), 1)
+        def S(x):
+            return np.exp(a + b * np.log(x))
+
+        # Turing estimate x and log-linear estimate y of r* for each observed r
+        nNext = Nc[r + 1].astype(float)
+        x = (r + 1) * nNext / n
+        y = (r + 1) * S(r + 1) / S(r)
+
+        # Use the Turing estimate until it is no longer significantly different from the log-linear
+        # estimate (or N_(r+1) is 0), then use the log-linear estimate for all larger r
+        sd = np.sqrt((r + 1) ** 2 * nNext / n ** 2 * (1 + nNext / n))
+        switch = (nNext == 0) | (np.abs(x - y) <= 1.96 * sd)
+        first = np.argmax(switch) if switch.any() else len(r)
+        rStar = np.where(np.arange(len(r)) < first, x, y)
+
+        # Renormalize so the seen bigrams share 1 - N_1/N of the probability mass
+        prob = np.zeros(len(Nc) - 1)
+        prob[r] = (1 - Nc[1] / self.N) * rStar / np.sum(n * rStar)
+        return prob
+
+
+class SketchAddK(BigramSmoothing):
+    """Add-k smoothing of approximate counts: P(token | prevToken) = (C'(prevToken token) + k) / (C(prevToken) + k*V).
+
+    C' is the Count-Min Sketch estimate of the bigram count, which can exceed the true count (by
+    at most the sketch's error bound with high probability), so the probabilities of a history
+    can sum to slightly more than 1. The unigram counts C(prevToken) are exact.
+    """
+
+    def __init__(self, counts, k=1.0):
+        self.counts = counts
+        self.k = k
+        self.V = len(counts.vocab)
+
+        # Per-history denominators C(prevToken) + k*V, and k*V for unknown previous words
+        self.denominator = np.append(counts.unigram + k * self.V, k * self.V)
+        self.default = self.defaults()
+
+    def defaults(self):
+        """Return the probability of an unseen bigram after each previous word (and unknown words)."""
+        return self.k / self.denominator
+
+    def probs(self, token_ids, prev_ids):
+        """Return P(token | prevToken) for each pair of word IDs (-1 for unknown words)."""
+        return (self.counts.count(token_ids, prev_ids) + self.k) / self.denominator[prev_ids]
+
+
+def concatenate_levels(levels):
+    """Return the arrays of the levels concatenated into one float32 array and the start of each level."""
+    starts = np.concatenate(([0], np.cumsum([len(level) for level in levels])[:-1])).astype(np.int64)
+    return np.concatenate(levels).astype(np.float32), starts
+
+
+class NgramSmoothing:
+    """Base class of the smoothing models of NgramCounts.
+
+    Subclasses set seen (per level, the probability of the last word of each n-gram given the
+    others, aligned with the trie entries) plus what is needed for the n-grams that were not
+    seen. The levels are concatenated into flat arrays (with the start of each level in
+    seen_start) so that a batch of tokens is scored with a few gathers.
+    """
+
+    def level(self, j):
+        """Return the probabilities of the n-grams of level j (aligned with the trie entries)."""
+        return self.seen[self.seen_start[j]:][:len(self.counts.counts[j])]
+
+    def state(self):
+        """Return the model's parameters (arrays and numbers) as a dict, for saving the model."""
+        return {name: value for name, value in vars(self).items() if name != "counts"}
+
+    @classmethod
+    def restore(cls, counts, state):
+        """Rebuild a model from the counts and the dict returned by state() without recomputing it."""
+        smoothing = cls.__new__(cls)
+        smoothing.counts = counts
+        vars(smoothing).update(state)
+        return smoothing
+
+
+class NgramAddK(NgramSmoothing):
+    """Add-k smoothing of the highest order: P(token | history) = (C(history token) + k) / (C(history) + k*V).
+
+    The history is the previous order - 1 words (fewer at the start of a sentence). With k = 0
+    this is the unsmoothed estimate (and 0 if unseen). Besides seen (empty for the unigrams),
+    default holds the probability of an unseen token after each n-gram used as a history and
+    unseen_prob the probability of a token after a history that was never seen.
+    """
+
+    def __init__(self, counts, k=1.0):
+        self.counts = counts
+        self.k = k
+        self.V = len(counts.vocab)
+
+        # Probabilities of the observed n-grams of each level above the unigrams, given the count
+        # of their history (the n-gram without its last word)
+        seen = [np.zeros(0)]
+        for j in range(1, counts.order):
+            history = counts.find(counts.ngrams(j)[:, :-1])
+            seen.append((counts.counts[j] + k) / (counts.counts[j - 1][history] + k * self.V))
+
+        # Probability of an unseen token after each history of each level below the highest
+        default = [k / (counts.counts[j] + k * self.V) for j in range(counts.order - 1)]
+        self.seen, self.seen_start = concatenate_levels(seen)
+        self.default, self.default_start = concatenate_levels(default)
+        self.unseen_prob = 1 / self.V if k > 0 else 0
+
+    def probs(self, ids, lengths):
+        """Return P(token | history) for each position of a stream of word IDs.
+
+        lengths[i] is the number of words (including the token) of the n-gram used at position i
+        (at least 2; see NgramCounts.walk).
+        """
+        entries = self.counts.walk(ids, lengths)
+        rows = np.arange(len(ids))
+        lengths = np.asarray(lengths)
+
+        # Entry of the whole n-gram and of its history (the shorter n-gram ending one word earlier)
+        ngram = entries[rows, lengths - 1]
+        history = entries[np.maximum(rows - 1, 0), lengths - 2]
+        seen = self.seen[self.seen_start[lengths - 1] + np.maximum(ngram, 0)]
+        default = self.default[self.default_start[lengths - 2] + np.maximum(history, 0)]
+        return np.where(ngram >= 0, seen, np.where(history >= 0, default, self.unseen_prob)).astype(float)
+
+
+class NgramBackoff(NgramSmoothing):
+    """Base class of the smoothing models that back off to shorter histories.
+
+    Subclasses set seen (the probabilities of the n-grams of every level, including the
+    unigrams), backoff (the weight of the lower order after each n-gram used as a history, 1 if
+    it has no continuations) and unseen_prob (the probability of an unknown word). The
+    probability of a token is the probability of the longest seen n-gram ending at it times the
+    backoff weights of the longer histories that were seen, i.e. O(order) array lookups.
+    """
+
+    def probs(self, ids, lengths):
+        """Return P(token | history) for each position of a stream of word IDs.
+
+        lengths[i] is the number of words (including the token) of the n-gram used at position i
+        (at least 2; see NgramCounts.walk).
+        """
+        entries = self.counts.walk(ids, lengths)
+        rows = np.arange(len(ids))
+        lengths = np.asarray(lengths)
+        previous = entries[np.maximum(rows - 1, 0)]
+
+        # Level of the longest seen n-gram ending at each token (-1 for unknown words)
+        found = (entries >= 0) & (np.arange(self.counts.order) < lengths[:, None])
+        longest = found.sum(axis=1) - 1
+        level = np.maximum(longest, 0)
+        p = np.where(longest >= 0, self.seen[self.seen_start[level] + np.maximum(entries[rows, level], 0)], self.unseen_prob).astype(float)
+
+        # Multiply by the backoff weights of the seen histories longer than that n-gram's history
+        for j in range(self.counts.order - 1):
+            use = (j >= longest) & (j <= lengths - 2) & (previous[:, j] >= 0)
+            p = p * np.where(use, self.backoff[self.backoff_start[j] + np.maximum(previous[:, j], 0)], 1)
+        return p
+
+    def left_mass(self, j, history, keep):
+        """Return, for each history (entry of level j - 1), the probability left for backing off.
+
+        history is the history entry of each n-gram of level j and keep the mask of the kept
+        ones. The first array is 1 minus the probabilities of the kept n-grams of the history and
+        the second 1 minus the lower order probabilities of the same words (the probabilities of
+        their trie parents). The backoff weight of the history is their ratio.
+        """
+        size = len(self.counts.counts[j - 1])
+        lower = self.level(j - 1)[self.counts.parents(j)]
+        left = 1 - np.bincount(history[keep], weights=self.level(j)[keep], minlength=size)
+        lowerLeft = 1 - np.bincount(history[keep], weights=lower[keep], minlength=size)
+        return np.maximum(left, MIN_MASS), np.maximum(lowerLeft, MIN_MASS)
+
+    def prune(self, cutoffs=(), threshold=0.0):
+        """Return a smaller copy of the model without the n-grams removed by count cutoffs and entropy pruning.
+
+        cutoffs[j - 1] is the smallest count of a kept n-gram of level j (the last cutoff also
+        applies to the higher levels; unigrams are always kept). With threshold > 0, an n-gram is
+        also removed if removing it (and backing off instead) increases the perplexity by a factor
+        of less than 1 + threshold (Stolcke's relative entropy criterion, with the probability of
+        the history estimated by its relative frequency). The levels are pruned from the highest
+        down, and the n-grams that are the trie parent or the history of a kept n-gram are kept.
+        """
+        counts = self.counts
+        order = counts.order
+        keep = [np.ones(len(c), dtype=bool) for c in counts.counts]
+        history = [None] + [counts.find(counts.ngrams(j)[:, :-1]) for j in range(1, order)]
+        total = float(counts.unigram.sum())
+        for j in range(order - 1, 0, -1):
+
+            # N-grams the kept n-grams of the level above depend on
+            protected = np.zeros(len(counts.counts[j]), dtype=bool)
+            if j < order - 1:
+                protected[counts.parents(j + 1)[keep[j + 1]]] = True
+                protected[history[j + 1][keep[j + 1]]] = True
+
+            # Count cutoff
+            cutoff = cutoffs[min(j, len(cutoffs)) - 1] if len(cutoffs) else 0
+            keep[j] = protected | (counts.counts[j] >= cutoff)
+            if threshold <= 0:
+                continue
+
+            # Increase of the relative entropy if each n-gram alone is removed: its probability
+            # becomes the backed off one and the backoff weight of its history grows to cover it
+            h = history[j]
+            p = self.level(j)
+            lower = self.level(j - 1)[counts.parents(j)]
+            left, lowerLeft = self.left_mass(j, h, keep[j])
+            backoff = left / lowerLeft
+            pruned = (left[h] + p) / (lowerLeft[h] + lower)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                increase = -(counts.counts[j - 1][h] / total) * (p * (np.log(lower * pruned) - np.log(p)) + left[h] * (np.log(pruned) - np.log(backoff[h])))
+            keep[j] &= protected | ~(increase < np.log1p(threshold))
+
+        # Keep the probabilities of the kept n-grams and renormalize the backoff weights
+        backoff = []
+        for j in range(1, order):
+            left, lowerLeft = self.left_mass(j, history[j], keep[j])
+            backoff.append((left / lowerLeft)[keep[j - 1]])
+        smoothing = type(self).restore(counts.select(keep), self.state())
+        smoothing.seen, smoothing.seen_start = concatenate_levels([self.level(j)[keep[j]] for j in range(order)])
+        smoothing.backoff, smoothing.backoff_start = concatenate_levels(backoff)
+        return smoothing
+
+
+class KneserNey(NgramBackoff):
+    """Interpolated modified Kneser-Ney smoothing (Chen and Goodman).
+
+    P(token | history) = (a(history token) - D(a)) / sum of a(history *)
+                         + gamma(history) * P(token | history without its first word)
+    where a is the count for the highest order and the continuation count (the number of
+    different words seen before the n-gram) for the lower orders, and D(a) is one of three
+    discounts per order (for a = 1, 2 and 3+) estimated from the counts of counts. The unigrams
+    are interpolated with the uniform distribution. Continuation counts are the number of children
+    of each trie entry, so every statistic is computed with vectorized passes over the trie levels.
+    """
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.V = len(counts.vocab)
+        order = counts.order
+
+        # Adjusted counts: continuation counts below the highest order, except for n-grams that
+        # start with <s> (nothing can precede them); <s> is never predicted
+        adjusted = []
+        for j in range(order):
+            count = counts.counts[j].astype(float)
+            if j < order - 1:
+                first = np.arange(len(count)) if j == 0 else counts.words[j]
+                count = np.where(first == START_OF_SENTENCE, count, np.diff(counts.offsets[j].astype(np.int64)))
+            if j == 0:
+                count[START_OF_SENTENCE] = 0
+            adjusted.append(count)
+
+        # Discounts D_1, D_2 and D_3+ of each order from the counts of counts n_1 .. n_4
+        self.discounts = np.zeros((order, 4))
+        for j in range(order):
+            n = np.bincount(np.minimum(adjusted[j], 5).astype(np.int64), minlength=6)[1:5].astype(float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                Y = n[0] / (n[0] + 2 * n[1])
+                D = np.array([1, 2, 3]) - np.array([2, 3, 4]) * Y * n[1:4] / n[0:3]
+            self.discounts[j, 1:] = np.clip(np.nan_to_num(D, nan=0.5, posinf=0.5, neginf=0.5), 0, [1, 2, 3])
+
+        # Unigrams, interpolated with the uniform distribution
+        D = self.discounts[0][np.minimum(adjusted[0], 3).astype(np.int64)]
+        total = adjusted[0].sum()
+        gamma = D.sum() / total
+        seen = [(adjusted[0] - D) / total + gamma / self.V]
+        self.unseen_prob = gamma / self.V
+
+        # Each higher order, interpolated with the level below (the parent of a trie entry is the
+        # n-gram without its first word)
+        backoff = []
+        for j in range(1, order):
+            history = counts.find(counts.ngrams(j)[:, :-1])
+            D = self.discounts[j][np.minimum(adjusted[j], 3).astype(np.int64)]
+            total = np.bincount(history, weights=adjusted[j], minlength=len(adjusted[j - 1]))
+            gamma = np.divide(np.bincount(history, weights=D, minlength=len(total)), total,
+                              out=np.ones(len(total)), where=total > 0)
+            seen.append((adjusted[j] - D) / total[history] + gamma[history] * seen[j - 1][counts.parents(j)])
+            backoff.append(gamma)
+        self.seen, self.seen_start = concatenate_levels(seen)
+        self.backoff, self.backoff_start = concatenate_levels(backoff)
+
+
+class JelinekMercer(NgramBackoff):
+    """Jelinek-Mercer interpolation with a fixed weight.
+
+    P(token | history) = weight * C(history token) / C(history *)
+                         + (1 - weight) * P(token | history without its first word)
+    and the unigrams are interpolated with the uniform distribution.
+    """
+
+    def __init__(self, counts, weight=0.7):
+        self.counts = counts
+        self.weight = weight
+        self.V = len(counts.vocab)
+
+        # Unigrams (<s> is never predicted), interpolated with the uniform distribution
+        unigram = counts.counts[0].astype(float)
+        unigram[START_OF_SENTENCE] = 0
+        seen = [weight * unigram / unigram.sum() + (1 - weight) / self.V]
+        self.unseen_prob = (1 - weight) / self.V
+
+        # Each higher order, interpolated with the level below
+        backoff = []
+        for j in range(1, counts.order):
+            history = counts.find(counts.ngrams(j)[:, :-1])
+            count = counts.counts[j].astype(float)
+            total = np.bincount(history, weights=count, minlength=len(counts.counts[j - 1]))
+            seen.append(weight * count / total[history] + (1 - weight) * seen[j - 1][counts.parents(j)])
+            backoff.append(np.where(total > 0, 1 - weight, 1.0))
+        self.seen, self.seen_start = concatenate_levels(seen)
+        self.backoff, self.backoff_start = concatenate_levels(backoff)
@@ -13,50 +13,253 @@ tagging.py
             python tagging.py <input-test-file>
         
         <input-test-file> must be a file containing the test input sentence as a single line.
+        
+        To use beam search (keeping only the best states of each word) instead of exact search,
+        add either or both of:
+            --beam <number-of-states>
+            --threshold <log-probability-below-best>
+        
+        To tag with a second-order (trigram) HMM whose transitions are interpolated with deleted
+        interpolation, add:
+            --trigram
+        
+        To compare the speed and accuracy of the bigram and trigram taggers on a tagged test file
+        (word_pos patterns, one sentence per line), run:
+            python tagging.py --benchmark <tagged-test-file>
+        
+        To build the model once and save it (with its counts) as an HMM model bundle that
+        viterbi.py can load, run:
+            python tagging.py save <model-dir>
+        
+        To fold new tagged sentences (word_pos patterns) into a saved model without recounting the
+        training set (only the rows of the tags they touch are recomputed), run:
+            python tagging.py update <model-dir> <new-tagged-file> [--output <model-dir>]
+        The updated model replaces the saved one unless --output is given (the model directory
+        is replaced as a whole, so a running viterbi.py server keeps the old model until it is
+        restarted). The update still costs O(V * N) for V words and N tags (the emission arrays
+        are copied, and the emission column of every touched tag changes for every word) plus the
+        rebuild of the unknown-word model, so it saves the recounting of the training set but is
+        not proportional to the size of the new sentences.
+        
+        To build the model once and serve it over HTTP (concurrent requests are tagged together in
+        micro-batches), run:
+            python tagging.py serve [--trigram] [--port <port> | --socket <path>]
+        and POST sentences (one per line, or {"sentences": [...]} as JSON) to /tag. GET /stats
+        returns the request counters and p50/p99 latencies.
+    
+        The training corpus is read from TrainingSet.txt, or from TrainingSet.txt.gz, .bz2 or .xz
+        if only a compressed copy exists.
     
     Imports:
-        sys - Used to get the arguments from command line
+        sys         - Used for dispatching the save, update and serve commands
+        argparse    - Used to get the arguments from command line
+        time        - Used for timing the taggers in the benchmark
+        numpy       - Used for compiling the counts into transition/emission arrays
+        corpus      - Used for streaming the (possibly compressed) training and test files
+        scoring     - Used for log probabilities and reporting the log probability of the result
+        hmm         - Used for the vectorized viterbi (or beam search) and second-order decoders
+        unknown     - Used for the emissions of words that are not in the training set
+        server      - Used for serving the model over HTTP
 """
 import sys
+import argparse
+import time
+import numpy as np
 
-if __name__ == "__main__":
+from corpus import TRAINING_SET, find_corpus, read_sentences, words_of
+from scoring import log, report
+from hmm import HMM, TrigramHMM, tag_results
+from unknown import RARE_COUNT, UnknownWordModel
+from server import add_server_arguments, serve
+
+# Keys for start of sentence and end of sentence
+START_OF_SENTENCE = '<s>'
+END_OF_SENTENCE = '</s>'
+
+
+def build_hmm(unigramTagCount, bigramCount):
+    """Compile the tag and word|tag/tag|previous tag counts into an HMM of log probabilities.
+
+    Tags and words are given integer IDs in the order they were first counted. Row 0 of the
+    transitions is <s> and P(</s>|tag) becomes the HMM's final transitions. The unknown-word model
+    is estimated from the words seen at most RARE_COUNT times.
+    """
+    tagList = [tag for tag in unigramTagCount if tag != START_OF_SENTENCE]
+    tagIds = {tag: i for i, tag in enumerate(tagList)}
+    wordIds = dict()
     
-    # Print an error for the incorrect number of arguments
-    if len(sys.argv) > 2:
-        sys.exit("ERROR: Incorrect number of arguments.\n\n\tPlease execute with either: \n\t(1) python tagging.py\n\t(2) python tagging.py <input-test-file>")
+    # Collect the (row, column, count) entries of the transition, emission and final arrays
+    transition = ([], [], [])
+    emission = ([], [], [])
+    final = ([], [], [])
+    for (token, tag, WT), count in bigramCount.items():
+        if WT == 'W':
+            entries, row, column = emission, wordIds.setdefault(token, len(wordIds)), tagIds[tag]
+        elif token == END_OF_SENTENCE:
+            if tag == START_OF_SENTENCE: continue
+            entries, row, column = final, 0, tagIds[tag]
+        else:
+            entries, row, column = transition, 0 if tag == START_OF_SENTENCE else tagIds[tag] + 1, tagIds[token]
+        entries[0].append(row)
+        entries[1].append(column)
+        entries[2].append(count)
     
-    # Get arguments:
-    #   test_file = location of input test file (optional)
-    test_file = None
-    if len(sys.argv) == 2:
-        test_file = sys.argv[1]
-        
-    # Get training set file lines
-    trainingSet = open("TrainingSet.txt")
-    lines = trainingSet.readlines()
-    trainingSet.close()
+    # Divide the counts by the count of the conditioning tag (C(<s>) for row 0 of the transitions)
+    tagCount = np.array([unigramTagCount.get(START_OF_SENTENCE, 1)] + [unigramTagCount[tag] for tag in tagList], dtype=float)
+    N = len(tagList)
+    A = np.zeros((N + 1, N))
+    B = np.zeros((len(wordIds), N))
+    F = np.zeros((1, N))
+    for array, (rows, columns, counts) in [(A, transition), (B, emission), (F, final)]:
+        array[rows, columns] = counts
+    return hmm_from_counts(tagList, list(wordIds), {"tag": tagCount, "transition": A, "emission": B, "final": F[0]})
+
+
+def hmm_from_counts(tagList, wordList, counts):
+    """Estimate an HMM of log probabilities from its count arrays, which the HMM keeps.
+
+    counts holds the tag counts ("tag", with C(<s>) first), the tag|previous tag counts
+    ("transition", with <s> as row 0), the word|tag counts ("emission") and the </s>|tag counts
+    ("final").
+    """
+    tagCount = counts["tag"]
+    return HMM(tagList, wordList, log(counts["transition"] / tagCount[:, None]), log(counts["emission"] / tagCount[1:]),
+               log_final=log(counts["final"] / tagCount[1:]), unknown_model=unknown_word_model(wordList, counts), counts=counts)
+
+
+def unknown_word_model(wordList, counts):
+    """Estimate the unknown-word model from the words seen at most RARE_COUNT times."""
+    B = counts["emission"]
+    tagCount = counts["tag"]
+    rare = np.flatnonzero(B.sum(axis=1) <= RARE_COUNT)
+    return UnknownWordModel.train([wordList[i] for i in rare], B[rare], tagCount[1:] / tagCount[1:].sum())
+
+
+def update_hmm(hmm, unigramTagCount, bigramCount):
+    """Fold the counts of new sentences (from count_tags) into the counts of hmm and return the updated HMM.
+
+    New tags and words get the next IDs, in the order they were first counted (as if the new
+    sentences had been appended to the training set). Only the rows of the tags the new
+    sentences touch are recomputed: their transitions, their final transitions and their
+    column of the emissions (P(word | tag) of every word changes with C(tag)). The unknown-word
+    model is estimated again since the set of rare words changes.
+
+    The cost is not proportional to the new sentences: the dense V x N count and log emission
+    arrays are copied (padded for the new words and tags), every touched emission column is
+    recomputed over all V words, and the suffix trie of the unknown-word model is rebuilt over
+    every rare word (its root prior and interpolation weight depend on all of them, and every
+    node is interpolated with its parent). What is saved is the recounting of the training set.
+    """
+    if hmm.counts is None:
+        raise ValueError("The HMM has no counts to update (save it with: python tagging.py save <model-dir>)")
+    tagList, wordList = list(hmm.tags), list(hmm.observations)
+    tagIds = {tag: i for i, tag in enumerate(tagList)}
+    wordIds = dict(hmm.observation_index)
+    for tag in unigramTagCount:
+        if tag != START_OF_SENTENCE and tag not in tagIds:
+            tagIds[tag] = len(tagList)
+            tagList.append(tag)
+    for (token, tag, WT) in bigramCount:
+        if WT == 'W' and token not in wordIds:
+            wordIds[token] = len(wordList)
+            wordList.append(token)
+    
+    # Copy the count and log probability arrays, padded for the new tags and words (with counts
+    # of 0 and log probabilities of log 0)
+    N, V = len(tagList), len(wordList)
+    def padded(array, shape, fill):
+        array = np.asarray(array)
+        result = np.full(shape, fill, dtype=float)
+        result[tuple(slice(0, n) for n in array.shape)] = array
+        return result
+    counts = {"tag": padded(hmm.counts["tag"], N + 1, 0), "transition": padded(hmm.counts["transition"], (N + 1, N), 0),
+              "emission": padded(hmm.counts["emission"], (V, N), 0), "final": padded(hmm.counts["final"], N, 0)}
+    A = padded(hmm.log_transition, (N + 1, N), -np.inf)
+    B = padded(hmm.log_emission, (V, N), -np.inf)
+    F = padded(hmm.log_final, N, -np.inf)
+    
+    # Add the new counts
+    counts["tag"][0] += unigramTagCount.get(START_OF_SENTENCE, 0)
+    for tag, count in unigramTagCount.items():
+        if tag != START_OF_SENTENCE: counts["tag"][tagIds[tag] + 1] += count
+    for (token, tag, WT), count in bigramCount.items():
+        if WT == 'W': counts["emission"][wordIds[token], tagIds[tag]] += count
+        elif token == END_OF_SENTENCE:
+            if tag != START_OF_SENTENCE: counts["final"][tagIds[tag]] += count
+        else: counts["transition"][0 if tag == START_OF_SENTENCE else tagIds[tag] + 1, tagIds[token]] += count
+    
+    # Recompute the rows of the touched tags (and of <s>)
+    touched = np.array([tagIds[tag] for tag in unigramTagCount if tag != START_OF_SENTENCE], dtype=np.int64)
+    rows = np.concatenate(([0], touched + 1))
+    tagCount = counts["tag"]
+    A[rows] = log(counts["transition"][rows] / tagCount[rows, None])
+    B[:, touched] = log(counts["emission"][:, touched] / tagCount[touched + 1])
+    F[touched] = log(counts["final"][touched] / tagCount[touched + 1])
+    return HMM(tagList, wordList, A, B, log_final=F, unknown_model=unknown_word_model(wordList, counts), counts=counts)
+
+
+def build_trigram_hmm(unigramTagCount, bigramCount, trigramCount):
+    """Compile the counts into a second-order HMM with deleted interpolation of its transitions.
+
+    P(tag | prevPrevTag, prevTag) = l1 P(tag) + l2 P(tag | prevTag) + l3 P(tag | prevPrevTag, prevTag),
+    where each trigram adds its count to the weight of the estimate that predicts it best with
+    that trigram's occurrences left out (Brants, TnT). The emissions are those of build_hmm.
+    """
+    hmm = build_hmm(unigramTagCount, bigramCount)
+    N = len(hmm.tags)
+    
+    # Index N is <s> in the histories and </s> as the next tag
+    tagIds = {tag: i for i, tag in enumerate(hmm.tags)}
+    tagIds[START_OF_SENTENCE] = N
+    tagIds[END_OF_SENTENCE] = N
+    
+    # Tag unigram, bigram and trigram counts as dense arrays (C(</s>) = C(<s>) = number of sentences)
+    unigram = np.array([unigramTagCount[tag] for tag in hmm.tags] + [unigramTagCount[START_OF_SENTENCE]], dtype=float)
+    bigram = np.zeros((N + 1, N + 1))
+    for (token, prevTag, WT), count in bigramCount.items():
+        if WT == 'T': bigram[tagIds[prevTag], tagIds[token]] += count
+    trigram = np.zeros((N + 1, N + 1, N + 1))
+    for (tag, prevTag, prevPrevTag), count in trigramCount.items():
+        trigram[tagIds[prevPrevTag], tagIds[prevTag], tagIds[tag]] = count
+    bigramTotal = bigram.sum(axis=1)
+    trigramTotal = trigram.sum(axis=2)
+    
+    # Deleted interpolation: compare (C - 1) / (C(history) - 1) of each estimate for every trigram
+    def deleted(count, total):
+        return np.divide(count - 1, total - 1, out=np.zeros(len(count)), where=total > 1)
+    h2, h1, t = np.nonzero(trigram)
+    count = trigram[h2, h1, t]
+    estimates = np.stack([deleted(unigram[t], np.full(len(t), unigram.sum())),
+                          deleted(bigram[h1, t], bigramTotal[h1]),
+                          deleted(count, trigramTotal[h2, h1])])
+    weights = np.bincount(np.argmax(estimates, axis=0), weights=count, minlength=3)
+    l1, l2, l3 = weights / weights.sum()
+    
+    # Interpolated transitions (histories that were never seen use the next lower order instead)
+    P1 = unigram / unigram.sum()
+    P2 = np.where(bigramTotal[:, None] > 0, bigram / np.maximum(bigramTotal, 1)[:, None], P1)
+    P3 = np.where(trigramTotal[:, :, None] > 0, trigram / np.maximum(trigramTotal, 1)[:, :, None], P2[None])
+    P = l1 * P1 + l2 * P2[None] + l3 * P3
+    return TrigramHMM(hmm.tags, hmm.observations, log(P), hmm.log_emission, unknown_model=hmm.unknown_model)
+
+
+def count_tags(path, countTrigrams=False):
+    """Count the tags, word|tag and tag|previous tag pairs (and tag trigrams) of the training corpus at path.
+
+    Returns (unigramTagCount, bigramCount, trigramCount); trigramCount is empty unless countTrigrams.
+    """
     
     # Initialize dicts for unigram and bigrams
     unigramTagCount = dict()    # key = <tag>
     bigramCount = dict()        # key = (<word|tag>, <previousTag>, <W|T>)
-    bigramProb = dict()         # key = (<word|tag>, <previousTag>, <W|T>)
+    trigramCount = dict()       # key = (<tag>, <previousTag>, <previousPreviousTag>)
     
-    # Initialize keys for start of sentence and end of sentence
-    START_OF_SENTENCE = '<s>'
-    END_OF_SENTENCE = '</s>'
-    
-    # Initialize set of tags
-    tags = dict()
-    
-    ###########################################################################
-    # Loop through lines in training set file
-    for sentence in lines:
+    # Stream the lines of the training set file (split by whitespace)
+    for tokens in read_sentences(path):
         
         # Start each sentence
         prevTag = START_OF_SENTENCE
-        
-        # Split each line by whitespace
-        tokens = sentence.split()
+        prevPrevTag = START_OF_SENTENCE
         
         # Loop through word_pos patterns
         for token in tokens:
@@ -66,10 +269,6 @@ if __name__ == "__main__":
             word = word_pos[0]
             tag = word_pos[1]
             
-            # Add tag to set of tags
-            if word in tags: tags[word].add(tag)
-            else: tags.update({word: set(tag)})
-            
             # Increment unigram counts by 1 for each tag
             if tag in unigramTagCount: unigramTagCount[tag] += 1
             else: unigramTagCount.update({tag: 1})
@@ -82,7 +281,11 @@ if __name__ == "__main__":
             if (tag, prevTag, 'T') in bigramCount: bigramCount[(tag, prevTag, 'T')] += 1
             else: bigramCount.update({(tag, prevTag, 'T'): 1})
             
-            # Set previous token
+            # Increment trigram counts by 1 for each tag|previous previous tag, previous tag
+            if countTrigrams: trigramCount[(tag, prevTag, prevPrevTag)] = trigramCount.get((tag, prevTag, prevPrevTag), 0) + 1
+            
+            # Set previous tokens
+            prevPrevTag = prevTag
             prevTag = tag
             
         # Increment unigram count by 1 for <s>
@@ -92,141 +295,157 @@ if __name__ == "__main__":
         # Increment bigram count by 1 for </s>|previous tag
         if (END_OF_SENTENCE, prevTag, 'T') in bigramCount: bigramCount[(END_OF_SENTENCE, prevTag, 'T')] += 1
         else: bigramCount.update({(END_OF_SENTENCE, prevTag, 'T'): 1})
-            
-    ###########################################################################
-    # With no smoothing:
-    #   Determine bigram probabilities
-    for (token, tag, WT) in bigramCount:
-        bCount = bigramCount[(token, tag, WT)]
-        uCount = unigramTagCount[tag]
-        bigramProb.update({(token, tag, WT): bCount/uCount})
+        
+        # Increment trigram count by 1 for </s>|previous previous tag, previous tag
+        if countTrigrams: trigramCount[(END_OF_SENTENCE, prevTag, prevPrevTag)] = trigramCount.get((END_OF_SENTENCE, prevTag, prevPrevTag), 0) + 1
+
+    return unigramTagCount, bigramCount, trigramCount
+
+
+def main_save(argv):
+    """python tagging.py save <model-dir>: build the tagging model from the training set and save it."""
+    parser = argparse.ArgumentParser(prog="tagging.py save", description="Builds a POS tagging model and saves it as an HMM model bundle.")
+    parser.add_argument("model", metavar="<model-dir>")
+    args = parser.parse_intermixed_args(argv)
+    unigramTagCount, bigramCount, _ = count_tags(find_corpus(TRAINING_SET))
+    build_hmm(unigramTagCount, bigramCount).save(args.model)
+
+
+def main_update(argv):
+    """python tagging.py update <model-dir> <new-tagged-file>: fold new tagged sentences into a saved model."""
+    parser = argparse.ArgumentParser(prog="tagging.py update", description="Folds new tagged sentences into a saved POS tagging model.")
+    parser.add_argument("model", metavar="<model-dir>")
+    parser.add_argument("sentences", metavar="<new-tagged-file>")
+    parser.add_argument("--output", metavar="<model-dir>", help="save the updated model here instead of replacing the saved one")
+    args = parser.parse_intermixed_args(argv)
+    
+    # Read the arrays instead of mapping them, since the update copies them anyway (saving
+    # replaces the whole model directory, so processes that mapped the old model keep their files)
+    try:
+        hmm = update_hmm(HMM.load(args.model, mmap=False), *count_tags(args.sentences)[:2])
+        hmm.save(args.output or args.model)
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
 
-    #   Add blank entry with probability 0 for unknown/unseen instances
-    bigramProb.update({(None, None, None): 0})
+
+def main_serve(argv):
+    """python tagging.py serve: build the tagging model from the training set and serve it over HTTP."""
+    parser = argparse.ArgumentParser(prog="tagging.py serve", description="Builds a POS tagging model and serves it over HTTP (POST /tag).")
+    parser.add_argument("--beam", type=int, help="number of states kept per word (beam search)")
+    parser.add_argument("--threshold", type=float, help="prune states whose log probability is this far below the best (beam search)")
+    parser.add_argument("--trigram", action="store_true", help="tag with a second-order (trigram) HMM")
+    add_server_arguments(parser)
+    args = parser.parse_intermixed_args(argv)
+    if args.trigram and (args.beam is not None or args.threshold is not None):
+        parser.error("beam search is not supported with --trigram")
+    
+    # Build the HMM once and decode with its tag dictionary (see the test file case below)
+    unigramTagCount, bigramCount, trigramCount = count_tags(find_corpus(TRAINING_SET), args.trigram)
+    if args.trigram: hmm = build_trigram_hmm(unigramTagCount, bigramCount, trigramCount)
+    else: hmm = build_hmm(unigramTagCount, bigramCount)
+    hmm.use_tag_dictionary = True
+    hmm.beam, hmm.threshold = args.beam, args.threshold
+    serve({"tag": lambda sentences: tag_results(hmm, sentences)}, args)
+
+
+if __name__ == "__main__":
+    
+    # Save or update a model, or serve the model over HTTP
+    if sys.argv[1:2] == ["save"]:
+        sys.exit(main_save(sys.argv[2:]))
+    if sys.argv[1:2] == ["update"]:
+        sys.exit(main_update(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(main_serve(sys.argv[2:]))
+    
+    # Get arguments:
+    #   test_file = location of input test file (optional)
+    #   beam = number of states kept per word for beam search (optional)
+    #   threshold = log probability below the best state beyond which states are pruned (optional)
+    #   trigram = tag with the second-order HMM (optional)
+    #   benchmark = location of a tagged test file for comparing the bigram and trigram taggers (optional)
+    parser = argparse.ArgumentParser(description="Builds a POS tagging model and tags a test sentence.")
+    parser.add_argument("test_file", metavar="<input-test-file>", nargs="?")
+    parser.add_argument("--beam", type=int, help="number of states kept per word (beam search)")
+    parser.add_argument("--threshold", type=float, help="prune states whose log probability is this far below the best (beam search)")
+    parser.add_argument("--trigram", action="store_true", help="tag with a second-order (trigram) HMM")
+    parser.add_argument("--benchmark", metavar="<tagged-test-file>", help="compare the bigram and trigram taggers on a tagged test file")
+    args = parser.parse_intermixed_args()
+    test_file = args.test_file
+    if args.trigram and (args.beam is not None or args.threshold is not None):
+        parser.error("beam search is not supported with --trigram")
+    
+    # Count tag trigrams only for the second-order HMM
+    countTrigrams = args.trigram or args.benchmark != None
+        
+    # Count the training set
+    unigramTagCount, bigramCount, trigramCount = count_tags(find_corpus(TRAINING_SET), countTrigrams)
         
     ###########################################################################
-    # If a test file is provided, perform testing
-    if test_file != None:
+    # If a tagged test file is provided, compare the speed and accuracy of the bigram and trigram
+    # taggers on it
+    if args.benchmark != None:
+        sentences = list(read_sentences(args.benchmark))
+        gold = [[token.split("_")[1] for token in tokens] for tokens in sentences]
+        nTokens = sum(len(tags) for tags in gold)
+        for name, build in [("Bigram", lambda: build_hmm(unigramTagCount, bigramCount)),
+                            ("Trigram", lambda: build_trigram_hmm(unigramTagCount, bigramCount, trigramCount))]:
+            
+            # Time compiling the model and tagging every sentence
+            start = time.perf_counter()
+            hmm = build()
+            hmm.use_tag_dictionary = True
+            built = time.perf_counter()
+            paths = [path for path, _ in hmm.decode_many(hmm.encode(words_of(tokens)) for tokens in sentences)]
+            end = time.perf_counter()
+            
+            # Count the tags that match the gold tags
+            correct = sum(sum(hmm.tags[t] == g for t, g in zip(path, tags)) for path, tags in zip(paths, gold))
+            print(name + " HMM: accuracy = " + str(correct / max(nTokens, 1)) + " (" + str(correct) + " of " + str(nTokens) + " tags)")
+            print("    Build time = " + str(built - start) + " s, tagging time = " + str(end - built) + " s ("
+                  + str(nTokens / max(end - built, 1e-9)) + " tokens per second)")
         
-        # Get test set file lines
-        testSet = open(test_file)
-        lines = testSet.readlines()
-        testSet.close()
+    ###########################################################################
+    # If a test file is provided, perform testing
+    elif test_file != None:
         
-        # Get sentence from test set file -> should only be one line
-        sentence = lines[0]
+        # Get sentence from test set file (split by whitespace) -> should only be one line
+        words = next(read_sentences(test_file), [])
         
-        # Split line by whitespace
-        words = sentence.split()
+        # Compile the counts into an HMM with integer tag/word IDs and decode with its tag
+        # dictionary, so each word only visits the tags it was seen with (unseen words visit the
+        # open-class tags allowed by their suffix and shape in the unknown-word model)
+        if args.trigram: hmm = build_trigram_hmm(unigramTagCount, bigramCount, trigramCount)
+        else: hmm = build_hmm(unigramTagCount, bigramCount)
+        hmm.use_tag_dictionary = True
         
-        # Initialize list of dicts with key = (<tag>, <prev-tag>)
-        prob = [dict({(START_OF_SENTENCE, None): 1})]
+        # Use beam search (keeping only the best states of each word) instead of exact search
+        hmm.beam, hmm.threshold = args.beam, args.threshold
         
-        # Determine most common tag (to be used if word is unseen -> this should never happen)
-        most_common_tag = max(unigramTagCount, key=unigramTagCount.get)
-        
-        #######################################################################
-        # Loop through words patterns
-        for i in range(len(words)):
-            
-            # Get word
-            word = words[i]
-                
-            # Initialize probability dict for current word
-            cur_prob = dict()
-            
-            # Get list of tags for word
-            if word in tags: word_tags = list(tags[word])
-            
-            # If word is unseen, select most common tag -> this should never happen
-            else:
-                
-                # Loop through probability values from previous word
-                for prevTag, prevPrevTag in prob[-1]:
-                     
-                    # Update probability value to be previous probability
-                    cur_prob.update({(most_common_tag, prevTag): prob[(prevTag, prevPrevTag)]})
-                
-                # Add probability dict for current word and skip
-                prob.append(cur_prob)
-                continue
-            
-            # Loop through probability values from previous word
-            for prevTag, prevPrevTag in prob[-1]:
-                    
-                # Get previous word probability value
-                prev_prob = prob[-1][(prevTag, prevPrevTag)]
-            
-                # Loop through tags for current word
-                for tag in word_tags:
-    
-                    # Initialize current word's prob with previous' prob
-                    cur_prob_val = prev_prob
-                    
-                    # Calculate P(word|tag) and multiply
-                    if (word, tag, 'W') in bigramProb:
-                        cur_prob_val *= bigramProb[(word, tag, 'W')]
-                        
-                    # If unseen word|tag -> probability = 0 and skip
-                    else: continue
-                    
-                    # Calculate P(tag|prevTag) and multiply
-                    if (tag, prevTag, 'T') in bigramProb:
-                        cur_prob_val *= bigramProb[(tag, prevTag, 'T')]
-                        
-                    # If unseen tag|prevTag -> probability = 0 and skip
-                    else: continue
-                    
-                    # If word is the last word in the sentence:
-                    if i == (len(words) - 1):
-                        
-                        # Calculate P(</s>|tag)
-                        if (END_OF_SENTENCE, tag, 'T') in bigramProb:
-                            cur_prob_val *= bigramProb[(END_OF_SENTENCE, tag, 'T')]
-                            
-                        # If unseen </s>|tag -> probability = 0 and skip
-                        else: continue
-                    
-                    # Add probability to dict (will be nonzero)
-                    cur_prob.update({(tag, prevTag): cur_prob_val})
-                    
-            # Add dict for current word
-            prob.append(cur_prob)
-                
-        # Get <tag> and <prevTag> of highest probability for last word
-        best_tag, prevTag = max(prob[-1], key=prob[-1].get)
-        
-        # Initialize output message with last word
-        out = word + "_" + best_tag
-        
-        # Loop through previous prob and words
-        for i in reversed(range(len(words) - 1)):
-            
-            # Get word
-            word = words[i]
-            
-            # Get prob dict for word (i+1 to avoid <s>)
-            word_prob = prob[i + 1]
-            
-            # Get list of keys corresponding to next best tag
-            word_prob_list = [(t, pt) for t, pt in word_prob if t==prevTag]
-            
-            # Get <tag> and <prevTag> of highest probability
-            if len(word_prob_list) > 0:
-                best_tag, prevTag = max(word_prob_list, key=word_prob.get)
-            
-            # If all probabilities are zero, select most common tag -> this should never happen
-            else: best_tag, prevTag = prevTag, most_common_tag
-            
-            # Update output message
-            out = word + "_" + best_tag + " " + out
+        # Get the best tag of each word and the log probability of the best path (which includes
+        # the transition to </s>)
+        path, best_prob = hmm.decode(hmm.encode(words))
+        out = " ".join(word + "_" + hmm.tags[tag] for word, tag in zip(words, path))
         
         # Output results
         print("RESULT:\n" + out)
+        print("\n" + report(best_prob, len(words) + 1))
         
     ###########################################################################
     # If no test file is provided, display bigram counts and probabilities
     else:
+        
+        # With no smoothing, determine the bigram probabilities (only needed for display, since
+        # the taggers compile the counts into an HMM)
+        bigramProb = dict()         # key = (<word|tag>, <previousTag>, <W|T>)
+        for (token, tag, WT) in bigramCount:
+            bCount = bigramCount[(token, tag, WT)]
+            uCount = unigramTagCount[tag]
+            bigramProb.update({(token, tag, WT): bCount/uCount})
+
+        # Add blank entry with probability 0 for unknown/unseen instances
+        bigramProb.update({(None, None, None): 0})
+        
         print("\n\nBIGRAM COUNTS//////////////////////////////////////////////////")
         for (token, prevToken, WT) in bigramCount:
             if prevToken == START_OF_SENTENCE: print("C(" + str(token) + " | <s>) = " + str(bigramCount[(token, prevToken, WT)]))
@@ -238,4 +457,4 @@ if __name__ == "__main__":
             if prevToken == START_OF_SENTENCE: print("P(" + str(token) + " | <s>) = " + str(bigramProb[(token, prevToken, WT)]))
             elif token == END_OF_SENTENCE: print("P(</s> | " + str(prevToken) + ") = " + str(bigramProb[(token, prevToken, WT)]))
             elif token == None: print("For all unseen bigrams: Probability = " + str(bigramProb[(token, prevToken, WT)]))
-            else: print("P(" + str(token) + " | " + str(prevToken) + ") = " + str(bigramProb[(token, prevToken, WT)]))
\ No newline at end of file
+            else: print("P(" + str(token) + " | " + str(prevToken) + ") = " + str(bigramProb[(token, prevToken, WT)]))
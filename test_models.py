@@ -0,0 +1,181 @@
+"""
+test_models.py
+    Description:
+        Checks the properties the models promise that are easy to break without noticing: counting
+        the training set with several processes gives the same tables as counting it serially, and
+        folding new sentences into a model with update() gives the same model as retraining it on
+        the training set followed by the new sentences. Pruned models must stay normalized.
+
+        The tests run on small synthetic word_TAG corpora (see benchmark.zipf_corpus).
+
+    Instructions:
+        Run the tests with:
+            python -m pytest -q
+
+    Imports:
+        numpy       - Used for comparing the arrays of the models
+        pytest      - Used for the fixtures and parametrized tests
+        benchmark   - Used for generating the synthetic corpora
+        counts      - Used for counting the corpora
+        corpus      - Used for reading the new sentences
+        bigram      - Used for the bigram and n-gram models
+        tagging     - Used for building and updating the tagging HMM
+"""
+import numpy as np
+import pytest
+
+from benchmark import zipf_corpus
+from counts import count_corpus
+from corpus import read_sentences
+from bigram import BigramModel, NgramModel, load_model
+from tagging import build_hmm, count_tags, update_hmm
+
+# Size of the synthetic corpora (small, so every test runs in about a second)
+SENTENCES = 1500
+VOCAB = 2000
+TAGS = 12
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    """Path of a synthetic training corpus."""
+    path = tmp_path_factory.mktemp("corpus") / "train.txt"
+    zipf_corpus(str(path), SENTENCES, vocab=VOCAB, tags=TAGS, length=12)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def update_corpora(tmp_path_factory, corpus):
+    """Paths of new sentences (from the same model, so with a few new words) and of the training corpus followed by them."""
+    directory = tmp_path_factory.mktemp("update")
+    new, both = directory / "new.txt", directory / "both.txt"
+    zipf_corpus(str(new), SENTENCES // 4, vocab=VOCAB, tags=TAGS, length=12, sample=1)
+    both.write_text(open(corpus).read() + new.read_text())
+    return str(new), str(both)
+
+
+def assert_same_state(a, b):
+    """Assert that the parameters (state() dicts) of two smoothing models are identical."""
+    a, b = a.state(), b.state()
+    assert sorted(a) == sorted(b)
+    for name in a:
+        if isinstance(a[name], np.ndarray):
+            np.testing.assert_array_equal(a[name], b[name], err_msg=name)
+        else:
+            assert a[name] == b[name], name
+
+
+def assert_same_counts(a, b):
+    """Assert that two BigramCounts or NgramCounts tables are identical (word IDs included)."""
+    assert a.vocab.words == b.vocab.words
+    if hasattr(a, "order"):
+        assert a.order == b.order
+        for name in ("counts", "words", "offsets"):
+            for x, y in zip(getattr(a, name), getattr(b, name)):
+                if x is None:
+                    assert y is None
+                else:
+                    np.testing.assert_array_equal(x, y)
+    else:
+        for name in ("unigram", "indptr", "indices", "counts"):
+            np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+
+@pytest.mark.parametrize("order", [None, 3])
+def test_parallel_counts_equal_serial_counts(corpus, order):
+    serial = count_corpus(corpus, jobs=1, order=order)
+    for jobs in (2, 3):
+        assert_same_counts(count_corpus(corpus, jobs=jobs, order=order), serial)
+
+
+@pytest.mark.parametrize("smoothing_type", ["none", "add-one", "add-k", "good-turing", "simple-good-turing"])
+def test_bigram_update_equals_retraining(corpus, update_corpora, smoothing_type):
+    new, both = update_corpora
+    model = BigramModel.train(smoothing_type, corpus, k=0.5)
+    model.update(read_sentences(new, lower=True))
+    retrained = BigramModel.train(smoothing_type, both, k=0.5)
+    assert_same_counts(model.counts, retrained.counts)
+    assert_same_state(model.smoothing, retrained.smoothing)
+
+
+@pytest.mark.parametrize("smoothing_type", ["add-one", "add-k"])
+def test_bigram_update_without_new_words_equals_retraining(tmp_path, corpus, smoothing_type):
+    # Sentences of the training corpus add no word, so V and the untouched histories stay the same
+    new, both = tmp_path / "new.txt", tmp_path / "both.txt"
+    lines = open(corpus).readlines()
+    new.write_text("".join(lines[-SENTENCES // 5:]))
+    both.write_text("".join(lines) + new.read_text())
+    model = BigramModel.train(smoothing_type, corpus, k=0.5)
+    V = len(model.vocab)
+    model.update(read_sentences(str(new), lower=True))
+    retrained = BigramModel.train(smoothing_type, str(both), k=0.5)
+    assert len(model.vocab) == V
+    assert_same_counts(model.counts, retrained.counts)
+    assert_same_state(model.smoothing, retrained.smoothing)
+    np.testing.assert_array_equal(model.smoothing.seen, retrained.smoothing.seen)
+
+
+@pytest.mark.parametrize("smoothing_type", ["add-k", "kneser-ney", "jelinek-mercer"])
+def test_ngram_update_equals_retraining(corpus, update_corpora, smoothing_type):
+    new, both = update_corpora
+    model = NgramModel.train(smoothing_type, corpus, k=0.5, order=3)
+    model.update(read_sentences(new, lower=True))
+    retrained = NgramModel.train(smoothing_type, both, k=0.5, order=3)
+    assert_same_counts(model.counts, retrained.counts)
+    assert_same_state(model.smoothing, retrained.smoothing)
+
+
+def test_saving_over_a_model_keeps_mapped_copies(tmp_path, corpus, update_corpora):
+    new, _ = update_corpora
+    path = str(tmp_path / "model")
+    sentences = list(read_sentences(new, lower=True))[:20]
+    BigramModel.train("add-one", corpus).save(path)
+
+    # A model memory-mapped before the updated one is saved over it keeps scoring as before
+    mapped = load_model(path)
+    before = list(mapped.score_many(sentences))
+    updated = load_model(path, mmap=False)
+    updated.update(read_sentences(new, lower=True))
+    updated.save(path)
+    assert list(mapped.score_many(sentences)) == before
+    assert list(load_model(path).score_many(sentences)) == list(updated.score_many(sentences))
+
+
+def test_tagging_update_equals_retraining(corpus, update_corpora):
+    new, both = update_corpora
+    hmm = update_hmm(build_hmm(*count_tags(corpus)[:2]), *count_tags(new)[:2])
+    retrained = build_hmm(*count_tags(both)[:2])
+    assert list(hmm.tags) == list(retrained.tags)
+    assert list(hmm.observations) == list(retrained.observations)
+    for name in ("log_transition", "log_emission", "log_final"):
+        np.testing.assert_array_equal(getattr(hmm, name), getattr(retrained, name), err_msg=name)
+    for name, array in retrained.unknown_model.arrays().items():
+        np.testing.assert_array_equal(hmm.unknown_model.arrays()[name], array, err_msg=name)
+
+
+def history_sums(model, histories):
+    """Return the sum of P(word | history) over every word of the vocabulary for each two-word history."""
+    V = len(model.vocab)
+    sums = []
+    for h1, h2 in histories:
+        ids = np.stack((np.full(V, h1), np.full(V, h2), np.arange(V)), axis=1).ravel()
+        sums.append(model.smoothing.probs(ids, np.tile([2, 2, 3], V))[2::3].sum())
+    return np.array(sums)
+
+
+@pytest.mark.parametrize("smoothing_type", ["kneser-ney", "jelinek-mercer"])
+def test_pruned_model_is_normalized(corpus, smoothing_type):
+    model = NgramModel.train(smoothing_type, corpus, order=3)
+
+    # Pruning nothing keeps the backoff weights
+    np.testing.assert_allclose(model.prune().smoothing.backoff, model.smoothing.backoff, rtol=1e-6)
+
+    # Every history of a kept trigram (and a few random ones) still sums to 1
+    rng = np.random.default_rng(0)
+    for cutoffs, threshold in [((2,), 0.0), ((), 1e-4), ((1, 2), 1e-5)]:
+        pruned = model.prune(cutoffs, threshold)
+        assert len(pruned.counts) < len(model.counts)
+        trigrams = pruned.counts.ngrams(2)
+        histories = [tuple(trigram[:2]) for trigram in trigrams[rng.choice(len(trigrams), 20, replace=False)]]
+        histories += [tuple(pair) for pair in rng.integers(0, len(model.vocab), (5, 2))]
+        np.testing.assert_allclose(history_sums(pruned, histories), 1, atol=1e-5)
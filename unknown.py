@@ -0,0 +1,173 @@
+"""
+unknown.py
+    Description:
+        Emission model for words that were never seen in training, so that the taggers give them
+        real evidence instead of failing or leaving the tag to the transitions alone.
+
+        The model is estimated at training time from the rare words of the corpus (the words seen
+        at most RARE_COUNT times, which behave most like unseen words) and stored as lookup tables:
+            suffix trie     - one node per suffix (of up to MAX_SUFFIX lowercased characters)
+                              with P(tag | suffix), interpolated with the shorter suffixes down to
+                              the open-class tag prior at the root (the tags of the rare words)
+            shape classes   - P(shape | tag) for the capitalization/digit/hyphen class of a word
+
+        An unknown word is mapped to the class (deepest matching trie node, shape), found by
+        walking the trie from the last character, so the lookup is O(suffix length). Its log
+        emission for each tag is
+            log P(tag | suffix) - log P(tag) + log P(shape | tag)
+        which is log P(word | tag) up to a per-word constant (it does not change the best path).
+        Closed-class tags never seen with rare words get log 0 and are never candidates.
+
+    Imports:
+        numpy   - Used for the probability tables
+        scoring - Used for converting probabilities to log probabilities
+"""
+import numpy as np
+
+from scoring import log
+
+# Words seen at most this many times are used for estimating the model
+RARE_COUNT = 10
+
+# Longest suffix stored in the trie
+MAX_SUFFIX = 10
+
+# Shape class bits (a word's shape is the sum of the bits of its features)
+CAPITALIZED = 1
+ALL_CAPS = 2
+HAS_DIGIT = 4
+HAS_HYPHEN = 8
+NUM_SHAPES = 16
+
+
+def shape_of(word):
+    """Return the shape class of word (from its capitalization, digits and hyphens)."""
+    shape = 0
+    if word[:1].isupper():
+        shape |= CAPITALIZED
+    if len(word) > 1 and word.isupper():
+        shape |= ALL_CAPS
+    if any(c.isdigit() for c in word):
+        shape |= HAS_DIGIT
+    if "-" in word:
+        shape |= HAS_HYPHEN
+    return shape
+
+
+class UnknownWordModel:
+    """Suffix trie and shape class tables giving the log emissions of unknown words."""
+
+    def __init__(self, parent, char, log_suffix, log_shape):
+
+        # Trie node i > 0 is the suffix of node parent[i] preceded by the character char[i]
+        # (stored as its code point), and node 0 is the empty suffix
+        self.parent = parent
+        self.char = char
+
+        # log P(tag | suffix) - log P(tag) for each trie node and log P(shape | tag) for each shape
+        self.log_suffix = log_suffix
+        self.log_shape = log_shape
+
+        # Hash index of (node, character) -> child node, built when it is first used
+        self._children = None
+
+    @classmethod
+    def train(cls, words, weights, prior=None):
+        """Estimate the model from words and their (len(words) x N) tag counts or weights.
+
+        prior is P(tag) over all the training tokens (by default the tag distribution of words).
+        """
+        weights = np.asarray(weights, dtype=float)
+        N = weights.shape[1]
+
+        # Build the trie of suffixes (parents are always created before their children)
+        parent, char, depth = [-1], [0], [0]
+        children = dict()
+        nodes, rows = [], []
+        for row, word in enumerate(words):
+            node = 0
+            nodes.append(node)
+            rows.append(row)
+            for c in reversed(word.lower()[-MAX_SUFFIX:]):
+                child = children.get((node, c))
+                if child is None:
+                    child = len(parent)
+                    children[(node, c)] = child
+                    parent.append(node)
+                    char.append(ord(c))
+                    depth.append(depth[node] + 1)
+                node = child
+                nodes.append(node)
+                rows.append(row)
+        parent = np.array(parent, dtype=np.int64)
+
+        # Sum the weights of the words ending with each suffix and get P(tag | suffix)
+        nodeWeights = np.zeros((len(parent), N))
+        np.add.at(nodeWeights, np.array(nodes, dtype=np.int64), weights[np.array(rows, dtype=np.int64)])
+        total = nodeWeights.sum(axis=1, keepdims=True)
+        nodeProb = np.divide(nodeWeights, total, out=np.zeros_like(nodeWeights), where=total > 0)
+
+        # Interpolate each suffix with the next shorter one (one suffix length at a time), weighting
+        # the shorter suffix by the standard deviation of the open-class prior at the root
+        theta = np.std(nodeProb[0], ddof=1) if N > 1 else 0.0
+        smoothed = nodeProb.copy()
+        depth = np.array(depth)
+        for d in range(1, depth.max() + 1):
+            level = np.flatnonzero(depth == d)
+            smoothed[level] = (nodeProb[level] + theta * smoothed[parent[level]]) / (1 + theta)
+
+        # Divide by the tag prior (tags that have no probability stay at log 0)
+        if prior is None:
+            prior = nodeProb[0]
+        with np.errstate(invalid="ignore"):
+            logSuffix = np.where(smoothed > 0, log(smoothed) - log(np.asarray(prior, dtype=float)), -np.inf)
+
+        # Add-one estimate of P(shape | tag)
+        shapeWeights = np.zeros((NUM_SHAPES, N))
+        np.add.at(shapeWeights, np.array([shape_of(word) for word in words], dtype=np.int64), weights)
+        logShape = log((shapeWeights + 1) / (shapeWeights.sum(axis=0) + NUM_SHAPES))
+        return cls(parent, np.array(char, dtype=np.int32), logSuffix, logShape)
+
+    @classmethod
+    def from_emissions(cls, observations, log_emission):
+        """Estimate the model from an HMM's observations, weighting each by its P(tag | observation).
+
+        Used when there are no counts (e.g. HMMs converted from pickle files): every observation
+        counts once, spread over its tags in proportion to its emission probabilities.
+        """
+        B = np.exp(np.asarray(log_emission))
+        total = B.sum(axis=1, keepdims=True)
+        weights = np.divide(B, total, out=np.zeros_like(B), where=total > 0)
+        return cls.train(observations, weights)
+
+    def class_of(self, word):
+        """Return the class (deepest matching trie node * NUM_SHAPES + shape) of word."""
+        if self._children is None:
+            self._children = dict(zip(zip(self.parent[1:].tolist(), map(chr, self.char[1:].tolist())),
+                                      range(1, len(self.parent))))
+        get = self._children.get
+        node = 0
+        for c in reversed(word.lower()[-MAX_SUFFIX:]):
+            child = get((node, c))
+            if child is None:
+                break
+            node = child
+        return node * NUM_SHAPES + shape_of(word)
+
+    def log_emission(self, classes):
+        """Return the len(classes) x N array of log emissions of the given classes."""
+        classes = np.asarray(classes)
+        return np.asarray(self.log_suffix)[classes // NUM_SHAPES] + np.asarray(self.log_shape)[classes % NUM_SHAPES]
+
+    def arrays(self):
+        """Return the model's tables as a dict of arrays, for saving it in a model bundle."""
+        return {"unknown_parent": self.parent, "unknown_char": self.char,
+                "unknown_log_suffix": self.log_suffix, "unknown_log_shape": self.log_shape}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild the model from the arrays of a model bundle (None if the bundle has no model)."""
+        if "unknown_parent" not in arrays:
+            return None
+        return cls(arrays["unknown_parent"], arrays["unknown_char"],
+                   arrays["unknown_log_suffix"], arrays["unknown_log_shape"])
@@ -9,45 +9,175 @@ viterbi.py
             python viterbi.py <input-test-file>
             
         <input-test-file> must be a file containing the observation sequence as a single line.
+        
+        The HMM is loaded from the model bundle in the hmm directory (or the directory given with
+        --model <model-dir>). To convert the A.pkl, B.pkl, tags.pkl and observations.pkl files
+        to a model bundle, run:
+            python viterbi.py convert [<model-dir>] [--pickles <pickle-dir>]
+        
+        Words that are not observations of the HMM get their emissions from the unknown-word model
+        of the bundle (from their suffix and capitalization/digit/hyphen shape; convert estimates it
+        from the observations), no emission evidence if the bundle has no such model (only the
+        transitions decide their tag), or the emission of an observation chosen with:
+            --unknown <observation>
+        
+        To tag every line of the test file (or stdin if <input-test-file> is -) with the batched
+        decoder, add:
+            --batch
+        
+        Sentences are decoded with the sparse decoder (only visiting nonzero transitions into tags
+        that can emit the current word) when most transitions are zero. The tag dictionary decoder
+        only visits the candidate tags of each word (the tags it was seen with). To choose the
+        decoder, add:
+            --decoder <auto|dense|sparse|dictionary>
+        
+        To use beam search (keeping only the best states of each position) instead of exact
+        viterbi, add either or both of:
+            --beam <number-of-states>
+            --threshold <log-probability-below-best>
+        
+        To report how often beam search differs from exact viterbi on every line of a dev set, run:
+            python viterbi.py <dev-file> --beam <number-of-states> --compare
+        
+        To load the HMM once and serve it over HTTP (concurrent requests are tagged together in
+        micro-batches), run:
+            python viterbi.py serve [--model <model-dir>] [--port <port> | --socket <path>]
+        and POST sentences (one per line, or {"sentences": [...]} as JSON) to /tag. The --unknown,
+        --decoder, --beam and --threshold options above apply, and GET /stats returns the request
+        counters and p50/p99 latencies.
             
     Imports:
-        sys     - Used to get the arguments from command line
-        numpy   - Used for max and argmax operations as well as array formatting
-        pickle  - Used for loading pickle files
+        sys         - Used to exit with an error message
+        os          - Used for checking that the model bundle exists
+        argparse    - Used to get the arguments from command line
+        collections - Used for queueing the words of sentences being decoded in batch mode
+        numpy       - Used for converting the log probability of the result and comparing results
+        hmm         - Used for loading the HMM model bundle and the viterbi decoders
+        unknown     - Used for estimating the unknown-word model when converting the pickle files
+        corpus      - Used for streaming the test file in batch mode
+        scoring     - Used for reporting the score of the result
+        server      - Used for serving the HMM over HTTP
 """
 import sys
+import os
+import argparse
+import collections
 import numpy as np
-import pickle
+
+from hmm import HMM, HMM_BUNDLE, tag_results
+from unknown import UnknownWordModel
+from scoring import report
+from corpus import read_sentences
+from server import add_server_arguments, serve
+
+def main_convert(argv):
+    """python viterbi.py convert [<model-dir>]: convert the HMM pickle files to a model bundle."""
+    parser = argparse.ArgumentParser(prog="viterbi.py convert", description="Converts A.pkl, B.pkl, tags.pkl and observations.pkl to an HMM model bundle.")
+    parser.add_argument("model", metavar="<model-dir>", nargs="?", default=HMM_BUNDLE)
+    parser.add_argument("--pickles", metavar="<pickle-dir>", default=".", help="directory holding the pickle files")
+    args = parser.parse_args(argv)
+    hmm = HMM.from_pickles(args.pickles)
+    hmm.unknown_model = UnknownWordModel.from_emissions(hmm.observations, hmm.log_emission)
+    hmm.save(args.model)
+
+
+def main_serve(argv):
+    """python viterbi.py serve: load the HMM model bundle once and serve it over HTTP."""
+    parser = argparse.ArgumentParser(prog="viterbi.py serve", description="Serves the HMM model bundle over HTTP (POST /tag).")
+    parser.add_argument("--model", metavar="<model-dir>", default=HMM_BUNDLE, help="location of the HMM model bundle")
+    parser.add_argument("--unknown", metavar="<observation>", help="observation used for unknown words (default: no emission evidence)")
+    parser.add_argument("--decoder", choices=["auto", "dense", "sparse", "dictionary"], default="auto", help="decoder used for the transitions")
+    parser.add_argument("--beam", type=int, help="number of states kept per position (beam search)")
+    parser.add_argument("--threshold", type=float, help="prune states whose log probability is this far below the best (beam search)")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+    if not os.path.exists(os.path.join(args.model, "model.json")):
+        sys.exit("ERROR: No HMM model bundle found at " + args.model + ".\n\n\tConvert the pickle files with: \n\tpython viterbi.py convert " + args.model)
+    try:
+        hmm = HMM.load(args.model, unknown=args.unknown, sparse={"auto": None, "dense": False, "sparse": True}.get(args.decoder))
+        hmm.use_tag_dictionary = args.decoder == "dictionary"
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
+    hmm.beam, hmm.threshold = args.beam, args.threshold
+    serve({"tag": lambda sentences: tag_results(hmm, sentences)}, args)
+
 
 if __name__ == "__main__":
     
-    # Print an error for the incorrect number of arguments
-    if len(sys.argv) != 2:
-        sys.exit("ERROR: Incorrect number of arguments.\n\n\tPlease execute with: \n\tpython viterbi.py <input-test-file>")
+    # Convert the pickle files to a model bundle, or serve the HMM over HTTP
+    if sys.argv[1:2] == ["convert"]:
+        sys.exit(main_convert(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(main_serve(sys.argv[2:]))
     
     # Get arguments:
     #   test_file = location of input test file
-    test_file = sys.argv[1]
+    #   model = location of the HMM model bundle (optional)
+    #   unknown = observation used as the bucket for unknown words (optional)
+    #   batch = tag every line of the test file instead of only the first (optional)
+    #   decoder = dense or sparse transitions or the tag dictionary (optional, chosen from the density by default)
+    #   beam = number of states kept per position for beam search (optional)
+    #   threshold = log probability below the best state beyond which states are pruned (optional)
+    #   compare = report how often beam search differs from exact viterbi on the test file (optional)
+    parser = argparse.ArgumentParser(description="Predicts the most likely tag sequence of a test sentence with the Viterbi algorithm.")
+    parser.add_argument("test_file", metavar="<input-test-file>")
+    parser.add_argument("--model", metavar="<model-dir>", default=HMM_BUNDLE, help="location of the HMM model bundle")
+    parser.add_argument("--unknown", metavar="<observation>", help="observation used for unknown words (default: no emission evidence)")
+    parser.add_argument("--batch", action="store_true", help="tag every line of the test file (- for stdin)")
+    parser.add_argument("--decoder", choices=["auto", "dense", "sparse", "dictionary"], default="auto", help="decoder used for the transitions")
+    parser.add_argument("--beam", type=int, help="number of states kept per position (beam search)")
+    parser.add_argument("--threshold", type=float, help="prune states whose log probability is this far below the best (beam search)")
+    parser.add_argument("--compare", action="store_true", help="report how often beam search differs from exact viterbi on every line of the test file")
+    args = parser.parse_args()
+    test_file = args.test_file
     
     ###########################################################################
-    # Get HMM transition probabilities from pickle file
-    with open('A.pkl', 'rb') as f:
-        A = pickle.load(f)
+    # Load the HMM model bundle (the arrays are memory-mapped, nothing is unpickled)
+    if not os.path.exists(os.path.join(args.model, "model.json")):
+        sys.exit("ERROR: No HMM model bundle found at " + args.model + ".\n\n\tConvert the pickle files with: \n\tpython viterbi.py convert " + args.model)
+    try:
+        hmm = HMM.load(args.model, unknown=args.unknown, sparse={"auto": None, "dense": False, "sparse": True}.get(args.decoder))
+        hmm.use_tag_dictionary = args.decoder == "dictionary"
+    except ValueError as e:
+        sys.exit("ERROR: " + str(e))
+    tags = hmm.tags
     
     ###########################################################################
-    # Get HMM observation likelihood from pickle file
-    with open('B.pkl', 'rb') as f:
-        B = pickle.load(f)
-    
-    # Add dimension to matrix to simplify calculations
-    B = np.expand_dims(B, -1)
+    # Compare beam search with exact viterbi on every line of the test file (a dev set)
+    if args.compare:
+        sentences = [hmm.encode(sentence) for sentence in read_sentences(test_file)]
+        exact = list(hmm.decode_many(sentences))
+        hmm.beam, hmm.threshold = args.beam, args.threshold
+        approximate = list(hmm.decode_many(sentences))
+        
+        # Count the sentences/tags where the results differ and the total loss in log probability
+        sentencesDiffering = sum(not np.array_equal(e[0], a[0]) for e, a in zip(exact, approximate))
+        tagsDiffering = sum(int(np.sum(e[0] != a[0])) for e, a in zip(exact, approximate))
+        loss = sum(e[1] - a[1] for e, a in zip(exact, approximate) if e[1] > -np.inf)
+        print("Beam search differs from exact viterbi on " + str(sentencesDiffering) + " of " + str(len(sentences)) + " sentences")
+        print("Tags differing = " + str(tagsDiffering) + " of " + str(sum(len(o) for o in sentences)))
+        print("Total log probability lost = " + str(loss))
+        sys.exit()
+    
+    # Use beam search instead of exact viterbi
+    hmm.beam, hmm.threshold = args.beam, args.threshold
     
     ###########################################################################
-    # Load list of tags and observations from pickle files
-    with open('tags.pkl', 'rb') as f:
-        tags = pickle.load(f)
-    with open('observations.pkl', 'rb') as f:
-        observations = pickle.load(f)
+    # Tag every line of the test file with the batched decoder, writing one result per line:
+    #   <log probability>\t<word_tag sequence>
+    if args.batch:
+        
+        # Keep the words of the sentences waiting in the decoder (results come back in order)
+        pending = collections.deque()
+        def encoded():
+            for sentence in read_sentences(test_file):
+                pending.append(sentence)
+                yield hmm.encode(sentence)
+        
+        for path, best_score in hmm.decode_many(encoded()):
+            sentence = pending.popleft()
+            print(str(best_score) + "\t" + " ".join(w + "_" + tags[t] for w, t in zip(sentence, path)))
+        sys.exit()
     
     ###########################################################################
     # Get observation sequence from file
@@ -61,46 +191,21 @@ if __name__ == "__main__":
     # Split line by whitespace
     words = sentence.split()
     
-    # Get observation sequence as indices
-    o = [observations.index(obs) for obs in words]
-    
-    # Set N and T
-    N = len(tags)
+    # Get observation sequence as indices (hash lookups, unknown words map to the unknown-word
+    # bucket)
+    o = hmm.encode(words)
     T = len(o)
-        
-    ###########################################################################
-    # Initialization step for viterbi
-    v = np.zeros((N, T))
-    v[:, 0] = A[0] * B[:, o[0], 0]
-    
-    # Initialization step for back trace
-    bt = np.zeros((N, T), dtype=int)
-    
-    ###########################################################################
-    # Loop through observations and perform recursive steps
-    for t in range(1, T):
-        
-        # Calculate v * A * B
-        vAB = v[:, t - 1] * A[1:].T * B[:, o[t]]
-        
-        # Get max value for each column in matrix and note index of maximum
-        v[:, t] = np.max(vAB, axis=1)
-        bt[:, t] = np.argmax(vAB, axis=1)
     
     ###########################################################################
-    # Determine best score and last tag corresponding to best score
-    best_score = np.max(v[:, T - 1])
-    tag = np.argmax(v[:, T - 1])
-    
-    # Initialize output message
-    out = words[-1] + "_" + tags[tag]
+    # Run viterbi (with the sparse decoder if most transitions are zero) to get the best score and
+    # the tag sequence corresponding to it
+    path, best_score = hmm.decode(o)
     
-    # Loop through observation sequence and follow back trace
-    for t in reversed(range(1, T)):
-        tag = bt[tag, t]
-        out = words[t - 1] + "_" + tags[tag] + " " + out
+    # Build output message
+    out = " ".join(w + "_" + tags[t] for w, t in zip(words, path))
         
     # Output results
-    print("Probability = " + str(best_score))
+    print("Probability = " + str(np.exp(best_score)))
+    print(report(best_score, T))
     print("\nMost likely tag sequence:")
-    print(out)
\ No newline at end of file
+    print(out)
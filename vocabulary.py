@@ -0,0 +1,63 @@
+"""
+vocabulary.py
+    Description:
+        Interns words as dense integer IDs so that the models can store their counts in
+        contiguous arrays instead of dicts keyed by strings and tuples.
+
+        ID 0 is always the start of sentence marker <s> and ID 1 is always the end of sentence
+        marker </s>. Every other word is given the next free ID the first time it is seen.
+
+    Imports:
+        None
+"""
+
+# Reserved IDs for start of sentence and end of sentence
+START_OF_SENTENCE = 0
+END_OF_SENTENCE = 1
+
+
+class Vocabulary:
+    """Bidirectional mapping between words and dense integer IDs."""
+
+    def __init__(self):
+
+        # List of words indexed by ID and dict of word -> ID
+        self.words = ["<s>", "</s>"]
+        self.ids = dict()
+
+    @classmethod
+    def from_words(cls, words):
+        """Rebuild a vocabulary from its list of words indexed by ID (including <s> and </s>)."""
+        vocab = cls()
+        vocab.words = list(words)
+        vocab.ids = dict(zip(vocab.words[2:], range(2, len(vocab.words))))
+        return vocab
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def __getitem__(self, i):
+        return self.words[i]
+
+    def add(self, word):
+        """Return the ID of word, giving it a new ID if it has not been seen before."""
+        i = self.ids.get(word)
+        if i is None:
+            i = len(self.words)
+            self.ids[word] = i
+            self.words.append(word)
+        return i
+
+    def encode(self, words):
+        """Return the list of IDs for words, interning any new words."""
+        ids = self.ids
+        add = self.add
+        return [ids[w] if w in ids else add(w) for w in words]
+
+    def lookup(self, words, default=None):
+        """Return the list of IDs for words without interning (unknown words map to default)."""
+        get = self.ids.get
+        return [get(w, default) for w in words]